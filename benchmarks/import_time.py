@@ -0,0 +1,118 @@
+# benchmarks/import_time.py
+"""Cold-start import profile of the application.
+
+Runs ``python -X importtime -c "import <module>"`` in fresh interpreters
+(so nothing is cached in ``sys.modules``), reports the best total time
+and the packages that took the most, and checks two budgets:
+
+* ``--budget-ms`` — total import time of the module;
+* ``--forbid`` — modules that must not be imported at startup (export,
+  migration and other heavy paths load them on first use).
+
+Exits with status 1 when a budget is exceeded, so it can run in CI::
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module raskladka --top 30
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The gunicorn entry point: imports the app and runs the warm-up
+DEFAULT_MODULE = "raskladka.wsgi"
+DEFAULT_BUDGET_MS = 1000.0
+# Loaded lazily: openpyxl by Excel export, alembic by INIT_DB migrations
+DEFAULT_FORBIDDEN = ("openpyxl", "alembic", "concurrent.futures.process")
+
+
+def profile_import(module: str) -> list:
+    """[(module, self_us, cumulative_us)] of one cold import."""
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark")
+    # No writes to the working tree, no byte code from earlier runs
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: <self> | <cumulative> | <indent><name>"
+        self_part, cumulative_us, name = line.split("|")
+        self_us = int(self_part.split(":")[1])
+        rows.append((name.strip(), self_us, int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: list) -> dict:
+    """Self time per top-level package, in microseconds."""
+    totals = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(
+            os.environ.get("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)
+        ),
+    )
+    parser.add_argument(
+        "--forbid",
+        action="append",
+        help="module that must stay unimported (repeatable)",
+    )
+    args = parser.parse_args(argv)
+    forbidden = tuple(args.forbid or DEFAULT_FORBIDDEN)
+
+    runs = [profile_import(args.module) for _ in range(args.repeat)]
+    totals = [sum(self_us for _, self_us, _ in rows) for rows in runs]
+    best = runs[totals.index(min(totals))]
+    best_ms = min(totals) / 1000
+
+    print(
+        f"import {args.module}: best {best_ms:.1f} ms, "
+        f"median {sorted(totals)[len(totals) // 2] / 1000:.1f} ms "
+        f"({args.repeat} runs, {len(best)} modules)"
+    )
+    print(f"\n{'package':<32}{'self ms':>10}")
+    packages = sorted(by_package(best).items(), key=lambda item: -item[1])
+    for package, self_us in packages[: args.top]:
+        print(f"{package:<32}{self_us / 1000:>10.1f}")
+
+    failed = False
+    imported = {name for name, _, _ in best}
+    for name in forbidden:
+        if name in imported:
+            chain = [row for row in best if row[0] == name][0]
+            print(
+                f"\nFAIL: {name} is imported at startup "
+                f"({chain[2] / 1000:.1f} ms cumulative)"
+            )
+            failed = True
+    if best_ms > args.budget_ms:
+        print(f"\nFAIL: {best_ms:.1f} ms exceeds {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
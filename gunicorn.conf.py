@@ -0,0 +1,50 @@
+# gunicorn.conf.py
+"""Gunicorn hooks: fork safety and the background job worker.
+
+Gunicorn reads this file from the working directory. With ``--preload``
+the master imports and warms up the app (``raskladka.wsgi``) before
+forking; ``post_fork`` then drops the database pool state every worker
+inherited (see ``raskladka.lifecycle``).
+
+With JOBS_WORKER=process the master starts ``flask --app raskladka
+run-worker`` once it is ready and stops it on shutdown; with the default
+``thread`` mode every web worker processes jobs in a thread and nothing
+is started here.
+"""
+import os
+import subprocess
+import sys
+
+_job_worker = None
+
+
+def _jobs_in_process() -> bool:
+    return os.environ.get("JOBS_WORKER", "thread").lower() == "process"
+
+
+def post_fork(server, worker):  # noqa: ARG001
+    from raskladka import app
+    from raskladka.lifecycle import post_fork as app_post_fork
+
+    app_post_fork(app)
+
+
+def when_ready(server):
+    global _job_worker
+    if not _jobs_in_process():
+        return
+    _job_worker = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "raskladka", "run-worker"]
+    )
+    server.log.info("Started job worker (pid %s)", _job_worker.pid)
+
+
+def on_exit(server):
+    if _job_worker is None or _job_worker.poll() is not None:
+        return
+    _job_worker.terminate()
+    try:
+        _job_worker.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.log.warning("Job worker did not stop, killing it")
+        _job_worker.kill()
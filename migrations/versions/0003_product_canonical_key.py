@@ -0,0 +1,74 @@
+"""add canonical_key to product
+
+Revision ID: 0003_product_canonical_key
+Revises: 0002_add_params_locked
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_product_canonical_key'
+down_revision = '0002_add_params_locked'
+branch_labels = None
+depends_on = None
+
+# casefold() turns one character into at most three ("ß" -> "ss"), and
+# product names are at most 100 characters long
+CANONICAL_KEY_MAX_LENGTH = 300
+
+
+def canonical_product_key(name) -> str:
+    """Frozen copy of raskladka.utils.canonical_product_key.
+
+    The migration must backfill the same keys whatever the application
+    code looks like later.
+    """
+    if not isinstance(name, str):
+        return str(name)[:CANONICAL_KEY_MAX_LENGTH]
+    return " ".join(name.split()).casefold()[:CANONICAL_KEY_MAX_LENGTH]
+
+
+def upgrade() -> None:
+    op.add_column(
+        'product',
+        sa.Column('canonical_key', sa.String(length=CANONICAL_KEY_MAX_LENGTH), nullable=True),
+    )
+
+    # Backfill in Python: str.casefold() has no SQL equivalent
+    product = sa.table(
+        'product',
+        sa.column('id', sa.Integer),
+        sa.column('name', sa.String),
+        sa.column('canonical_key', sa.String),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(product.c.id, product.c.name)).fetchall()
+    if rows:
+        bind.execute(
+            product.update()
+            .where(product.c.id == sa.bindparam('product_id'))
+            .values(canonical_key=sa.bindparam('key')),
+            [
+                {'product_id': row.id, 'key': canonical_product_key(row.name)}
+                for row in rows
+            ],
+        )
+
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.alter_column(
+            'canonical_key',
+            existing_type=sa.String(length=CANONICAL_KEY_MAX_LENGTH),
+            nullable=False,
+        )
+    op.create_index(
+        'ix_product_canonical_key', 'product', ['canonical_key']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_canonical_key', table_name='product')
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('canonical_key')
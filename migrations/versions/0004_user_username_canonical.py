@@ -0,0 +1,75 @@
+"""add username_canonical to user
+
+Revision ID: 0004_user_username_canonical
+Revises: 0003_product_canonical_key
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_user_username_canonical'
+down_revision = '0003_product_canonical_key'
+branch_labels = None
+depends_on = None
+
+
+def canonical_username(username) -> str:
+    """Frozen copy of raskladka.utils.canonical_username.
+
+    The migration must backfill the same values whatever the application
+    code looks like later.
+    """
+    if not isinstance(username, str):
+        return str(username)
+    return username.strip().casefold()
+
+
+def upgrade() -> None:
+    op.add_column(
+        'user',
+        sa.Column('username_canonical', sa.String(length=80), nullable=True),
+    )
+
+    # Backfill in Python: str.casefold() has no SQL equivalent
+    user = sa.table(
+        'user',
+        sa.column('id', sa.Integer),
+        sa.column('username', sa.String),
+        sa.column('username_canonical', sa.String),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(user.c.id, user.c.username)).fetchall()
+    if rows:
+        bind.execute(
+            user.update()
+            .where(user.c.id == sa.bindparam('user_id'))
+            .values(username_canonical=sa.bindparam('canonical')),
+            [
+                {
+                    'user_id': row.id,
+                    'canonical': canonical_username(row.username),
+                }
+                for row in rows
+            ],
+        )
+
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column(
+            'username_canonical',
+            existing_type=sa.String(length=80),
+            nullable=False,
+        )
+        batch_op.create_unique_constraint(
+            'uq_user_username_canonical', ['username_canonical']
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_constraint(
+            'uq_user_username_canonical', type_='unique'
+        )
+        batch_op.drop_column('username_canonical')
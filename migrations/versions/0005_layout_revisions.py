@@ -0,0 +1,37 @@
+"""add revision to meal_plan and day
+
+Revision ID: 0005_layout_revisions
+Revises: 0004_user_username_canonical
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_layout_revisions'
+down_revision = '0004_user_username_canonical'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows start at revision 0; the application writes
+    # time-based revisions from now on.
+    for table in ('meal_plan', 'day'):
+        op.add_column(
+            table,
+            sa.Column(
+                'revision',
+                sa.BigInteger(),
+                nullable=False,
+                server_default='0',
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in ('day', 'meal_plan'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('revision')
@@ -0,0 +1,35 @@
+"""add version to meal_plan, meal and product for optimistic locking
+
+Revision ID: 0008_row_versions
+Revises: 0007_idempotency_keys
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_row_versions'
+down_revision = '0007_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('meal_plan', 'meal', 'product'):
+        op.add_column(
+            table,
+            sa.Column(
+                'version',
+                sa.Integer(),
+                nullable=False,
+                server_default='1',
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in ('product', 'meal', 'meal_plan'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
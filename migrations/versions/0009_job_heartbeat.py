@@ -0,0 +1,27 @@
+"""add heartbeat_at to job
+
+Revision ID: 0009_job_heartbeat
+Revises: 0008_row_versions
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_job_heartbeat'
+down_revision = '0008_row_versions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'job', sa.Column('heartbeat_at', sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('job') as batch_op:
+        batch_op.drop_column('heartbeat_at')
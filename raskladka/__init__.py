@@ -1,10 +1,26 @@
 # raskladka/__init__.py
-from flask import Flask, render_template
+from flask import Flask, jsonify, render_template, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 import os
 from werkzeug.middleware.proxy_fix import ProxyFix
+from raskladka.database import (
+    RoutingSession,
+    configure_replica,
+    configure_sqlite,
+    init_read_routing,
+    install_sqlite_pragmas,
+    is_sqlite_file_uri,
+)
+from raskladka.fragment_cache import init_fragment_cache
+from raskladka.assets import init_assets
+from raskladka.compression import init_compression
+from raskladka.jobs import init_jobs
+from raskladka.snapshot import init_snapshot_cache
+from raskladka.ratelimit import init_rate_limits
+from raskladka.singleflight import init_singleflight
+from raskladka.lifecycle import init_lifecycle
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "your-secret-key")
@@ -37,7 +53,77 @@ if _db_uri.startswith("postgresql"):
     engine_opts.setdefault("pool_pre_ping", True)
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_opts
 
-db = SQLAlchemy(app)
+# Optional read replica: read-only requests are served from it, and a user
+# reads from the primary for a few seconds after their own writes
+_replica_uri = os.environ.get("DATABASE_REPLICA_URI")
+app.config["DB_REPLICA_STICKY_SECONDS"] = float(
+    os.environ.get("DB_REPLICA_STICKY_SECONDS", 5 if _replica_uri else 0)
+)
+if _replica_uri:
+    configure_replica(app, _replica_uri)
+
+# SQLite concurrency mode: WAL, serialized writer, separate reader pool
+app.config["SQLITE_WAL"] = os.environ.get("SQLITE_WAL", "1").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+app.config["SQLITE_BUSY_TIMEOUT"] = float(
+    os.environ.get("SQLITE_BUSY_TIMEOUT", 15)
+)
+app.config["SQLITE_WRITE_RETRIES"] = int(
+    os.environ.get("SQLITE_WRITE_RETRIES", 3)
+)
+_sqlite_wal = app.config["SQLITE_WAL"] and is_sqlite_file_uri(_db_uri)
+if _sqlite_wal:
+    configure_sqlite(app, _db_uri)
+
+# Calculation engine: "python" walks the ORM tree, "sql" aggregates in the DB
+app.config["CALCULATION_ENGINE"] = os.environ.get(
+    "CALCULATION_ENGINE", "python"
+).lower()
+
+# Rendered day blocks cached in-process (entries), 0 disables the cache
+app.config["FRAGMENT_CACHE_SIZE"] = int(
+    os.environ.get("FRAGMENT_CACHE_SIZE", 2048)
+)
+init_fragment_cache(app)
+init_assets(app)
+
+# Columnar plan snapshots cached per (plan, revision), 0 disables the cache
+app.config["SNAPSHOT_CACHE_SIZE"] = int(
+    os.environ.get("SNAPSHOT_CACHE_SIZE", 256)
+)
+# Binary snapshot files memory-mapped by all workers, "" disables them
+app.config["SNAPSHOT_DIR"] = os.environ.get(
+    "SNAPSHOT_DIR", os.path.join(app.instance_path, "snapshots")
+)
+init_snapshot_cache(app)
+
+# Rate limits of expensive endpoints, shared by the workers of this host
+# through a SQLite file ("memory" keeps them per process)
+app.config["RATELIMIT_ENABLED"] = os.environ.get(
+    "RATELIMIT_ENABLED", "1"
+).lower() in ("1", "true", "yes")
+app.config["RATELIMIT_STORAGE"] = os.environ.get(
+    "RATELIMIT_STORAGE", os.path.join(app.instance_path, "ratelimit.sqlite3")
+)
+init_rate_limits(app)
+
+# Identical concurrent calculations/exports are computed once per process
+app.config["SINGLEFLIGHT_ENABLED"] = os.environ.get(
+    "SINGLEFLIGHT_ENABLED", "1"
+).lower() in ("1", "true", "yes")
+init_singleflight(app)
+# How long stored responses of Idempotency-Key requests are replayed
+app.config["IDEMPOTENCY_KEY_TTL_HOURS"] = float(
+    os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", 24)
+)
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+if _sqlite_wal:
+    install_sqlite_pragmas(app, db)
+init_read_routing(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "views.login"
@@ -59,6 +145,39 @@ def jinja_display_title(value):  # noqa: D401, ANN001
         return value
 
 
+# Background jobs: "thread" runs the worker inside the web process,
+# "process" expects `flask run-worker` (started by gunicorn.conf.py)
+app.config["JOBS_WORKER"] = os.environ.get("JOBS_WORKER", "thread").lower()
+app.config["JOBS_POLL_INTERVAL"] = float(
+    os.environ.get("JOBS_POLL_INTERVAL", 2)
+)
+app.config["JOBS_STALE_SECONDS"] = float(
+    os.environ.get("JOBS_STALE_SECONDS", 600)
+)
+app.config["JOBS_HEARTBEAT_SECONDS"] = float(
+    os.environ.get("JOBS_HEARTBEAT_SECONDS", 30)
+)
+app.config["JOBS_MAX_ATTEMPTS"] = int(os.environ.get("JOBS_MAX_ATTEMPTS", 2))
+app.config["JOBS_RETENTION_HOURS"] = float(
+    os.environ.get("JOBS_RETENTION_HOURS", 24)
+)
+app.config["JOBS_MAX_ACTIVE_PER_USER"] = int(
+    os.environ.get("JOBS_MAX_ACTIVE_PER_USER", 3)
+)
+init_jobs(app)
+
+# Processes computing plan sheets in parallel for /export_excel/all
+app.config["EXPORT_PROCESSES"] = int(
+    os.environ.get("EXPORT_PROCESSES", min(4, os.cpu_count() or 1))
+)
+
+# Gzip for textual responses (bytes threshold and zlib level)
+app.config["COMPRESS_MIN_SIZE"] = int(
+    os.environ.get("COMPRESS_MIN_SIZE", 500)
+)
+app.config["COMPRESS_LEVEL"] = int(os.environ.get("COMPRESS_LEVEL", 6))
+init_compression(app)
+
 # Trust proxy headers (for correct scheme/host when behind reverse proxy)
 app.wsgi_app = ProxyFix(
     app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1
@@ -101,6 +220,10 @@ def health():  # noqa: D401, ANN001
         return {"status": "degraded"}, 500
 
 
+# Readiness (/ready flips after warm_up), post-fork hooks, upgrade-db CLI
+init_lifecycle(app)
+
+
 # ----- Error handlers -----
 @app.errorhandler(400)
 def handle_400(error):  # noqa: ARG001
@@ -154,6 +277,35 @@ def handle_404(error):  # noqa: ARG001
     )
 
 
+@app.errorhandler(429)
+def handle_429(error):
+    retry_after = {"Retry-After": str(error.retry_after or 1)}
+    # API clients (fetch sends */*) get JSON, page navigation gets HTML
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "text/html"]
+    )
+    if best != "text/html":
+        return (
+            jsonify({"status": "error", "message": error.description}),
+            429,
+            retry_after,
+        )
+    return (
+        render_template(
+            "errors/error.html",
+            code=429,
+            title="Слишком много запросов",
+            headline="Слишком много запросов",
+            description=(
+                "Вы отправили слишком много запросов подряд. Подождите "
+                "немного и повторите действие."
+            ),
+        ),
+        429,
+        retry_after,
+    )
+
+
 @app.errorhandler(500)
 def handle_500(error):  # noqa: ARG001
     return (
@@ -0,0 +1,171 @@
+# raskladka/assets.py
+"""Deploy-time asset bundle: fingerprinted static files and compiled
+templates.
+
+Build once per release (the Docker image does it)::
+
+    flask --app raskladka build-assets
+
+Static files are copied to ``static/dist/`` under content-hashed names
+with ``.gz`` (and ``.br`` when the ``brotli`` package is installed)
+variants next to them, and ``manifest.json`` maps logical names to the
+hashed ones. Templates are compiled to Python modules in
+``templates_compiled/``. ``init_assets`` picks the bundle up at startup
+unless the sources changed after the build.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+import click
+from flask import request, url_for
+from jinja2 import ChoiceLoader, ModuleLoader
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+COMPILED_TEMPLATES_DIR = "templates_compiled"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Binary formats are already compressed
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html")
+
+
+def _iter_files(root: str, skip_dir: str = None):
+    """Yield (relative posix path, absolute path) in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if skip_dir and os.path.abspath(dirpath) == os.path.abspath(root):
+            dirnames[:] = [d for d in dirnames if d != skip_dir]
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(full_path, root).replace(os.sep, "/")
+            yield rel_path, full_path
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_digest(app) -> str:
+    """Digest of all templates and static sources the bundle is built from."""
+    digest = hashlib.sha256()
+    roots = (
+        (os.path.join(app.root_path, app.template_folder), None),
+        (app.static_folder, DIST_DIR),
+    )
+    for root, skip_dir in roots:
+        for rel_path, full_path in _iter_files(root, skip_dir):
+            digest.update(rel_path.encode())
+            digest.update(_file_digest(full_path).encode())
+    return digest.hexdigest()
+
+
+def _fingerprinted_name(rel_path: str, file_digest: str) -> str:
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}.{file_digest[:12]}{ext}"
+
+
+def _write_compressed(path: str) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        # mtime=0 keeps the .gz byte-identical between builds
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build_static(app) -> dict:
+    """Write fingerprinted copies of static files and the manifest."""
+    dist_root = os.path.join(app.static_folder, DIST_DIR)
+    shutil.rmtree(dist_root, ignore_errors=True)
+    files = {}
+    for rel_path, full_path in _iter_files(app.static_folder, DIST_DIR):
+        hashed = _fingerprinted_name(rel_path, _file_digest(full_path))
+        target = os.path.join(dist_root, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(full_path, target)
+        if rel_path.endswith(COMPRESSIBLE_EXTENSIONS):
+            _write_compressed(target)
+        files[rel_path] = f"{DIST_DIR}/{hashed}"
+
+    manifest = {"source_digest": source_digest(app), "files": files}
+    with open(os.path.join(dist_root, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def compile_templates(app) -> str:
+    """Compile all app templates into importable Python modules."""
+    target = os.path.join(app.root_path, COMPILED_TEMPLATES_DIR)
+    shutil.rmtree(target, ignore_errors=True)
+    # Compile from the sources even if a previous bundle is loaded
+    env = app.jinja_env.overlay(loader=app.create_global_jinja_loader())
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    return target
+
+
+def build(app) -> dict:
+    manifest = build_static(app)
+    compile_templates(app)
+    return manifest
+
+
+def _load_manifest(app) -> dict:
+    path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get("source_digest") != source_digest(app):
+        app.logger.warning(
+            "Asset bundle is out of date, run `flask build-assets`"
+        )
+        return {}
+    return manifest
+
+
+def init_assets(app) -> None:
+    """Register ``asset_url`` and use the built bundle when it is fresh.
+
+    Without a bundle (development) ``asset_url`` falls back to plain
+    ``url_for('static', ...)`` and templates load from source.
+    """
+    manifest = {} if app.debug else _load_manifest(app)
+    files = manifest.get("files", {})
+
+    @app.template_global()
+    def asset_url(filename: str) -> str:
+        return url_for("static", filename=files.get(filename, filename))
+
+    compiled = os.path.join(app.root_path, COMPILED_TEMPLATES_DIR)
+    if manifest and os.path.isdir(compiled):
+        app.jinja_env.loader = ChoiceLoader(
+            [ModuleLoader(compiled), app.jinja_env.loader]
+        )
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Build fingerprinted static files and compiled templates."""
+        result = build(app)
+        click.echo(
+            f"Built {len(result['files'])} static files and templates"
+        )
+
+    @app.after_request
+    def _cache_fingerprinted(response):
+        filename = (request.view_args or {}).get("filename", "")
+        if request.endpoint == "static" and filename.startswith(
+            DIST_DIR + "/"
+        ):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
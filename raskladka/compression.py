@@ -0,0 +1,169 @@
+# raskladka/compression.py
+import mimetypes
+import os
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, quote_etag, unquote_etag
+from werkzeug.security import safe_join
+
+# Textual types only: .xlsx and images are already compressed
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+# Precompressed static variants written by `flask build-assets`
+STATIC_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().startswith(COMPRESSIBLE_TYPES)
+
+
+def _add_vary(headers: Headers) -> None:
+    vary = headers.get("Vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else (
+            "Accept-Encoding"
+        )
+
+
+def _weaken_etag(headers: Headers) -> None:
+    # The gzip body differs byte-wise from the identity one
+    etag = headers.get("ETag")
+    if etag:
+        value, weak = unquote_etag(etag)
+        if not weak:
+            headers["ETag"] = quote_etag(value, weak=True)
+
+
+class CompressionMiddleware:
+    """Gzip textual responses for clients that accept it.
+
+    Bodies with a known Content-Length of at least ``min_size`` bytes
+    are compressed at once; bodies without Content-Length (generators)
+    are compressed chunk by chunk with a sync flush, so streaming keeps
+    working. Responses that already have a Content-Encoding, partial
+    responses and ``Cache-Control: no-transform`` pass through.
+    """
+
+    def __init__(self, app, min_size: int = 500, level: int = 6):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        accepts_gzip = parse_accept_header(
+            environ.get("HTTP_ACCEPT_ENCODING", "")
+        ).quality("gzip") > 0
+        is_head = environ.get("REQUEST_METHOD") == "HEAD"
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=Headers(headers))
+            if exc_info is not None:
+                captured["exc_info"] = exc_info
+            return self._unsupported_write
+
+        result = self.app(environ, capture)
+        status = captured["status"]
+        headers = captured["headers"]
+        exc_info = captured.get("exc_info")
+
+        length = headers.get("Content-Length", type=int)
+        eligible = (
+            _is_compressible(headers.get("Content-Type", ""))
+            and "Content-Encoding" not in headers
+            and "Content-Range" not in headers
+            and "no-transform" not in headers.get("Cache-Control", "")
+            and int(status.split(" ", 1)[0]) not in (204, 206, 304)
+            and (length is None or length >= self.min_size)
+        )
+        if eligible:
+            _add_vary(headers)
+        if not eligible or not accepts_gzip or is_head:
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return result
+
+        headers["Content-Encoding"] = "gzip"
+        _weaken_etag(headers)
+        if length is not None:
+            try:
+                body = b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            compressed = _GzipStream(self.level).compress(body)
+            headers["Content-Length"] = str(len(compressed))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [compressed]
+
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return self._stream(result)
+
+    def _stream(self, result):
+        gzip_stream = _GzipStream(self.level)
+        try:
+            for chunk in result:
+                if chunk:
+                    yield gzip_stream.flush_chunk(chunk)
+            yield gzip_stream.finish()
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    @staticmethod
+    def _unsupported_write(data):  # noqa: ARG004
+        raise RuntimeError("write() is not supported by CompressionMiddleware")
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        # wbits=31: gzip container
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush()
+
+    def flush_chunk(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def init_compression(app) -> None:
+    """Compress responses and serve precompressed static variants."""
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=int(app.config.get("COMPRESS_MIN_SIZE", 500)),
+        level=int(app.config.get("COMPRESS_LEVEL", 6)),
+    )
+
+    def static(filename):
+        """Static files, preferring a .br/.gz sibling when accepted."""
+        mimetype = mimetypes.guess_type(filename)[0]
+        if mimetype and _is_compressible(mimetype):
+            for encoding, suffix in STATIC_VARIANTS:
+                if not request.accept_encodings[encoding]:
+                    continue
+                path = safe_join(app.static_folder, filename + suffix)
+                if path is None or not os.path.isfile(path):
+                    continue
+                response = send_from_directory(
+                    app.static_folder,
+                    filename + suffix,
+                    mimetype=mimetype,
+                    download_name=os.path.basename(filename),
+                    max_age=app.get_send_file_max_age(filename),
+                )
+                response.headers["Content-Encoding"] = encoding
+                response.vary.add("Accept-Encoding")
+                return response
+        return app.send_static_file(filename)
+
+    app.view_functions["static"] = static
@@ -0,0 +1,217 @@
+# raskladka/database.py
+import functools
+import random
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from flask import (
+    g,
+    has_request_context,
+    current_app,
+    request,
+    session,
+)
+from flask_sqlalchemy.session import Session
+
+# Bind key of the engine that serves read-only requests
+READ_BIND_KEY = "reader"
+# Session key with the time of the user's last write (read-your-writes)
+_LAST_WRITE_KEY = "_db_last_write"
+
+
+def is_sqlite_file_uri(uri: str) -> bool:
+    """Return True for file-based SQLite URIs (not in-memory)."""
+    url = sa.engine.make_url(uri)
+    if not url.drivername.startswith("sqlite"):
+        return False
+    return url.database not in (None, "", ":memory:")
+
+
+def configure_sqlite(app, uri: str) -> None:
+    """Prepare engine options for the SQLite concurrency mode.
+
+    The primary engine becomes the writer: every write transaction starts
+    with ``BEGIN IMMEDIATE`` and waits up to ``SQLITE_BUSY_TIMEOUT`` seconds
+    for the lock. A second pool on the same file (``reader`` bind) is
+    opened with ``query_only`` and serves requests marked with
+    :func:`read_only`; in WAL mode those readers never wait for writers.
+    """
+    busy_timeout = float(app.config.get("SQLITE_BUSY_TIMEOUT", 15))
+
+    engine_opts = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    connect_args = dict(engine_opts.get("connect_args", {}))
+    connect_args.setdefault("timeout", busy_timeout)
+
+    # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS, pass them explicitly
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds.setdefault(
+        READ_BIND_KEY,
+        dict(engine_opts, url=uri, connect_args=dict(connect_args)),
+    )
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+    # Implicit BEGIN IMMEDIATE before the first DML on the writer pool only:
+    # plain SELECTs stay in autocommit and hold no locks between statements
+    connect_args["isolation_level"] = "IMMEDIATE"
+    engine_opts["connect_args"] = connect_args
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_opts
+
+
+def configure_replica(app, uri: str) -> None:
+    """Serve read-only requests from a replica instead of the primary."""
+    options = {"url": uri}
+    if uri.startswith("postgresql"):
+        options["connect_args"] = {"prepare_threshold": None}
+        options["pool_pre_ping"] = True
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds[READ_BIND_KEY] = options
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def init_read_routing(app) -> None:
+    """Remember the time of the user's writes for read-your-writes."""
+
+    @app.after_request
+    def _remember_last_write(response):
+        if (
+            g.get("_db_wrote")
+            and app.config.get("DB_REPLICA_STICKY_SECONDS", 0) > 0
+        ):
+            session[_LAST_WRITE_KEY] = time.time()
+        return response
+
+
+def install_sqlite_pragmas(app, db) -> None:
+    """Enable WAL on every new SQLite connection of the app's engines."""
+    busy_ms = int(float(app.config.get("SQLITE_BUSY_TIMEOUT", 15)) * 1000)
+
+    def _on_connect(readonly):
+        def _set_pragmas(dbapi_connection, connection_record):  # noqa: ARG001
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA busy_timeout={busy_ms}")
+                if readonly:
+                    cursor.execute("PRAGMA query_only=ON")
+            finally:
+                cursor.close()
+
+        return _set_pragmas
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            event.listen(
+                engine, "connect", _on_connect(key == READ_BIND_KEY)
+            )
+
+
+def _is_locked_error(exc: Exception) -> bool:
+    message = str(getattr(exc, "orig", exc)).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_locked(func):
+    """Retry a write unit of work when SQLite reports a busy database.
+
+    The session is rolled back between attempts, the delay grows
+    exponentially with random jitter. Non-SQLite errors pass through.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from raskladka import db
+
+        retries = int(current_app.config.get("SQLITE_WRITE_RETRIES", 3))
+        delay = float(current_app.config.get("SQLITE_RETRY_BACKOFF", 0.05))
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except sa.exc.OperationalError as exc:
+                if attempt >= retries or not _is_locked_error(exc):
+                    raise
+                db.session.rollback()
+                time.sleep(delay * (2 ** attempt) * (1 + random.random()))
+                attempt += 1
+
+    return wrapper
+
+
+def read_only(methods=None):
+    """Mark a view as read-only: its SELECTs go to the reader engine.
+
+    ``methods`` limits the routing to the given HTTP methods (all methods
+    if omitted). Must be placed above ``login_required`` so that loading
+    the current user already uses the reader pool.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if methods is None or request.method in methods:
+                g._db_read_only = True
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _reads_routed() -> bool:
+    if not has_request_context() or not g.get("_db_read_only"):
+        return False
+    if g.get("_db_wrote"):
+        return False
+    sticky = current_app.config.get("DB_REPLICA_STICKY_SECONDS", 0)
+    if sticky > 0:
+        last_write = session.get(_LAST_WRITE_KEY)
+        if last_write and time.time() - last_write < sticky:
+            return False
+    return True
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs of read-only requests to the reader bind.
+
+    Flushes and DML statements always use the primary engine. After a
+    write the rest of the request, and the user's requests within
+    ``DB_REPLICA_STICKY_SECONDS``, read from the primary as well.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not isinstance(clause, sa.sql.expression.UpdateBase)
+            and _reads_routed()
+        ):
+            engine = self._db.engines.get(READ_BIND_KEY)
+            if engine is not None:
+                return engine
+        return super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs
+        )
+
+
+def _mark_write() -> None:
+    if has_request_context():
+        g._db_wrote = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):  # noqa: ARG001
+    _mark_write()
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        _mark_write()
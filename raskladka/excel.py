@@ -0,0 +1,371 @@
+# raskladka/excel.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Optional
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+from raskladka.services import (
+    CalculationService,
+    MealPlanService,
+    SettingsService,
+)
+from raskladka.utils import canonical_product_key
+
+XLSX_MIMETYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)
+ALL_PLANS_FILENAME = "Все раскладки - расчет.xlsx"
+SUMMARY_SHEET_TITLE = "Закупка"
+# Ограничения Excel на имя листа
+MAX_SHEET_TITLE = 31
+SHEET_TITLE_FORBIDDEN = str.maketrans({c: "-" for c in "[]:*?/\\"})
+
+# Пул процессов расчета листов: один на процесс (после fork — новый)
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def excel_filename(plan_name: str) -> str:
+    """Имя файла выгрузки расчета для раскладки"""
+    safe_name = plan_name.replace("/", "-").replace("\\", "-")
+    return f"{safe_name} - расчет.xlsx"
+
+
+def _prepare_headers(
+    layout_days_count: int,
+    people_count: int,
+) -> list[str]:
+    headers = [
+        "Продукт",
+        f"1 прием пищи на {people_count} чел.",
+    ]
+    for i in range(layout_days_count):
+        headers.append(f"Повторы в рационе {i + 1}")
+    headers.extend(["Количество повторений", "Общий вес для покупки"])
+    return headers
+
+
+def _apply_table_styles(ws, thin_border):
+    for row in ws.iter_rows(
+        min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column
+    ):
+        for cell in row:
+            cell.border = thin_border
+            align = "left" if cell.column == 1 else "center"
+            cell.alignment = Alignment(horizontal=align, vertical="center")
+
+
+def _auto_fit_columns(ws):
+    column_widths = {}
+    for row in ws.iter_rows(
+        min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column
+    ):
+        for cell in row:
+            value = str(cell.value) if cell.value is not None else ""
+            letter = cell.column_letter
+            column_widths[letter] = max(
+                column_widths.get(letter, 0),
+                len(value) + 2,
+            )
+    for col_letter, width in column_widths.items():
+        ws.column_dimensions[col_letter].width = min(40, width)
+
+
+def _append_total_row(ws, thin_border):
+    if ws.max_row < 2:
+        return
+    start = ws.cell(row=2, column=ws.max_column).coordinate
+    end = ws.cell(row=ws.max_row, column=ws.max_column).coordinate
+    sum_cell = f"=SUM({start}:{end})"
+    ws.append(["ИТОГО"] + [""] * (ws.max_column - 2) + [sum_cell])
+    last_row = ws.max_row
+    for cell in ws[last_row]:
+        cell.border = thin_border
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+
+
+def _header_styles():
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(
+        start_color="667EEA", end_color="667EEA", fill_type="solid"
+    )
+    thin_border = Border(
+        left=Side(style="thin", color="DDDDDD"),
+        right=Side(style="thin", color="DDDDDD"),
+        top=Side(style="thin", color="DDDDDD"),
+        bottom=Side(style="thin", color="DDDDDD"),
+    )
+    return header_font, header_fill, thin_border
+
+
+def _calculation_rows(
+    results: list[dict],
+    layout_days_count: int,
+    product_meal_usage: dict,
+    trip_days: int,
+    people_count: int,
+) -> list[list]:
+    """Строки таблицы расчета (без заголовка и итога)"""
+    rows = []
+    for item in results:
+        name = item.get("name", "")
+        weight_per_meal = item.get("weight_per_meal", 0) or 0
+        weight_for_people = weight_per_meal * people_count
+
+        row = [name, round(weight_for_people, 2)]
+
+        total_occurrences = 0
+        usage_map = product_meal_usage.get(name, {})
+
+        for i in range(layout_days_count):
+            usage_count = usage_map.get(i, 0)
+            if i >= trip_days:
+                repetitions = 0
+            else:
+                repetitions = ((trip_days - 1 - i) // layout_days_count) + 1
+            total_usage = usage_count * repetitions
+            total_occurrences += total_usage
+            row.append(total_usage if total_usage > 0 else "")
+
+        total_weight = round(total_occurrences * weight_for_people, 2)
+        row.extend([total_occurrences, total_weight])
+        rows.append(row)
+    return rows
+
+
+def _write_table(ws, headers: list, rows: list[list]):
+    """Заголовок, строки, оформление и строка ИТОГО на листе"""
+    header_font, header_fill, thin_border = _header_styles()
+    ws.append(headers)
+    for cell in ws[1]:
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(
+            horizontal="center", vertical="center", wrap_text=True
+        )
+        cell.border = thin_border
+
+    for row in rows:
+        ws.append(row)
+
+    _apply_table_styles(ws, thin_border)
+    _auto_fit_columns(ws)
+    _append_total_row(ws, thin_border)
+
+
+def _save(wb) -> BytesIO:
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def build_workbook(
+    results: list[dict],
+    summary: dict,
+    meal_types_by_day: list[list[str]],
+    product_meal_usage: dict,
+    trip_days: int,
+    people_count: int,
+):
+    layout_days_count = summary["layout_days_count"]
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Расчет"
+    _write_table(
+        ws,
+        _prepare_headers(layout_days_count, people_count),
+        _calculation_rows(
+            results,
+            layout_days_count,
+            product_meal_usage,
+            trip_days,
+            people_count,
+        ),
+    )
+    return _save(wb)
+
+
+def _plan_sheet_data(snapshot, trip_days: int, people_count: int):
+    """
+    Расчет одной раскладки и строки ее листа. Выполняется в пуле
+    процессов, поэтому принимает и возвращает только простые данные.
+    """
+    calc_result = CalculationService.calculate_snapshot(
+        snapshot, trip_days, people_count
+    )
+    if not calc_result.get("success"):
+        return None
+    layout_days_count = calc_result["summary"]["layout_days_count"]
+    return {
+        "headers": _prepare_headers(layout_days_count, people_count),
+        "rows": _calculation_rows(
+            calc_result["results"],
+            layout_days_count,
+            calc_result["product_meal_usage"],
+            trip_days,
+            people_count,
+        ),
+        "totals": [
+            (item["name"], item["weight"]) for item in calc_result["results"]
+        ],
+    }
+
+
+def _sheet_title(name: str, used: set) -> str:
+    """Допустимое и уникальное в книге имя листа"""
+    base = (name.translate(SHEET_TITLE_FORBIDDEN).strip("' ") or "Лист")[
+        :MAX_SHEET_TITLE
+    ]
+    title, n = base, 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title = base[: MAX_SHEET_TITLE - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def _summary_rows(sheets: list[dict]) -> list[list]:
+    """Общий список закупки: продукты всех раскладок, объединенные по
+    каноническому ключу, с весом по каждой раскладке и итогом."""
+    products = {}
+    for index, sheet in enumerate(sheets):
+        for name, weight in sheet["totals"]:
+            entry = products.setdefault(
+                canonical_product_key(name),
+                {"name": name, "weights": [0] * len(sheets)},
+            )
+            entry["weights"][index] += weight
+    rows = []
+    for entry in products.values():
+        weights = [round(weight, 2) for weight in entry["weights"]]
+        rows.append(
+            [entry["name"]]
+            + [weight if weight else "" for weight in weights]
+            + [round(sum(weights), 2)]
+        )
+    rows.sort(key=lambda row: row[-1], reverse=True)
+    return rows
+
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    """
+    Долгоживущий пул процессов расчета. Процессы запускаются через
+    forkserver (или spawn), а не fork: веб-воркер многопоточный, и
+    дочерний процесс, созданный fork в момент, когда другой поток держит
+    блокировку, может зависнуть на ней навсегда.
+    """
+    global _pool, _pool_key
+    key = (os.getpid(), processes)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None and _pool_key[0] == key[0]:
+                _pool.shutdown(wait=False)
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context(method),
+            )
+            _pool_key = key
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Забывает сломанный пул (процесс упал), следующий вызов создаст новый"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is pool:
+            _pool = _pool_key = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def build_plans_workbook(
+    plans: list[tuple], processes: int = 1
+) -> Optional[BytesIO]:
+    """
+    Книга со сводным листом закупки и листом расчета на каждую раскладку.
+
+    plans — список (PlanSnapshot, trip_days, people_count). Расчеты
+    раскладок выполняются параллельно в общем пуле из processes
+    процессов (см. _get_pool), листы добавляются в исходном порядке.
+    Раскладки без продуктов пропускаются; если таких все, возвращает
+    None.
+    """
+    snapshots, trip_days, people_counts = zip(*plans) if plans else ((),) * 3
+    sheets = None
+    if processes > 1 and len(plans) > 1:
+        pool = _get_pool(processes)
+        try:
+            sheets = list(
+                pool.map(
+                    _plan_sheet_data, snapshots, trip_days, people_counts
+                )
+            )
+        except BrokenProcessPool:
+            _discard_pool(pool)
+    if sheets is None:
+        sheets = list(
+            map(_plan_sheet_data, snapshots, trip_days, people_counts)
+        )
+
+    named = [
+        (snapshot.name, sheet)
+        for snapshot, sheet in zip(snapshots, sheets)
+        if sheet is not None
+    ]
+    if not named:
+        return None
+
+    wb = Workbook()
+    used_titles = {SUMMARY_SHEET_TITLE.lower()}
+    plan_titles = [_sheet_title(name, used_titles) for name, _ in named]
+    summary_ws = wb.active
+    summary_ws.title = SUMMARY_SHEET_TITLE
+    _write_table(
+        summary_ws,
+        ["Продукт"]
+        + [f"{name}, г" for name, _ in named]
+        + ["Общий вес для покупки"],
+        _summary_rows([sheet for _, sheet in named]),
+    )
+    for title, (_, sheet) in zip(plan_titles, named):
+        ws = wb.create_sheet(title)
+        _write_table(ws, sheet["headers"], sheet["rows"])
+    return _save(wb)
+
+
+def build_user_plans_workbook(
+    user_id: int,
+    trip_days: Optional[int] = None,
+    people_count: Optional[int] = None,
+    processes: int = 1,
+) -> Optional[BytesIO]:
+    """
+    Экспорт всех раскладок пользователя. Без явных trip_days/people_count
+    каждая раскладка считается по своим сохраненным настройкам, а при их
+    отсутствии — на длину раскладки и одного человека.
+    """
+    saved = SettingsService.get_user_settings_by_plan(user_id)
+    plans = []
+    for snapshot in MealPlanService.get_plan_snapshots(user_id):
+        settings = saved.get(snapshot.plan_id, {})
+        plans.append(
+            (
+                snapshot,
+                trip_days
+                or settings.get("trip_days")
+                or snapshot.days_count,
+                people_count or settings.get("people_count") or 1,
+            )
+        )
+    return build_plans_workbook(plans, processes)
@@ -0,0 +1,105 @@
+# raskladka/fragment_cache.py
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key) -> bool:
+        """Membership test that does not count as a hit or a miss."""
+        with self._lock:
+            return key in self._data
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache key, ... %}...{% endcache %}`` template tag.
+
+    The rendered body is stored under the tuple of key expressions, so
+    keys must include everything the body depends on (for layout blocks:
+    user, row id and row revision). On a hit the body is not evaluated
+    at all, including the lazy relationships it would load.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = tuple(key)
+        html = cache.get(key)
+        if html is None:
+            html = str(caller())
+            cache.set(key, html)
+        return Markup(html)
+
+
+def is_cached(environment, *key) -> bool:
+    """True if ``{% cache *key %}`` would be served from the cache."""
+    cache = environment.fragment_cache
+    return cache is not None and tuple(key) in cache
+
+
+def init_fragment_cache(app) -> None:
+    """Register the ``cache`` tag; FRAGMENT_CACHE_SIZE=0 disables storing."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    size = int(app.config.get("FRAGMENT_CACHE_SIZE", 0))
+    app.jinja_env.fragment_cache = LRUCache(size) if size > 0 else None
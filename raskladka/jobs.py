@@ -0,0 +1,444 @@
+# raskladka/jobs.py
+"""Background jobs: a DB-backed queue for exports and imports.
+
+Jobs are rows of the ``job`` table. Workers claim them with a
+compare-and-set UPDATE (``queued`` -> ``running``), so each job runs once
+even with several workers. Where the worker runs is set by JOBS_WORKER:
+
+* ``process`` — ``flask --app raskladka run-worker``, started next to
+  gunicorn by ``gunicorn.conf.py``;
+* ``thread`` — a daemon thread inside the web process, started on the
+  first submission (local development, SQLite).
+
+``work_off()`` processes the queue synchronously in the calling process.
+"""
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from flask import current_app
+from sqlalchemy import delete, func, or_, select, update
+
+# kind -> handler(job) -> JobResult
+JOB_HANDLERS = {}
+
+_BULK_OPTIONS = {"synchronize_session": False}
+_wakeup = threading.Event()
+_thread = None
+_thread_pid = None
+_thread_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """Expected job failure; the message is shown to the user."""
+
+
+class JobResult(NamedTuple):
+    data: Optional[bytes] = None
+    name: Optional[str] = None
+    mimetype: Optional[str] = None
+    message: Optional[str] = None
+
+
+def job_handler(kind: str):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def submit(user_id: int, kind: str, params: dict, payload: bytes = None):
+    """Queue a job and wake the in-process worker if there is one."""
+    from raskladka import db
+    from raskladka.models import Job
+
+    job = Job(user_id=user_id, kind=kind, params=params, payload=payload)
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config.get("JOBS_WORKER") == "thread":
+        _ensure_thread(current_app._get_current_object())
+    _wakeup.set()
+    return job
+
+
+def active_count(user_id: int) -> int:
+    """Queued and running jobs of the user."""
+    from raskladka import db
+    from raskladka.models import Job
+
+    return db.session.execute(
+        select(func.count())
+        .select_from(Job)
+        .where(
+            Job.user_id == user_id,
+            or_(Job.status == "queued", Job.status == "running"),
+        )
+    ).scalar()
+
+
+def find_duplicate(user_id: int, kind: str, params: dict):
+    """Active job of the user with the same kind and params.
+
+    Queued jobs read the data when they run, so any of them will do. A
+    running job may have read older data and is reused only when the
+    params pin the data ``revision``.
+    """
+    from raskladka import db
+    from raskladka.models import Job
+
+    candidates = db.session.execute(
+        select(Job)
+        .where(
+            Job.user_id == user_id,
+            Job.kind == kind,
+            or_(Job.status == "queued", Job.status == "running"),
+        )
+        .order_by(Job.id.desc())
+    ).scalars()
+    for job in candidates:
+        if job.params != params:
+            continue
+        if job.status == "queued" or "revision" in params:
+            return job
+    return None
+
+
+def claim_next() -> Optional[int]:
+    """Move the oldest queued job to ``running``; return its id."""
+    from raskladka import db
+    from raskladka.models import Job
+
+    while True:
+        job_id = db.session.execute(
+            select(Job.id)
+            .where(Job.status == "queued")
+            .order_by(Job.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(
+                status="running",
+                started_at=now,
+                heartbeat_at=now,
+                attempts=Job.attempts + 1,
+            ),
+            execution_options=_BULK_OPTIONS,
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+        # Another worker was faster, take the next one
+
+
+def _finish(job_id: int, status: str, result: JobResult) -> None:
+    from raskladka import db
+    from raskladka.models import Job
+
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running")
+        .values(
+            status=status,
+            result=result.data,
+            result_name=result.name,
+            result_mimetype=result.mimetype,
+            message=result.message,
+            payload=None,
+            finished_at=datetime.utcnow(),
+        ),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.commit()
+
+
+def heartbeat(job_id: int) -> None:
+    """Mark a running job as alive."""
+    from raskladka import db
+    from raskladka.models import Job
+
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running")
+        .values(heartbeat_at=datetime.utcnow()),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.commit()
+
+
+def _heartbeat_loop(app, job_id: int, stop: threading.Event) -> None:
+    """Beat every JOBS_HEARTBEAT_SECONDS until the job finishes."""
+    from raskladka import db
+
+    interval = float(app.config.get("JOBS_HEARTBEAT_SECONDS", 30))
+    with app.app_context():
+        while not stop.wait(interval):
+            try:
+                heartbeat(job_id)
+            except Exception:  # noqa: BLE001
+                app.logger.exception("Не удалось отметить задачу %s", job_id)
+            finally:
+                db.session.remove()
+
+
+def run_job(job_id: int) -> None:
+    from raskladka import db
+    from raskladka.models import Job
+
+    job = db.session.get(Job, job_id)
+    handler = JOB_HANDLERS.get(job.kind)
+    # Separate thread and session: the handler may hold a long
+    # transaction or block in a single computation
+    stop = threading.Event()
+    beater = threading.Thread(
+        target=_heartbeat_loop,
+        args=(current_app._get_current_object(), job_id, stop),
+        name=f"job-{job_id}-heartbeat",
+        daemon=True,
+    )
+    beater.start()
+    try:
+        if handler is None:
+            raise JobError("Неизвестный тип задачи")
+        result = handler(job)
+    except JobError as exc:
+        db.session.rollback()
+        _finish(job_id, "failed", JobResult(message=str(exc)))
+    except Exception:  # noqa: BLE001
+        db.session.rollback()
+        current_app.logger.exception("Ошибка фоновой задачи %s", job_id)
+        _finish(
+            job_id, "failed", JobResult(message="Внутренняя ошибка сервера")
+        )
+    else:
+        _finish(job_id, "done", result)
+    finally:
+        stop.set()
+
+
+def work_off(max_jobs: int = None) -> int:
+    """Run queued jobs in this process until the queue is empty."""
+    from raskladka import db
+
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job_id = claim_next()
+        if job_id is None:
+            break
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
+        done += 1
+    return done
+
+
+def requeue_stale(stale_seconds: float, max_attempts: int) -> None:
+    """Return jobs of a crashed worker to the queue (or fail them).
+
+    A job is stale when its heartbeat is older than ``stale_seconds``, so
+    a long job of a live worker is never started a second time.
+    """
+    from raskladka import db
+    from raskladka.models import Job
+
+    stale = [
+        Job.status == "running",
+        func.coalesce(Job.heartbeat_at, Job.started_at)
+        < datetime.utcnow() - timedelta(seconds=stale_seconds),
+    ]
+    db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts < max_attempts)
+        .values(status="queued"),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(
+            status="failed",
+            message="Задача прервана",
+            finished_at=datetime.utcnow(),
+        ),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.commit()
+
+
+def purge_finished(retention_hours: float) -> None:
+    """Delete finished jobs (and their files) past the retention time."""
+    from raskladka import db
+    from raskladka.models import Job
+
+    db.session.execute(
+        delete(Job).where(
+            or_(Job.status == "done", Job.status == "failed"),
+            Job.finished_at
+            < datetime.utcnow() - timedelta(hours=retention_hours),
+        ),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.commit()
+
+
+def run_worker(app, stop: threading.Event) -> None:
+    """Worker loop: process jobs, sleep while the queue is empty."""
+    from raskladka import db
+
+    poll_interval = float(app.config.get("JOBS_POLL_INTERVAL", 2))
+    maintenance_every = 60.0
+    last_maintenance = 0.0
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_maintenance > maintenance_every:
+                    last_maintenance = time.monotonic()
+                    requeue_stale(
+                        float(app.config.get("JOBS_STALE_SECONDS", 600)),
+                        int(app.config.get("JOBS_MAX_ATTEMPTS", 2)),
+                    )
+                    purge_finished(
+                        float(app.config.get("JOBS_RETENTION_HOURS", 24))
+                    )
+                processed = work_off()
+            except Exception:  # noqa: BLE001
+                app.logger.exception("Ошибка в цикле обработки задач")
+                processed = 0
+            finally:
+                db.session.remove()
+            if not processed:
+                _wakeup.wait(poll_interval)
+                _wakeup.clear()
+
+
+def _ensure_thread(app) -> None:
+    """Start the in-process worker thread (again after a fork)."""
+    global _thread, _thread_pid
+    with _thread_lock:
+        if (
+            _thread is not None
+            and _thread.is_alive()
+            and _thread_pid == os.getpid()
+        ):
+            return
+        _thread = threading.Thread(
+            target=run_worker,
+            args=(app, threading.Event()),
+            name="job-worker",
+            daemon=True,
+        )
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def init_jobs(app) -> None:
+    """Register the ``run-worker`` CLI command."""
+
+    @app.cli.command("run-worker")
+    def run_worker_command():
+        """Process background jobs until SIGTERM/SIGINT."""
+        stop = threading.Event()
+
+        def _stop(signum, frame):  # noqa: ARG001
+            stop.set()
+            _wakeup.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        app.logger.info("Job worker started (pid %s)", os.getpid())
+        run_worker(app, stop)
+
+
+@job_handler("export_excel")
+def _export_excel(job) -> JobResult:
+    from raskladka.excel import build_workbook, excel_filename, XLSX_MIMETYPE
+    from raskladka.services import CalculationService, MealPlanService
+
+    # params["revision"] only identifies duplicates, the current data is used
+    params = job.params
+    meal_plan = MealPlanService.get_plan_by_id(params["plan_id"], job.user_id)
+    if not meal_plan:
+        raise JobError("Раскладка не найдена или доступ запрещён")
+    trip_days, people_count = params["trip_days"], params["people_count"]
+    calc_result = CalculationService.calculate_products_from_layout(
+        meal_plan, trip_days, people_count
+    )
+    if not calc_result.get("success"):
+        raise JobError(calc_result.get("error", "Ошибка расчета"))
+    output = build_workbook(
+        calc_result["results"],
+        calc_result["summary"],
+        calc_result["meal_types_by_day"],
+        calc_result["product_meal_usage"],
+        trip_days,
+        people_count,
+    )
+    return JobResult(
+        data=output.getvalue(),
+        name=excel_filename(meal_plan.name),
+        mimetype=XLSX_MIMETYPE,
+    )
+
+
+@job_handler("export_excel_all")
+def _export_excel_all(job) -> JobResult:
+    from raskladka.excel import (
+        ALL_PLANS_FILENAME,
+        build_user_plans_workbook,
+        XLSX_MIMETYPE,
+    )
+
+    output = build_user_plans_workbook(
+        job.user_id,
+        processes=current_app.config.get("EXPORT_PROCESSES", 1),
+        **job.params,
+    )
+    if output is None:
+        raise JobError("Нет раскладок с продуктами")
+    return JobResult(
+        data=output.getvalue(),
+        name=ALL_PLANS_FILENAME,
+        mimetype=XLSX_MIMETYPE,
+    )
+
+
+@job_handler("backup_export")
+def _backup_export(job) -> JobResult:
+    from raskladka import db
+    from raskladka.models import User
+    from raskladka.services import BackupService
+
+    user = db.session.get(User, job.user_id)
+    return JobResult(
+        data=BackupService.export_user_json(job.user_id),
+        name=BackupService.backup_filename(user.username),
+        mimetype="application/json; charset=utf-8",
+    )
+
+
+@job_handler("backup_import")
+def _backup_import(job) -> JobResult:
+    import json
+
+    from raskladka.services import BackupService
+
+    try:
+        data = json.loads(job.payload.decode("utf-8"))
+    except Exception:  # noqa: BLE001
+        raise JobError("Некорректный JSON в файле")
+    success, message = BackupService.import_user_data(
+        job.user_id, data, replace=bool(job.params.get("replace", True))
+    )
+    if not success:
+        raise JobError(message)
+    return JobResult(message=message)
@@ -0,0 +1,157 @@
+# raskladka/lifecycle.py
+"""Process lifecycle: warm-up, fork safety, readiness and migrations.
+
+With ``gunicorn --preload`` the application is imported once in the
+master and the workers are forked from it::
+
+    master:  import raskladka -> warm_up(app) -> fork
+    worker:  post_fork(app) -> serve requests
+
+``warm_up`` does the expensive one-off work in the master (templates
+compiled, URL map built, mappers configured), closes the database pools
+and freezes the heap, so workers share those pages copy-on-write and
+never inherit an open connection. Export modules are not imported: they
+load on the first export. ``post_fork`` drops whatever pool state a
+worker inherited without touching the parent's sockets. ``/ready``
+answers 200 only after warm-up.
+
+The application is a module-level object, not built by a factory, so
+the order is fixed by imports: ``raskladka.wsgi`` imports the app, runs
+migrations if asked, then calls ``warm_up``; ``gunicorn.conf.py`` calls
+``post_fork``. Without ``--preload`` every worker imports
+``raskladka.wsgi`` and warms up itself. Migrations do not run in the
+serving processes at all: ``flask --app raskladka upgrade-db`` (or
+INIT_DB via ``run_migrations``) applies them in a separate process.
+"""
+import gc
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import configure_mappers
+
+EXTENSION_KEY = "lifecycle"
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class LifecycleState:
+    def __init__(self):
+        self.ready = False
+        self.warmup_seconds = None
+        self.templates = 0
+
+
+def _state(app) -> LifecycleState:
+    return app.extensions[EXTENSION_KEY]
+
+
+def _dispose_engines(app, close: bool) -> None:
+    from raskladka import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def _compile_templates(app) -> int:
+    """Load every template once; compiled code stays in the Jinja cache."""
+    count = 0
+    for name in app.jinja_loader.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+        except Exception:  # noqa: BLE001
+            app.logger.warning(
+                "Cannot compile template %s", name, exc_info=True
+            )
+            continue
+        count += 1
+    return count
+
+
+def warm_up(app) -> None:
+    """Prepare shared state before workers fork, then mark the app ready."""
+    state = _state(app)
+    if state.ready:
+        return
+    started = time.monotonic()
+
+    state.templates = _compile_templates(app)
+    app.url_map.update()
+    configure_mappers()
+
+    # Workers must not inherit connections opened so far
+    _dispose_engines(app, close=True)
+    gc.collect()
+    # Objects created so far are never scanned by the collector again,
+    # so collections in workers do not dirty the shared pages
+    gc.freeze()
+
+    state.warmup_seconds = time.monotonic() - started
+    state.ready = True
+    app.logger.info(
+        "Warm-up done in %.2fs (%s templates)",
+        state.warmup_seconds,
+        state.templates,
+    )
+
+
+def post_fork(app) -> None:
+    """Forget pool connections inherited from the parent process.
+
+    ``close=False`` leaves the parent's sockets alone; the worker opens
+    its own connections on first use.
+    """
+    _dispose_engines(app, close=False)
+
+
+def upgrade_db(app) -> None:
+    """Apply Alembic migrations up to head."""
+    # Alembic is only needed here
+    from alembic import command
+    from alembic.config import Config
+
+    cfg = Config(str(ROOT / "alembic.ini"))
+    # Ensure script location is correct when running from packaged image
+    cfg.set_main_option("script_location", str(ROOT / "migrations"))
+    # Pass actual DB URL from Flask config
+    cfg.set_main_option(
+        "sqlalchemy.url", app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    command.upgrade(cfg, "head")
+
+
+def run_migrations() -> bool:
+    """Run ``upgrade-db`` in a child process; return True on success."""
+    result = subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "raskladka", "upgrade-db"],
+        cwd=str(ROOT),
+    )
+    return result.returncode == 0
+
+
+def init_lifecycle(app) -> None:
+    """Register ``/ready`` and the ``upgrade-db`` CLI command."""
+    from raskladka import db
+
+    app.extensions[EXTENSION_KEY] = LifecycleState()
+
+    @app.get("/ready")
+    def ready():
+        """Readiness: warm-up finished and the database answers."""
+        state = _state(app)
+        if not state.ready:
+            return {"status": "starting"}, 503
+        try:
+            db.session.execute(db.select(1))
+        except Exception:  # noqa: BLE001
+            return {"status": "unavailable"}, 503
+        return {
+            "status": "ready",
+            "warmup_seconds": round(state.warmup_seconds, 3),
+        }, 200
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """Apply database migrations (alembic upgrade head)."""
+        upgrade_db(app)
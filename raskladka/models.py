@@ -1,28 +1,68 @@
 # raskladka/models.py
 from flask_login import UserMixin
 from datetime import datetime
+import time
+from sqlalchemy.orm import deferred, validates
 from raskladka import db
+from raskladka.utils import (
+    CANONICAL_KEY_MAX_LENGTH,
+    canonical_product_key,
+    canonical_username,
+)
+
+
+def new_revision() -> int:
+    """Revision token for fragment cache keys.
+
+    Time-based rather than a per-row counter, so a row that reuses the id
+    of a deleted one (SQLite rowid reuse) never gets its old revision.
+    """
+    return time.time_ns()
 
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
+    # canonical_username(username): case-insensitive lookups via unique index
+    username_canonical = db.Column(
+        db.String(80),
+        nullable=False,
+        unique=True,
+    )
     password = db.Column(db.String(120), nullable=False)
     meal_plans = db.relationship("MealPlan", backref="user", lazy=True)
 
+    @validates("username")
+    def _set_username_canonical(self, key, username):  # noqa: ARG002
+        self.username_canonical = canonical_username(username)
+        return username
+
 
 class MealPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Changes whenever the plan or any of its days changes
+    revision = db.Column(
+        db.BigInteger,
+        nullable=False,
+        default=new_revision,
+        server_default="0",
+    )
+    # Optimistic lock of the plan row (name): every ORM UPDATE is
+    # "... WHERE version = <loaded>" and increments it
+    version = db.Column(db.Integer, nullable=False, server_default="1")
     days = db.relationship(
         "Day",
         backref="meal_plan",
         lazy=True,
         cascade="all, delete-orphan",
+        order_by="(Day.day_number, Day.id)",
     )
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Day(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,11 +70,19 @@ class Day(db.Model):
         db.Integer, db.ForeignKey("meal_plan.id"), nullable=False
     )
     day_number = db.Column(db.Integer, nullable=False)
+    # Changes whenever the day, its meals or their products change
+    revision = db.Column(
+        db.BigInteger,
+        nullable=False,
+        default=new_revision,
+        server_default="0",
+    )
     meals = db.relationship(
         "Meal",
         backref="day",
         lazy=True,
         cascade="all, delete-orphan",
+        order_by="Meal.id",
     )
 
 
@@ -42,19 +90,35 @@ class Meal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     day_id = db.Column(db.Integer, db.ForeignKey("day.id"), nullable=False)
     meal_type = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
     products = db.relationship(
         "Product",
         backref="meal",
         lazy=True,
         cascade="all, delete-orphan",
+        order_by="Product.id",
     )
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     meal_id = db.Column(db.Integer, db.ForeignKey("meal.id"), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     weight = db.Column(db.Integer, nullable=False)
+    # canonical_product_key(name), computed on write for grouping/lookups
+    canonical_key = db.Column(
+        db.String(CANONICAL_KEY_MAX_LENGTH), nullable=False, index=True
+    )
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+    @validates("name")
+    def _set_canonical_key(self, key, name):  # noqa: ARG002
+        self.canonical_key = canonical_product_key(name)
+        return name
 
 
 class UserPlanSettings(db.Model):
@@ -80,4 +144,56 @@ class UserPlanSettings(db.Model):
             "plan_id",
             name="uq_user_plan_settings",
         ),
-    )
\ No newline at end of file
+    )
+
+
+class Job(db.Model):
+    """Background job (export/import) processed by the job worker."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    kind = db.Column(db.String(30), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    # Up to MAX_CONTENT_LENGTH each: loaded only when accessed, so status
+    # polls and queue scans do not read them
+    payload = deferred(db.Column(db.LargeBinary))
+    result = deferred(db.Column(db.LargeBinary))
+    result_name = db.Column(db.String(255))
+    result_mimetype = db.Column(db.String(100))
+    message = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # Refreshed by the worker while the job runs; a running job without a
+    # recent heartbeat belongs to a crashed worker
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index("ix_job_status_id", "status", "id"),)
+
+
+class IdempotencyKey(db.Model):
+    """Response of a mutation sent with an Idempotency-Key header.
+
+    The row is inserted in the same transaction as the mutation, so a
+    retried request either finds it and gets the stored response or
+    fails on the unique constraint instead of applying the change twice.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    # Digest of the request body: a key may not be reused for another one
+    fingerprint = db.Column(db.String(40), nullable=False)
+    # NULL until the response is stored
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="uq_idempotency_key"),
+    )
@@ -0,0 +1,329 @@
+# raskladka/ratelimit.py
+"""Per-user rate limits and concurrency caps for expensive endpoints.
+
+Every limited view belongs to a class from RATE_LIMITS. A class has a
+token bucket per client (``rate`` tokens per second, up to ``burst``)
+and, for heavy classes, a cap on simultaneous requests per client
+(``concurrency``) and in total (``global_concurrency``). Over the limit
+the view is not called and the client gets 429 with Retry-After.
+
+State lives in a small SQLite file (RATELIMIT_STORAGE) shared by all
+gunicorn workers on the host; ``memory`` keeps it per process. Storage
+errors never block requests.
+"""
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+EXTENSION_KEY = "rate_limiter"
+# Slots of a crashed worker expire after this many seconds
+SLOT_TTL = 120.0
+# Retry-After when a concurrency cap is reached
+BUSY_RETRY_AFTER = 2
+# Buckets idle longer than this are deleted
+IDLE_BUCKET_SECONDS = 3600.0
+CLEANUP_EVERY = 1000
+
+
+class RateLimit(NamedTuple):
+    rate: float
+    burst: int
+    concurrency: int = 0
+    global_concurrency: int = 0
+    # "user" (falls back to IP for anonymous clients) or "ip"
+    key_by: str = "user"
+
+
+RATE_LIMITS = {
+    # Excel/JSON export and import: CPU and memory heavy
+    "heavy": RateLimit(
+        rate=0.2, burst=5, concurrency=1, global_concurrency=4
+    ),
+    # Queueing a background job (the jobs themselves are capped by
+    # JOBS_MAX_ACTIVE_PER_USER)
+    "jobs": RateLimit(rate=0.2, burst=5),
+    "calc": RateLimit(rate=5, burst=20),
+    "write": RateLimit(rate=10, burst=50),
+    # Login/registration run bcrypt and are brute-force targets
+    "auth": RateLimit(rate=0.2, burst=10, key_by="ip"),
+}
+
+
+class MemoryRateStore:
+    """Process-local store (development, tests)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def acquire(self, caps: list, now: float) -> Optional[str]:
+        with self._lock:
+            for holder, (_, expires) in list(self._slots.items()):
+                if expires <= now:
+                    del self._slots[holder]
+            for key, limit in caps:
+                held = sum(
+                    key in keys for keys, _ in self._slots.values()
+                )
+                if held >= limit:
+                    return None
+            holder = uuid.uuid4().hex
+            self._slots[holder] = ({key for key, _ in caps}, now + SLOT_TTL)
+            return holder
+
+    def release(self, holder: str) -> None:
+        with self._lock:
+            self._slots.pop(holder, None)
+
+
+class SqliteRateStore:
+    """Store in a SQLite file shared by processes on one host.
+
+    Each operation is one short ``BEGIN IMMEDIATE`` transaction on a
+    per-thread connection (reopened after fork). The data is disposable,
+    so the file runs without fsync.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS bucket ("
+        " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL"
+        ");"
+        "CREATE TABLE IF NOT EXISTS slot ("
+        " holder TEXT NOT NULL, key TEXT NOT NULL, expires REAL NOT NULL,"
+        " PRIMARY KEY (holder, key)"
+        ");"
+        "CREATE INDEX IF NOT EXISTS ix_slot_key ON slot (key);"
+    )
+
+    def __init__(self, path: str, timeout: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        self._calls += 1
+        with self._transaction() as conn:
+            if self._calls % CLEANUP_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM bucket WHERE updated < ?",
+                    (now - IDLE_BUCKET_SECONDS,),
+                )
+            row = conn.execute(
+                "SELECT tokens, updated FROM bucket WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO bucket (key, tokens, updated)"
+                " VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            return wait
+
+    def acquire(self, caps: list, now: float) -> Optional[str]:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slot WHERE expires <= ?", (now,))
+            for key, limit in caps:
+                (held,) = conn.execute(
+                    "SELECT count(*) FROM slot WHERE key = ?", (key,)
+                ).fetchone()
+                if held >= limit:
+                    return None
+            holder = uuid.uuid4().hex
+            conn.executemany(
+                "INSERT INTO slot (holder, key, expires) VALUES (?, ?, ?)",
+                [(holder, key, now + SLOT_TTL) for key, _ in caps],
+            )
+            return holder
+
+    def release(self, holder: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slot WHERE holder = ?", (holder,))
+
+
+class RateLimiter:
+    def __init__(self, store, limits: dict):
+        self.store = store
+        self.limits = limits
+
+    def check(self, limit_class: str, client: str) -> float:
+        """Spend one token; return seconds to wait (0 if allowed)."""
+        limit = self.limits[limit_class]
+        return self.store.take(
+            f"{limit_class}:{client}", limit.rate, limit.burst, time.time()
+        )
+
+    def acquire(self, limit_class: str, client: str):
+        """Take a concurrency slot; None when a cap is reached.
+
+        Returns ``True`` for classes without caps, otherwise the holder
+        id for ``release``.
+        """
+        limit = self.limits[limit_class]
+        caps = []
+        if limit.concurrency:
+            caps.append((f"{limit_class}:{client}", limit.concurrency))
+        if limit.global_concurrency:
+            caps.append((f"{limit_class}:*", limit.global_concurrency))
+        if not caps:
+            return True
+        return self.store.acquire(caps, time.time())
+
+    def release(self, holder) -> None:
+        if holder is not True:
+            self.store.release(holder)
+
+
+def _client_key(limit: RateLimit) -> str:
+    if limit.key_by == "user" and current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    return f"ip:{request.remote_addr}"
+
+
+def _too_many(retry_after: float):
+    return TooManyRequests(
+        "Слишком много запросов, повторите позже",
+        retry_after=max(1, math.ceil(retry_after)),
+    )
+
+
+def _release(limiter, holder) -> None:
+    try:
+        limiter.release(holder)
+    except sqlite3.Error:
+        # The slot expires after SLOT_TTL
+        current_app.logger.warning(
+            "Cannot release rate limit slot", exc_info=True
+        )
+
+
+@contextmanager
+def concurrency_slot(limit_class: str):
+    """Hold a concurrency slot of ``limit_class`` for the block.
+
+    Raises 429 when a cap is reached. Views limited with
+    ``rate_limited(limit_class, concurrency=False)`` use it around the
+    expensive part only, e.g. in the leader of a coalesced computation,
+    so that requests sharing its result do not need slots of their own.
+    """
+    limiter = current_app.extensions.get(EXTENSION_KEY)
+    if limiter is None:
+        yield
+        return
+    client = _client_key(limiter.limits[limit_class])
+    try:
+        holder = limiter.acquire(limit_class, client)
+    except sqlite3.Error:
+        current_app.logger.warning(
+            "Rate limit storage unavailable", exc_info=True
+        )
+        holder = True
+    if holder is None:
+        raise _too_many(BUSY_RETRY_AFTER)
+    try:
+        yield
+    finally:
+        _release(limiter, holder)
+
+
+def rate_limited(limit_class: str, methods=None, concurrency=True):
+    """Apply the ``limit_class`` limits to a view.
+
+    ``methods`` restricts the limits to the given HTTP methods. With
+    ``concurrency=False`` only the rate is checked and the view takes
+    the slot itself with ``concurrency_slot``. Place it below
+    ``login_required`` so that limits are per user.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get(EXTENSION_KEY)
+            if limiter is None or (
+                methods is not None and request.method not in methods
+            ):
+                return func(*args, **kwargs)
+
+            client = _client_key(limiter.limits[limit_class])
+            try:
+                wait = limiter.check(limit_class, client)
+            except sqlite3.Error:
+                current_app.logger.warning(
+                    "Rate limit storage unavailable", exc_info=True
+                )
+                return func(*args, **kwargs)
+            if wait:
+                raise _too_many(wait)
+            if not concurrency:
+                return func(*args, **kwargs)
+            with concurrency_slot(limit_class):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def init_rate_limits(app) -> None:
+    """Create the limiter unless RATELIMIT_ENABLED is off."""
+    if not app.config.get("RATELIMIT_ENABLED", True):
+        app.extensions[EXTENSION_KEY] = None
+        return
+    limits = dict(RATE_LIMITS)
+    limits.update(app.config.get("RATE_LIMITS", {}))
+    storage = app.config.get("RATELIMIT_STORAGE") or "memory"
+    if storage == "memory":
+        store = MemoryRateStore()
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(storage)), exist_ok=True)
+        store = SqliteRateStore(storage)
+    app.extensions[EXTENSION_KEY] = RateLimiter(store, limits)
@@ -1,85 +1,463 @@
 # raskladka/services.py
 from typing import List, Dict, Any, Optional
-from datetime import datetime
-from raskladka.models import MealPlan, Day, Meal, Product, UserPlanSettings
+from datetime import datetime, timedelta
+import json
+from flask import current_app
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from raskladka.database import retry_on_locked
+from raskladka.models import (
+    MealPlan,
+    Day,
+    Meal,
+    Product,
+    UserPlanSettings,
+    IdempotencyKey,
+    new_revision,
+)
+from raskladka.snapshot import (
+    PlanSnapshot,
+    discard_plan_snapshots,
+    loads as load_snapshot_buffer,
+    load_plan_snapshot,
+    load_user_snapshots,
+)
 from raskladka.utils import (
+    normalize_product_name,
     normalize_product_name_display,
-    canonical_product_key,
     validate_product_name,
 )
 
+# Максимум дней, создаваемых одной массовой операцией
+MAX_BULK_DAYS = 100
+
+# Массовые UPDATE не синхронизируют identity map: объекты затронутых
+# строк не загружаются, а вызывающий код сразу фиксирует транзакцию
+_BULK_OPTIONS = {"synchronize_session": False}
+# Массовые DELETE убирают удаленные объекты из сессии (id удаленных
+# строк приходят через RETURNING): SQLite повторно выдает освободившиеся
+# id, и загруженный ранее объект совпал бы с новой строкой
+_DELETE_OPTIONS = {"synchronize_session": "fetch"}
+
+
+class VersionConflict(Exception):
+    """
+    Строку изменили параллельно (другая вкладка или пользователь):
+    версия, с которой работал клиент, устарела. current — актуальное
+    состояние строки или None, если ее уже удалили.
+    """
+
+    def __init__(self, current: Optional[Dict[str, Any]]):
+        super().__init__("version conflict")
+        self.current = current
+
+
+def _check_version(row, expected: Optional[int], state) -> None:
+    """Сверяет версию загруженной строки с ожидаемой клиентом"""
+    if expected is not None and row.version != expected:
+        raise VersionConflict(state(row))
+
+
+def _commit_versioned(load_state) -> None:
+    """
+    Фиксирует транзакцию. UPDATE/DELETE версионируемых строк выполняются
+    с условием version = <прочитанная>; если строку успели изменить после
+    чтения, SQLAlchemy не находит ее и бросает StaleDataError — тогда
+    транзакция откатывается и сообщается актуальное состояние.
+    """
+    from raskladka import db
+
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        raise VersionConflict(load_state())
+
+
+def _plan_state(meal_plan: Optional[MealPlan]) -> Optional[Dict[str, Any]]:
+    if meal_plan is None:
+        return None
+    return {
+        "id": meal_plan.id,
+        "name": meal_plan.name,
+        "version": meal_plan.version,
+    }
+
+
+def _meal_state(meal: Optional[Meal]) -> Optional[Dict[str, Any]]:
+    if meal is None:
+        return None
+    return {
+        "id": meal.id,
+        "meal_type": meal.meal_type,
+        "version": meal.version,
+    }
+
+
+def _product_state(product: Optional[Product]) -> Optional[Dict[str, Any]]:
+    if product is None:
+        return None
+    return {
+        "id": product.id,
+        "name": product.name,
+        "weight": product.weight,
+        "version": product.version,
+    }
+
+
+def _touch_days(*criteria) -> None:
+    """
+    Выставляет новую ревизию дням по условию и их раскладкам.
+    Ревизии входят в ключи кэша фрагментов шаблонов, поэтому вызывается
+    при каждом изменении дня, его приемов пищи или продуктов.
+    """
+    from raskladka import db
+
+    revision = new_revision()
+    db.session.execute(
+        update(MealPlan)
+        .where(MealPlan.id.in_(select(Day.meal_plan_id).where(*criteria)))
+        .values(revision=revision),
+        execution_options=_BULK_OPTIONS,
+    )
+    db.session.execute(
+        update(Day).where(*criteria).values(revision=revision),
+        execution_options=_BULK_OPTIONS,
+    )
+
+
+def _touch_plans(*criteria) -> None:
+    """Выставляет новую ревизию раскладкам по условию"""
+    from raskladka import db
+
+    db.session.execute(
+        update(MealPlan).where(*criteria).values(revision=new_revision()),
+        execution_options=_BULK_OPTIONS,
+    )
+
+
+def _delete_meals_where(*criteria) -> int:
+    """
+    Удаляет приемы пищи по условию вместе с их продуктами.
+    Выполняет фиксированное число DELETE, не загружая строки в память.
+    Возвращает число удаленных приемов пищи.
+    """
+    from raskladka import db
+
+    meal_ids = select(Meal.id).where(*criteria)
+    db.session.execute(
+        delete(Product).where(Product.meal_id.in_(meal_ids)),
+        execution_options=_DELETE_OPTIONS,
+    )
+    result = db.session.execute(
+        delete(Meal).where(*criteria), execution_options=_DELETE_OPTIONS
+    )
+    return result.rowcount
+
+
+def _delete_days_where(*criteria) -> int:
+    """Удаляет дни по условию вместе с приемами пищи и продуктами."""
+    from raskladka import db
+
+    day_ids = select(Day.id).where(*criteria)
+    _delete_meals_where(Meal.day_id.in_(day_ids))
+    result = db.session.execute(
+        delete(Day).where(*criteria), execution_options=_DELETE_OPTIONS
+    )
+    return result.rowcount
+
+
+def _delete_plans_where(*criteria) -> int:
+    """Удаляет раскладки по условию со всем содержимым и настройками."""
+    from raskladka import db
+
+    plan_ids = select(MealPlan.id).where(*criteria)
+    _delete_days_where(Day.meal_plan_id.in_(plan_ids))
+    db.session.execute(
+        delete(UserPlanSettings).where(
+            UserPlanSettings.plan_id.in_(plan_ids)
+        ),
+        execution_options=_DELETE_OPTIONS,
+    )
+    deleted_ids = db.session.scalars(
+        delete(MealPlan).where(*criteria).returning(MealPlan.id),
+        execution_options=_DELETE_OPTIONS,
+    ).all()
+    # Файлы снимков — кэш: их можно удалить и до фиксации транзакции
+    discard_plan_snapshots(deleted_ids)
+    return len(deleted_ids)
+
+
+def _copy_meals(pairs) -> None:
+    """
+    Копирует приемы пищи с продуктами из дней-источников в дни-приемники
+    двумя INSERT ... SELECT, не загружая строки в память.
+
+    pairs — подзапрос с колонками src_day_id и dst_day_id; один
+    день-источник может копироваться в несколько дней. Дни-приемники
+    должны быть без приемов пищи. Идентификаторы назначает база:
+    приемы пищи вставляются в порядке исходных id, поэтому k-й прием
+    пищи дня-приемника — копия k-го приема пищи дня-источника, и
+    соответствие "старый прием пищи -> новый" вычисляется в SQL через
+    row_number().
+    """
+    from raskladka import db
+
+    db.session.execute(
+        insert(Meal).from_select(
+            ["day_id", "meal_type"],
+            select(pairs.c.dst_day_id, Meal.meal_type)
+            .join_from(Meal, pairs, Meal.day_id == pairs.c.src_day_id)
+            .order_by(pairs.c.dst_day_id, Meal.id),
+        )
+    )
+
+    src_meals = (
+        select(
+            Meal.id.label("old_meal_id"),
+            pairs.c.dst_day_id.label("day_id"),
+            _position(pairs.c.dst_day_id, Meal.id),
+        )
+        .join_from(Meal, pairs, Meal.day_id == pairs.c.src_day_id)
+        .subquery()
+    )
+    dst_meals = (
+        select(
+            Meal.id.label("new_meal_id"),
+            Meal.day_id,
+            _position(Meal.day_id, Meal.id),
+        )
+        .where(Meal.day_id.in_(select(pairs.c.dst_day_id)))
+        .subquery()
+    )
+    meal_map = (
+        select(src_meals.c.old_meal_id, dst_meals.c.new_meal_id)
+        .join_from(
+            src_meals,
+            dst_meals,
+            and_(
+                src_meals.c.day_id == dst_meals.c.day_id,
+                src_meals.c.position == dst_meals.c.position,
+            ),
+        )
+        .subquery()
+    )
+    db.session.execute(
+        insert(Product).from_select(
+            ["meal_id", "name", "weight", "canonical_key"],
+            select(
+                meal_map.c.new_meal_id,
+                Product.name,
+                Product.weight,
+                Product.canonical_key,
+            )
+            .join_from(
+                Product, meal_map, Product.meal_id == meal_map.c.old_meal_id
+            )
+            .order_by(meal_map.c.new_meal_id, Product.id),
+        )
+    )
+
+
+def _position(partition, order):
+    """Номер строки (с 1) внутри partition в порядке order"""
+    return (
+        func.row_number()
+        .over(partition_by=partition, order_by=order)
+        .label("position")
+    )
+
+
+def _user_plan_ids(user_id: int):
+    return select(MealPlan.id).where(MealPlan.user_id == user_id)
+
+
+def _user_day_ids(user_id: int):
+    return select(Day.id).where(Day.meal_plan_id.in_(_user_plan_ids(user_id)))
+
 
 class CalculationService:
     """Сервис для расчета продуктов на основе раскладки"""
 
     @staticmethod
-    def _build_products_map(meal_plan: MealPlan) -> Dict[str, Dict[str, Any]]:
+    def _aggregate_snapshot(snapshot: PlanSnapshot) -> tuple[
+        Dict[int, Dict[str, Any]],
+        list[list[str]],
+        Dict[str, Dict[int, int]],
+    ]:
         """
-        Собирает продукты, объединяя по каноническому ключу.
-        Возвращает словарь:
-        canonical_key -> {display_name, weight, occurrences, meal_types}
+        Один проход по массивам снимка раскладки.
+
+        Продукты объединяются по каноническому ключу (id в таблице строк
+        снимка): {display_name, weight, occurrences, meal_types}. Заодно
+        собираются типы приемов пищи по дням и карта использования
+        продуктов по дням (по отображаемым именам).
+
+        Returns:
+            (products_map, meal_types_by_day, product_meal_usage)
         """
-        products_map: Dict[str, Dict[str, Any]] = {}
+        strings = snapshot.strings
+        meal_type_ids = snapshot.meal_type
+        product_meal = snapshot.product_meal
+        product_day = snapshot.product_day
+        product_name = snapshot.product_name
+        product_weight = snapshot.product_weight
+
+        products_map: Dict[int, Dict[str, Any]] = {}
+        product_meal_usage: Dict[str, Dict[int, int]] = {}
+        for i, key in enumerate(snapshot.product_key):
+            meal_type = strings[meal_type_ids[product_meal[i]]]
+            product_data = products_map.get(key)
+            if product_data is None:
+                product_data = products_map[key] = {
+                    "display_name": normalize_product_name_display(
+                        strings[product_name[i]]
+                    ),
+                    "weight": 0,
+                    "occurrences": 0,
+                    "meal_types": [],
+                }
+            product_data["weight"] += product_weight[i]
+            product_data["occurrences"] += 1
+            if meal_type not in product_data["meal_types"]:
+                product_data["meal_types"].append(meal_type)
 
-        for day in meal_plan.days:
-            for meal in day.meals:
-                for product in meal.products:
-                    key = canonical_product_key(product.name)
-                    display_name = normalize_product_name_display(product.name)
-                    product_weight = product.weight
-
-                    if key in products_map:
-                        products_map[key]["weight"] += product_weight
-                        products_map[key]["occurrences"] += 1
-                        meal_types = products_map[key]["meal_types"]
-                        if meal.meal_type not in meal_types:
-                            meal_types.append(meal.meal_type)
-                    else:
-                        products_map[key] = {
-                            "display_name": display_name,
-                            "weight": product_weight,
-                            "occurrences": 1,
-                            "meal_types": [meal.meal_type],
-                        }
-        return products_map
-
-    @staticmethod
-    def _build_meal_usage(
-        meal_plan: MealPlan,
-        products_map: Dict[str, Dict[str, Any]],
-    ) -> tuple[list[list[str]], Dict[str, Dict[int, int]]]:
+            usage_for_day = product_meal_usage.setdefault(
+                product_data["display_name"], {}
+            )
+            day_index = product_day[i]
+            usage_for_day[day_index] = usage_for_day.get(day_index, 0) + 1
+
+        meal_types_by_day: list[list[str]] = [
+            [] for _ in range(snapshot.days_count)
+        ]
+        for meal_index, day_index in enumerate(snapshot.meal_day):
+            meal_types_by_day[day_index].append(
+                normalize_product_name_display(
+                    strings[meal_type_ids[meal_index]]
+                )
+            )
+        return products_map, meal_types_by_day, product_meal_usage
+
+    @staticmethod
+    def _aggregate_in_sql(plan_id: int) -> tuple[
+        int,
+        Dict[str, Dict[str, Any]],
+        list[list[str]],
+        Dict[str, Dict[int, int]],
+    ]:
         """
-        Собирает информацию о типах приемов пищи по дням и карту использования
-        продуктов (по отображаемым именам).
+        SQL-вариант _aggregate_snapshot.
+
+        Продукты агрегируются одним GROUP BY по (ключ, название, день,
+        прием пищи): из БД приходят только различные продукты дня, а не
+        каждая строка Product. Порядок первого появления (от него зависят
+        отображаемое имя, порядок meal_types и сортировка при равном весе)
+        берется из row_number() в порядке обхода дней, приемов и продуктов,
+        поэтому результат совпадает с Python-вариантом.
+
+        Returns:
+            (layout_days_count, products_map, meal_types_by_day,
+             product_meal_usage)
         """
-        meal_types_by_day: list[list[str]] = []
-        product_meal_usage: Dict[str, Dict[int, int]] = {}
+        from raskladka import db
 
-        for day_index, day in enumerate(meal_plan.days):
-            day_meal_types: list[str] = []
-            for meal in day.meals:
-                if meal.products:
-                    day_meal_types.append(
-                        normalize_product_name_display(meal.meal_type)
-                    )
+        day_ids = db.session.execute(
+            select(Day.id)
+            .where(Day.meal_plan_id == plan_id)
+            .order_by(Day.day_number, Day.id)
+        ).scalars().all()
+        day_index = {day_id: i for i, day_id in enumerate(day_ids)}
+
+        meal_types_by_day: list[list[str]] = [[] for _ in day_ids]
+        meals_with_products = db.session.execute(
+            select(Meal.day_id, Meal.meal_type)
+            .join(Day, Meal.day_id == Day.id)
+            .where(
+                Day.meal_plan_id == plan_id,
+                exists().where(Product.meal_id == Meal.id),
+            )
+            .order_by(Day.day_number, Day.id, Meal.id)
+        )
+        for day_id, meal_type in meals_with_products:
+            meal_types_by_day[day_index[day_id]].append(
+                normalize_product_name_display(meal_type)
+            )
 
-                for product in meal.products:
-                    key = canonical_product_key(product.name)
-                    display_name = (
-                        products_map[key]["display_name"]
-                        if key in products_map
-                        else normalize_product_name_display(product.name)
-                    )
-                    if display_name not in product_meal_usage:
-                        product_meal_usage[display_name] = {}
-                    usage_for_day = product_meal_usage[display_name]
-                    usage_for_day[day_index] = (
-                        usage_for_day.get(day_index, 0) + 1
-                    )
+        rows = (
+            select(
+                Product.canonical_key,
+                Product.name,
+                Product.weight,
+                Meal.meal_type,
+                Meal.day_id,
+                func.row_number()
+                .over(order_by=(Day.day_number, Day.id, Meal.id, Product.id))
+                .label("position"),
+            )
+            .join(Meal, Product.meal_id == Meal.id)
+            .join(Day, Meal.day_id == Day.id)
+            .where(Day.meal_plan_id == plan_id)
+            .subquery()
+        )
+        first_position = func.min(rows.c.position)
+        grouped = db.session.execute(
+            select(
+                rows.c.canonical_key,
+                rows.c.name,
+                rows.c.day_id,
+                rows.c.meal_type,
+                func.sum(rows.c.weight),
+                func.count(),
+            )
+            .group_by(
+                rows.c.canonical_key,
+                rows.c.name,
+                rows.c.day_id,
+                rows.c.meal_type,
+            )
+            .order_by(first_position)
+        )
 
-            meal_types_by_day.append(day_meal_types)
+        products_map: Dict[str, Dict[str, Any]] = {}
+        product_meal_usage: Dict[str, Dict[int, int]] = {}
+        for key, name, day_id, meal_type, weight, count in grouped:
+            product_data = products_map.get(key)
+            if product_data is None:
+                product_data = products_map[key] = {
+                    "display_name": normalize_product_name_display(name),
+                    "weight": 0,
+                    "occurrences": 0,
+                    "meal_types": [],
+                }
+            product_data["weight"] += weight
+            product_data["occurrences"] += count
+            if meal_type not in product_data["meal_types"]:
+                product_data["meal_types"].append(meal_type)
 
-        return meal_types_by_day, product_meal_usage
+            usage_for_day = product_meal_usage.setdefault(
+                product_data["display_name"], {}
+            )
+            index = day_index[day_id]
+            usage_for_day[index] = usage_for_day.get(index, 0) + count
+
+        return (
+            len(day_ids),
+            products_map,
+            meal_types_by_day,
+            product_meal_usage,
+        )
 
     @staticmethod
     def calculate_products_from_layout(
@@ -96,14 +474,66 @@ class CalculationService:
         Returns:
             Словарь с результатами расчета
         """
-        if not meal_plan.days:
+        if current_app.config.get("CALCULATION_ENGINE") != "sql":
+            return CalculationService.calculate_snapshot(
+                load_plan_snapshot(meal_plan), trip_days, people_count
+            )
+        (
+            layout_days_count,
+            products_map,
+            meal_types_by_day,
+            product_meal_usage,
+        ) = CalculationService._aggregate_in_sql(meal_plan.id)
+        if not layout_days_count:
             return {"error": "В раскладке нет дней", "success": False}
+        return CalculationService._summarize(
+            layout_days_count,
+            products_map,
+            meal_types_by_day,
+            product_meal_usage,
+            trip_days,
+            people_count,
+        )
 
-        products_map = CalculationService._build_products_map(meal_plan)
+    @staticmethod
+    def calculate_snapshot(
+        snapshot: PlanSnapshot, trip_days: int, people_count: int
+    ) -> Dict[str, Any]:
+        """
+        Расчет по снимку раскладки: PlanSnapshot или его двоичная форма
+        (bytes, mmap, memoryview — см. raskladka.snapshot). Не обращается
+        к БД и контексту приложения, поэтому может выполняться в другом
+        процессе.
+        """
+        if snapshot is not None and not isinstance(snapshot, PlanSnapshot):
+            snapshot = load_snapshot_buffer(snapshot)
+        if snapshot is None or not snapshot.days_count:
+            return {"error": "В раскладке нет дней", "success": False}
+        products_map, meal_types_by_day, product_meal_usage = (
+            CalculationService._aggregate_snapshot(snapshot)
+        )
+        return CalculationService._summarize(
+            snapshot.days_count,
+            products_map,
+            meal_types_by_day,
+            product_meal_usage,
+            trip_days,
+            people_count,
+        )
+
+    @staticmethod
+    def _summarize(
+        layout_days_count: int,
+        products_map: Dict[str, Dict[str, Any]],
+        meal_types_by_day: list[list[str]],
+        product_meal_usage: Dict[str, Dict[int, int]],
+        trip_days: int,
+        people_count: int,
+    ) -> Dict[str, Any]:
+        """Итоговые количества с учетом повторов раскладки и людей"""
         if not products_map:
             return {"error": "В раскладке нет продуктов", "success": False}
 
-        layout_days_count = len(meal_plan.days)
         layout_repetitions = (
             trip_days + layout_days_count - 1
         ) // layout_days_count
@@ -136,10 +566,6 @@ class CalculationService:
 
         results.sort(key=lambda x: x["weight"], reverse=True)
 
-        meal_types_by_day, product_meal_usage = (
-            CalculationService._build_meal_usage(meal_plan, products_map)
-        )
-
         total_weight = sum(result["weight"] for result in results)
 
         return {
@@ -158,6 +584,153 @@ class CalculationService:
             "product_meal_usage": product_meal_usage,
         }
 
+    @staticmethod
+    def calculate_combined(
+        user_id: int, entries: List[tuple[int, int, int]]
+    ) -> Dict[str, Any]:
+        """
+        Общий список закупки для нескольких раскладок.
+
+        entries — список (plan_id, trip_days, people_count); одна раскладка
+        может встречаться несколько раз с разными параметрами (группы на
+        одном маршруте). Продукты всех раскладок приходят одним запросом,
+        сгруппированным по (раскладка, канонический ключ, название), и
+        объединяются по каноническому ключу за один проход. Отображаемое
+        имя — первое по порядку раскладок, дней, приемов и продуктов.
+
+        Returns:
+            {"success", "results": [{key, name, weight, occurrences,
+             by_entry: [{plan_id, weight, occurrences}]}], "plans": [...],
+             "summary": {...}}
+        """
+        from raskladka import db
+
+        plan_ids = sorted({plan_id for plan_id, _, _ in entries})
+        plans = {
+            plan_id: (name, days_count)
+            for plan_id, name, days_count in db.session.execute(
+                select(MealPlan.id, MealPlan.name, func.count(Day.id))
+                .outerjoin(Day, Day.meal_plan_id == MealPlan.id)
+                .where(MealPlan.user_id == user_id, MealPlan.id.in_(plan_ids))
+                .group_by(MealPlan.id, MealPlan.name)
+            )
+        }
+        missing = [plan_id for plan_id in plan_ids if plan_id not in plans]
+        if missing:
+            return {
+                "error": "Раскладка не найдена или доступ запрещён",
+                "success": False,
+            }
+
+        rows = (
+            select(
+                Day.meal_plan_id.label("plan_id"),
+                Product.canonical_key,
+                Product.name,
+                Product.weight,
+                func.row_number()
+                .over(
+                    order_by=(
+                        Day.meal_plan_id,
+                        Day.day_number,
+                        Day.id,
+                        Meal.id,
+                        Product.id,
+                    )
+                )
+                .label("position"),
+            )
+            .join(Meal, Product.meal_id == Meal.id)
+            .join(Day, Meal.day_id == Day.id)
+            .where(Day.meal_plan_id.in_(plan_ids))
+            .subquery()
+        )
+        grouped = db.session.execute(
+            select(
+                rows.c.plan_id,
+                rows.c.canonical_key,
+                rows.c.name,
+                func.sum(rows.c.weight),
+                func.count(),
+            )
+            .group_by(rows.c.plan_id, rows.c.canonical_key, rows.c.name)
+            .order_by(func.min(rows.c.position))
+        )
+
+        # (plan_id, key) -> [weight, occurrences] за один проход раскладки
+        per_plan: Dict[tuple, list] = {}
+        names: Dict[str, str] = {}
+        for plan_id, key, name, weight, count in grouped:
+            totals = per_plan.setdefault((plan_id, key), [0, 0])
+            totals[0] += weight
+            totals[1] += count
+            if key not in names:
+                names[key] = normalize_product_name_display(name)
+        keys_by_plan: Dict[int, list] = {}
+        for plan_id, key in per_plan:
+            keys_by_plan.setdefault(plan_id, []).append(key)
+
+        products: Dict[str, Dict[str, Any]] = {}
+        plans_info = []
+        for index, (plan_id, trip_days, people_count) in enumerate(entries):
+            name, days_count = plans[plan_id]
+            repetitions = (
+                (trip_days + days_count - 1) // days_count if days_count else 0
+            )
+            plan_weight = 0
+            plan_keys = keys_by_plan.get(plan_id, [])
+            for key in plan_keys:
+                weight, occurrences = per_plan[(plan_id, key)]
+                weight = weight * repetitions * people_count
+                occurrences = occurrences * repetitions
+                plan_weight += weight
+                product = products.get(key)
+                if product is None:
+                    product = products[key] = {
+                        "key": key,
+                        "name": names[key],
+                        "weight": 0,
+                        "occurrences": 0,
+                        "by_entry": [],
+                        "unit": "г",
+                    }
+                product["weight"] += weight
+                product["occurrences"] += occurrences
+                product["by_entry"].append(
+                    {
+                        "entry": index,
+                        "plan_id": plan_id,
+                        "weight": weight,
+                        "occurrences": occurrences,
+                    }
+                )
+            plans_info.append(
+                {
+                    "plan_id": plan_id,
+                    "name": name,
+                    "trip_days": trip_days,
+                    "people_count": people_count,
+                    "layout_days_count": days_count,
+                    "layout_repetitions": repetitions,
+                    "total_products": len(plan_keys),
+                    "total_weight": plan_weight,
+                }
+            )
+
+        results = sorted(
+            products.values(), key=lambda x: x["weight"], reverse=True
+        )
+        return {
+            "success": True,
+            "results": results,
+            "plans": plans_info,
+            "summary": {
+                "plans_count": len(entries),
+                "total_products": len(results),
+                "total_weight": sum(item["weight"] for item in results),
+            },
+        }
+
 
 class MealPlanService:
     """Сервис для работы с планами питания"""
@@ -188,6 +761,69 @@ class MealPlanService:
         """Получает все планы пользователя"""
         return MealPlan.query.filter_by(user_id=user_id).all()
 
+    @staticmethod
+    def get_user_plan_summaries(user_id: int) -> List[Dict[str, Any]]:
+        """
+        Краткие сведения о всех раскладках пользователя одним
+        агрегирующим запросом: id, name, created_at, число дней,
+        число продуктов и суммарный вес раскладки (г на человека).
+        """
+        from raskladka import db
+
+        rows = db.session.execute(
+            select(
+                MealPlan.id,
+                MealPlan.name,
+                MealPlan.created_at,
+                func.count(func.distinct(Day.id)),
+                func.count(Product.id),
+                func.coalesce(func.sum(Product.weight), 0),
+            )
+            .outerjoin(Day, Day.meal_plan_id == MealPlan.id)
+            .outerjoin(Meal, Meal.day_id == Day.id)
+            .outerjoin(Product, Product.meal_id == Meal.id)
+            .where(MealPlan.user_id == user_id)
+            .group_by(MealPlan.id, MealPlan.name, MealPlan.created_at)
+            .order_by(MealPlan.id)
+        ).all()
+        return [
+            {
+                "id": plan_id,
+                "name": name,
+                "created_at": created_at,
+                "days_count": days_count,
+                "products_count": products_count,
+                "total_weight": int(total_weight),
+            }
+            for (
+                plan_id,
+                name,
+                created_at,
+                days_count,
+                products_count,
+                total_weight,
+            ) in rows
+        ]
+
+    @staticmethod
+    def get_plan_snapshots(user_id: int) -> List[PlanSnapshot]:
+        """Снимки всех раскладок пользователя (одним запросом)"""
+        return load_user_snapshots(user_id)
+
+    @staticmethod
+    def get_plan_revisions(user_id: int) -> List[tuple]:
+        """Пары (id, revision) всех раскладок пользователя"""
+        from raskladka import db
+
+        return [
+            tuple(row)
+            for row in db.session.execute(
+                select(MealPlan.id, MealPlan.revision)
+                .where(MealPlan.user_id == user_id)
+                .order_by(MealPlan.id)
+            )
+        ]
+
     @staticmethod
     def get_plan_by_id(plan_id: int, user_id: int) -> MealPlan:
         """Получает план по ID с проверкой принадлежности пользователю"""
@@ -200,33 +836,177 @@ class MealPlanService:
         """Удаляет план питания"""
         from raskladka import db
 
-        meal_plan = MealPlan.query.filter_by(
-            id=plan_id, user_id=user_id
-        ).first()
-        if meal_plan:
-            db.session.delete(meal_plan)
-            db.session.commit()
-            return True
-        return False
+        deleted = _delete_plans_where(
+            MealPlan.id == plan_id, MealPlan.user_id == user_id
+        )
+        db.session.commit()
+        return deleted > 0
 
     @staticmethod
-    def update_plan_name(plan_id: int, user_id: int, new_name: str) -> bool:
-        """Обновляет название плана питания"""
+    def duplicate_plan(
+        plan_id: int,
+        user_id: int,
+        name: Optional[str] = None,
+        day_from: Optional[int] = None,
+        day_to: Optional[int] = None,
+    ) -> Optional[MealPlan]:
+        """
+        Копирует раскладку (дни, приемы пищи, продукты) набором
+        INSERT ... SELECT: число запросов не зависит от размера раскладки.
+
+        Args:
+            plan_id: ID копируемой раскладки
+            user_id: ID владельца
+            name: название копии (по умолчанию "<название> (копия)")
+            day_from, day_to: необязательный диапазон номеров дней;
+                скопированные дни нумеруются с 1
+
+        Returns:
+            Новая раскладка или None, если исходная не найдена
+        """
         from raskladka import db
 
-        meal_plan = MealPlan.query.filter_by(
-            id=plan_id, user_id=user_id
-        ).first()
-        if meal_plan:
-            meal_plan.name = new_name
-            db.session.commit()
-            return True
-        return False
+        source = MealPlan.query.filter_by(id=plan_id, user_id=user_id).first()
+        if not source:
+            return None
+
+        new_plan = MealPlan(
+            user_id=user_id,
+            name=(name or f"{source.name} (копия)")[:100],
+        )
+        db.session.add(new_plan)
+        db.session.flush()
+
+        criteria = [Day.meal_plan_id == plan_id]
+        if day_from is not None:
+            criteria.append(Day.day_number >= day_from)
+        if day_to is not None:
+            criteria.append(Day.day_number <= day_to)
+        shift = (day_from - 1) if day_from is not None else 0
+
+        db.session.execute(
+            insert(Day).from_select(
+                ["meal_plan_id", "day_number", "revision"],
+                select(
+                    literal(new_plan.id),
+                    Day.day_number - shift,
+                    literal(new_revision()),
+                )
+                .where(*criteria)
+                .order_by(Day.id),
+            )
+        )
+        # Копия k-го дня источника — k-й день новой раскладки
+        src_days = select(
+            Day.id.label("src_day_id"), _position(None, Day.id)
+        ).where(*criteria).subquery()
+        dst_days = select(
+            Day.id.label("dst_day_id"), _position(None, Day.id)
+        ).where(Day.meal_plan_id == new_plan.id).subquery()
+        _copy_meals(
+            select(src_days.c.src_day_id, dst_days.c.dst_day_id)
+            .join_from(
+                src_days,
+                dst_days,
+                src_days.c.position == dst_days.c.position,
+            )
+            .subquery()
+        )
+
+        db.session.commit()
+        return new_plan
+
+    @staticmethod
+    def update_plan_name(
+        plan_id: int,
+        user_id: int,
+        new_name: str,
+        version: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Обновляет название плана питания. С version изменение применяется,
+        только если раскладку не меняли с этой версии (иначе
+        VersionConflict). Возвращает новую версию или None, если
+        раскладка не найдена.
+        """
+
+        def load():
+            return MealPlan.query.filter_by(
+                id=plan_id, user_id=user_id
+            ).first()
+
+        meal_plan = load()
+        if not meal_plan:
+            return None
+        _check_version(meal_plan, version, _plan_state)
+        meal_plan.name = new_name
+        meal_plan.revision = new_revision()
+        _commit_versioned(lambda: _plan_state(load()))
+        return meal_plan.version
 
 
 class DayService:
     """Сервис для работы с днями"""
 
+    @staticmethod
+    def get_day_summaries(plan_id: int) -> List[Dict[str, Any]]:
+        """
+        Заголовки дней раскладки с числом приемов пищи и продуктов —
+        одним агрегирующим запросом, без загрузки самих приемов пищи.
+        Порядок совпадает с MealPlan.days и get_days_page.
+        """
+        from raskladka import db
+
+        rows = db.session.execute(
+            select(
+                Day.id,
+                Day.day_number,
+                func.count(func.distinct(Meal.id)),
+                func.count(Product.id),
+            )
+            .outerjoin(Meal, Meal.day_id == Day.id)
+            .outerjoin(Product, Product.meal_id == Meal.id)
+            .where(Day.meal_plan_id == plan_id)
+            .group_by(Day.id, Day.day_number)
+            .order_by(Day.day_number, Day.id)
+        ).all()
+        return [
+            {
+                "id": day_id,
+                "day_number": day_number,
+                "meals_count": meals_count,
+                "products_count": products_count,
+            }
+            for day_id, day_number, meals_count, products_count in rows
+        ]
+
+    @staticmethod
+    def get_days_page(plan_id: int, offset: int, limit: int) -> List[Day]:
+        """
+        Страница дней раскладки — только строки дней (id, номер, ревизия):
+        этого достаточно для ключей кэша фрагментов. Содержимое дней,
+        которых нет в кэше, загружает load_day_contents.
+        """
+        return (
+            Day.query.filter_by(meal_plan_id=plan_id)
+            .order_by(Day.day_number, Day.id)
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+
+    @staticmethod
+    def load_day_contents(days: List[Day]) -> None:
+        """
+        Загружает приемы пищи и продукты уже загруженных дней двумя
+        запросами (вместо ленивой загрузки по дню и по приему пищи).
+        """
+        if not days:
+            return
+        Day.query.filter(Day.id.in_([day.id for day in days])).options(
+            selectinload(Day.meals).selectinload(Meal.products)
+        ).all()
+
     @staticmethod
     def add_day(plan_id: int, user_id: int, day_number: int) -> bool:
         """Добавляет новый день в план"""
@@ -239,26 +1019,182 @@ class DayService:
         if meal_plan:
             new_day = Day(meal_plan=meal_plan, day_number=day_number)
             db.session.add(new_day)
+            # Массовым UPDATE: ревизия меняется, версия раскладки — нет
+            _touch_plans(MealPlan.id == plan_id)
             db.session.commit()
             return True
         return False
 
+    @staticmethod
+    def duplicate_day(
+        plan_id: int,
+        user_id: int,
+        day_number: int,
+        position_from: int,
+        position_to: int,
+    ) -> tuple[bool, str]:
+        """
+        Вставляет копии дня day_number на позиции position_from..position_to.
+        Дни с номером >= position_from сдвигаются вперед одним UPDATE,
+        приемы пищи и продукты копируются через INSERT ... SELECT.
+        """
+        from raskladka import db
+
+        count = position_to - position_from + 1
+        if position_from < 1 or count < 1:
+            return False, "Некорректный диапазон позиций"
+        if count > MAX_BULK_DAYS:
+            return False, f"Можно добавить не больше {MAX_BULK_DAYS} дней"
+
+        source_day_id = db.session.execute(
+            select(Day.id)
+            .where(
+                Day.meal_plan_id.in_(_user_plan_ids(user_id)),
+                Day.meal_plan_id == plan_id,
+                Day.day_number == day_number,
+            )
+            .order_by(Day.id)
+            .limit(1)
+        ).scalar()
+        if source_day_id is None:
+            return False, "День не найден или доступ запрещён"
+
+        _touch_days(
+            Day.meal_plan_id == plan_id, Day.day_number >= position_from
+        )
+        db.session.execute(
+            update(Day)
+            .where(
+                Day.meal_plan_id == plan_id,
+                Day.day_number >= position_from,
+            )
+            .values(day_number=Day.day_number + count),
+            execution_options=_BULK_OPTIONS,
+        )
+        db.session.execute(
+            insert(Day),
+            [
+                {"meal_plan_id": plan_id, "day_number": position_from + i}
+                for i in range(count)
+            ],
+        )
+        _touch_plans(MealPlan.id == plan_id)
+        # После сдвига позиции position_from..position_to занимают
+        # только новые дни
+        _copy_meals(
+            select(
+                literal(source_day_id).label("src_day_id"),
+                Day.id.label("dst_day_id"),
+            )
+            .where(
+                Day.meal_plan_id == plan_id,
+                Day.day_number.between(position_from, position_to),
+            )
+            .subquery()
+        )
+        db.session.commit()
+        return True, ""
+
+    @staticmethod
+    def reorder_days(
+        plan_id: int, user_id: int, day_ids: list[int]
+    ) -> tuple[bool, str]:
+        """
+        Перенумеровывает дни раскладки одним UPDATE: день day_ids[i]
+        получает номер i + 1. Список должен содержать все дни раскладки.
+        """
+        from raskladka import db
+
+        plan_day_ids = set(
+            db.session.execute(
+                select(Day.id).where(
+                    Day.meal_plan_id == plan_id,
+                    Day.meal_plan_id.in_(_user_plan_ids(user_id)),
+                )
+            ).scalars()
+        )
+        if not plan_day_ids:
+            return False, "Раскладка не найдена или доступ запрещён"
+        if len(day_ids) != len(plan_day_ids) or set(day_ids) != plan_day_ids:
+            return False, "Список дней не совпадает с днями раскладки"
+
+        _touch_days(Day.meal_plan_id == plan_id)
+        db.session.execute(
+            update(Day)
+            .where(Day.meal_plan_id == plan_id)
+            .values(
+                day_number=case(
+                    {day_id: i + 1 for i, day_id in enumerate(day_ids)},
+                    value=Day.id,
+                )
+            ),
+            execution_options=_BULK_OPTIONS,
+        )
+        db.session.commit()
+        return True, ""
+
+    @staticmethod
+    def fill_empty_days(
+        plan_id: int, user_id: int, template_day_number: int
+    ) -> tuple[bool, str]:
+        """
+        Заполняет все дни раскладки без приемов пищи копией дня-шаблона
+        (один INSERT ... SELECT для приемов пищи и один для продуктов).
+        """
+        from raskladka import db
+
+        template_day_id = db.session.execute(
+            select(Day.id)
+            .where(
+                Day.meal_plan_id.in_(_user_plan_ids(user_id)),
+                Day.meal_plan_id == plan_id,
+                Day.day_number == template_day_number,
+            )
+            .order_by(Day.id)
+            .limit(1)
+        ).scalar()
+        if template_day_id is None:
+            return False, "День-шаблон не найден или доступ запрещён"
+
+        # Список пустых дней фиксируется до вставки: после копирования
+        # приемов пищи дни перестанут быть пустыми
+        empty_day_ids = db.session.execute(
+            select(Day.id)
+            .where(
+                Day.meal_plan_id == plan_id,
+                ~exists().where(Meal.day_id == Day.id),
+            )
+            .order_by(Day.id)
+        ).scalars().all()
+        if not empty_day_ids:
+            return True, ""
+        _touch_days(Day.id.in_(empty_day_ids))
+        _copy_meals(
+            select(
+                literal(template_day_id).label("src_day_id"),
+                Day.id.label("dst_day_id"),
+            )
+            .where(Day.id.in_(empty_day_ids))
+            .subquery()
+        )
+        db.session.commit()
+        return True, ""
+
     @staticmethod
     def delete_day(day_id: int, user_id: int) -> bool:
         """Удаляет день"""
         from raskladka import db
 
-        day = (
-            Day.query.join(MealPlan)
-            .filter(Day.id == day_id, MealPlan.user_id == user_id)
-            .first()
+        _touch_plans(
+            MealPlan.id.in_(select(Day.meal_plan_id).where(Day.id == day_id)),
+            MealPlan.user_id == user_id,
         )
-
-        if day:
-            db.session.delete(day)
-            db.session.commit()
-            return True
-        return False
+        deleted = _delete_days_where(
+            Day.id == day_id,
+            Day.meal_plan_id.in_(_user_plan_ids(user_id)),
+        )
+        db.session.commit()
+        return deleted > 0
 
 
 class MealService:
@@ -286,48 +1222,73 @@ class MealService:
                     meal_type=normalize_product_name_display(meal_type),
                 )
                 db.session.add(new_meal)
+                _touch_days(Day.id == day.id)
                 db.session.commit()
                 return True
         return False
 
     @staticmethod
-    def delete_meal(meal_id: int, user_id: int) -> bool:
-        """Удаляет прием пищи"""
-        from raskladka import db
-
-        meal = (
+    def _get_user_meal(meal_id: int, user_id: int) -> Optional[Meal]:
+        return (
             Meal.query.join(Day)
             .join(MealPlan)
-            .filter(
-                Meal.id == meal_id,
-                MealPlan.user_id == user_id,
-            )
+            .filter(Meal.id == meal_id, MealPlan.user_id == user_id)
             .first()
         )
 
-        if meal:
-            db.session.delete(meal)
-            db.session.commit()
-            return True
-        return False
-
     @staticmethod
-    def update_meal_type(meal_id: int, user_id: int, meal_type: str) -> bool:
-        """Обновляет тип приема пищи"""
+    def delete_meal(
+        meal_id: int, user_id: int, version: Optional[int] = None
+    ) -> bool:
+        """
+        Удаляет прием пищи. С version удаление выполняется одним
+        DELETE ... WHERE version = ?; если прием пищи успели изменить,
+        бросает VersionConflict.
+        """
         from raskladka import db
 
-        meal = (
-            Meal.query.join(Day)
-            .join(MealPlan)
-            .filter(Meal.id == meal_id, MealPlan.user_id == user_id)
-            .first()
+        criteria = [
+            Meal.id == meal_id,
+            Meal.day_id.in_(_user_day_ids(user_id)),
+        ]
+        if version is not None:
+            criteria.append(Meal.version == version)
+        _touch_days(
+            Day.id.in_(select(Meal.day_id).where(*criteria)),
         )
+        deleted = _delete_meals_where(*criteria)
+        if not deleted and version is not None:
+            current = MealService._get_user_meal(meal_id, user_id)
+            if current is not None:
+                db.session.rollback()
+                raise VersionConflict(_meal_state(current))
+        db.session.commit()
+        return deleted > 0
 
-        if meal:
-            meal.meal_type = normalize_product_name_display(meal_type)
-            db.session.commit()
-            return True
-        return False
+    @staticmethod
+    def update_meal_type(
+        meal_id: int,
+        user_id: int,
+        meal_type: str,
+        version: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Обновляет тип приема пищи (с version — только если его не меняли
+        с этой версии). Возвращает новую версию или None, если прием
+        пищи не найден.
+        """
+        meal = MealService._get_user_meal(meal_id, user_id)
+        if not meal:
+            return None
+        _check_version(meal, version, _meal_state)
+        # Ревизию дня — до изменения: autoflush массового UPDATE не
+        # должен выполнить версионированный UPDATE раньше commit
+        _touch_days(Day.id == meal.day_id)
+        meal.meal_type = normalize_product_name_display(meal_type)
+        _commit_versioned(
+            lambda: _meal_state(MealService._get_user_meal(meal_id, user_id))
+        )
+        return meal.version
 
 
 class ProductService:
@@ -344,37 +1305,38 @@ class ProductService:
         Валидирует, что продукты с одинаковым именем имеют одинаковый вес.
         Сравнение имени выполняется без учета регистра и лишних пробелов.
         """
-        normalized_display = normalize_product_name_display(name)
-        key = canonical_product_key(name)
+        normalized_display, key = normalize_product_name(name)
 
         query = (
             Product.query.join(Meal)
             .join(Day)
             .join(MealPlan)
-            .filter(MealPlan.user_id == user_id)
+            .filter(
+                MealPlan.user_id == user_id,
+                Product.canonical_key == key,
+                Product.weight != weight,
+            )
         )
         if exclude_product_id:
             query = query.filter(
                 Product.id != exclude_product_id
             )
-        existing_products = query.all()
-
-        for product in existing_products:
-            if canonical_product_key(product.name) == key:
-                if product.weight != weight:
-                    error_msg = (
-                        "Продукт '"
-                        + normalized_display
-                        + "' уже существует с весом "
-                        + str(product.weight)
-                        + "г. Для добавления продукта с другим весом "
-                        + "используйте другое название (например, '"
-                        + normalized_display
-                        + " утро' или '"
-                        + normalized_display
-                        + " вечер')."
-                    )
-                    return False, error_msg
+        conflicting = query.first()
+
+        if conflicting:
+            error_msg = (
+                "Продукт '"
+                + normalized_display
+                + "' уже существует с весом "
+                + str(conflicting.weight)
+                + "г. Для добавления продукта с другим весом "
+                + "используйте другое название (например, '"
+                + normalized_display
+                + " утро' или '"
+                + normalized_display
+                + " вечер')."
+            )
+            return False, error_msg
 
         return True, ""
 
@@ -416,29 +1378,47 @@ class ProductService:
         if meal:
             new_product = Product(meal=meal, name=display_name, weight=weight)
             db.session.add(new_product)
+            _touch_days(Day.id == meal.day_id)
             db.session.commit()
             return True, ""
         return False, "Прием пищи не найден или доступ запрещён"
 
+    @staticmethod
+    def _get_user_product(product_id: int, user_id: int) -> Optional[Product]:
+        return (
+            Product.query.join(Meal)
+            .join(Day)
+            .join(MealPlan)
+            .filter(Product.id == product_id, MealPlan.user_id == user_id)
+            .first()
+        )
+
     @staticmethod
     def update_product(
-        product_id: int, user_id: int, name: str, weight: int
-    ) -> tuple[bool, str]:
-        """Обновляет продукт"""
-        from raskladka import db
+        product_id: int,
+        user_id: int,
+        name: str,
+        weight: int,
+        version: Optional[int] = None,
+    ) -> tuple[Optional[int], str]:
+        """
+        Обновляет продукт. С version изменение применяется, только если
+        продукт не меняли с этой версии (иначе VersionConflict).
+        Возвращает (новая версия, "") или (None, текст ошибки).
+        """
 
         # Серверная валидация веса: 1..500_000 г
         if weight < 1:
-            return False, "Вес продукта должен быть не меньше 1 грамма"
+            return None, "Вес продукта должен быть не меньше 1 грамма"
         if weight > 500_000:
-            return False, (
+            return None, (
                 "Вес продукта должен быть не больше 500 000 г (500 кг)"
             )
 
         # Серверная валидация названия по регулярному выражению
         ok_name, name_error = validate_product_name(name)
         if not ok_name:
-            return False, name_error
+            return None, name_error
 
         display_name = normalize_product_name_display(name)
 
@@ -446,44 +1426,46 @@ class ProductService:
             user_id, display_name, weight, exclude_product_id=product_id
         )
         if not is_valid:
-            return False, error_message
+            return None, error_message
 
-        product = (
-            Product.query.join(Meal)
-            .join(Day)
-            .join(MealPlan)
-            .filter(Product.id == product_id, MealPlan.user_id == user_id)
-            .first()
-        )
+        def load_state():
+            return _product_state(
+                ProductService._get_user_product(product_id, user_id)
+            )
 
-        if product:
-            product.name = display_name
-            product.weight = weight
-            db.session.commit()
-            return True, ""
-        return False, "Продукт не найден или доступ запрещён"
+        product = ProductService._get_user_product(product_id, user_id)
+        if not product:
+            return None, "Продукт не найден или доступ запрещён"
+        _check_version(product, version, _product_state)
+        _touch_days(Day.id == product.meal.day_id)
+        product.name = display_name
+        product.weight = weight
+        _commit_versioned(load_state)
+        return product.version, ""
 
     @staticmethod
-    def delete_product(product_id: int, user_id: int) -> bool:
-        """Удаляет продукт"""
+    def delete_product(
+        product_id: int, user_id: int, version: Optional[int] = None
+    ) -> bool:
+        """
+        Удаляет продукт (DELETE ... WHERE version = <прочитанная>). С
+        version — только если продукт не меняли с этой версии, иначе
+        VersionConflict.
+        """
         from raskladka import db
 
-        product = (
-            Product.query.join(Meal)
-            .join(Day)
-            .join(MealPlan)
-            .filter(
-                Product.id == product_id,
-                MealPlan.user_id == user_id,
+        product = ProductService._get_user_product(product_id, user_id)
+        if not product:
+            return False
+        _check_version(product, version, _product_state)
+        _touch_days(Day.id == product.meal.day_id)
+        db.session.delete(product)
+        _commit_versioned(
+            lambda: _product_state(
+                ProductService._get_user_product(product_id, user_id)
             )
-            .first()
         )
-
-        if product:
-            db.session.delete(product)
-            db.session.commit()
-            return True
-        return False
+        return True
 
 
 class BackupService:
@@ -539,8 +1521,7 @@ class BackupService:
                 weight = 0
             if not raw_name or weight <= 0:
                 continue
-            key = canonical_product_key(str(raw_name))
-            display_name = normalize_product_name_display(str(raw_name))
+            display_name, key = normalize_product_name(str(raw_name))
             yield key, display_name, weight
 
     @staticmethod
@@ -579,20 +1560,33 @@ class BackupService:
         return conflicts
 
     @staticmethod
-    def _build_existing_weight_by_key(user_id: int) -> Dict[str, int]:
-        query = (
-            Product.query.join(Meal)
-            .join(Day)
-            .join(MealPlan)
-            .filter(MealPlan.user_id == user_id)
+    def _build_existing_weight_by_key(
+        user_id: int, keys
+    ) -> Dict[str, int]:
+        """
+        Вес первого (по id) продукта пользователя для каждого из ключей
+        keys. Группировка выполняется в SQL по индексу canonical_key.
+        """
+        from raskladka import db
+
+        if not keys:
+            return {}
+        first_ids = (
+            select(func.min(Product.id))
+            .join(Meal, Product.meal_id == Meal.id)
+            .where(
+                Meal.day_id.in_(_user_day_ids(user_id)),
+                Product.canonical_key.in_(keys),
+            )
+            .group_by(Product.canonical_key)
+        )
+        return dict(
+            db.session.execute(
+                select(Product.canonical_key, Product.weight).where(
+                    Product.id.in_(first_ids)
+                )
+            ).all()
         )
-        existing_products = query.all()
-        existing_weight_by_key: Dict[str, int] = {}
-        for product in existing_products:
-            key = canonical_product_key(product.name)
-            if key not in existing_weight_by_key:
-                existing_weight_by_key[key] = product.weight
-        return existing_weight_by_key
 
     @staticmethod
     def _find_conflicts_with_existing(
@@ -632,7 +1626,9 @@ class BackupService:
 
         if not replace:
             existing_weight_by_key = (
-                BackupService._build_existing_weight_by_key(user_id)
+                BackupService._build_existing_weight_by_key(
+                    user_id, list(weights_by_key)
+                )
             )
             conflicts.extend(
                 BackupService._find_conflicts_with_existing(
@@ -655,12 +1651,7 @@ class BackupService:
 
     @staticmethod
     def _clear_user_plans(user_id: int) -> None:
-        from raskladka import db
-
-        existing_plans = MealPlan.query.filter_by(user_id=user_id).all()
-        for plan in existing_plans:
-            db.session.delete(plan)
-        db.session.flush()
+        _delete_plans_where(MealPlan.user_id == user_id)
 
     @staticmethod
     def _import_products(meal: Meal, products_data: Any) -> None:
@@ -774,6 +1765,22 @@ class BackupService:
 
         return data
 
+    @staticmethod
+    def export_user_json(user_id: int) -> bytes:
+        """JSON-бэкап всех раскладок пользователя (UTF-8)"""
+        return json.dumps(
+            BackupService.export_user_data(user_id),
+            ensure_ascii=False,
+            indent=2,
+        ).encode("utf-8")
+
+    @staticmethod
+    def backup_filename(username: str) -> str:
+        """Имя файла бэкапа с отметкой времени UTC"""
+        safe_username = str(username).replace("/", "-").replace("\\", "-")
+        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        return f"raskladka_backup_{safe_username}_{ts}.json"
+
     @staticmethod
     def import_user_data(
         user_id: int, data: Dict[str, Any], replace: bool = True
@@ -789,33 +1796,44 @@ class BackupService:
         from raskladka import db
 
         try:
-            ok, meal_plans_data, error = BackupService._parse_meal_plans_data(
-                data
-            )
-            if not ok:
-                return False, error
-
-            valid, validation_error = BackupService._validate_before_import(
-                user_id, meal_plans_data, replace
+            # Занятая SQLite-база — повод повторить импорт, а не ошибка
+            return retry_on_locked(BackupService._import_user_data)(
+                user_id, data, replace
             )
-            if not valid:
-                return False, validation_error
-
-            if replace:
-                BackupService._clear_user_plans(user_id)
-
-            for plan_data in meal_plans_data:
-                BackupService._import_plan(user_id, plan_data)
-
-            db.session.commit()
-            return True, "Импорт выполнен успешно"
-
         except Exception as e:  # noqa: BLE001
             db.session.rollback()
             return False, (
                 "Ошибка импорта: " + str(e)
             )
 
+    @staticmethod
+    def _import_user_data(
+        user_id: int, data: Dict[str, Any], replace: bool
+    ) -> tuple[bool, str]:
+        """Импорт в одной транзакции; ошибки БД не перехватываются"""
+        from raskladka import db
+
+        ok, meal_plans_data, error = BackupService._parse_meal_plans_data(
+            data
+        )
+        if not ok:
+            return False, error
+
+        valid, validation_error = BackupService._validate_before_import(
+            user_id, meal_plans_data, replace
+        )
+        if not valid:
+            return False, validation_error
+
+        if replace:
+            BackupService._clear_user_plans(user_id)
+
+        for plan_data in meal_plans_data:
+            BackupService._import_plan(user_id, plan_data)
+
+        db.session.commit()
+        return True, "Импорт выполнен успешно"
+
 
 class SettingsService:
     """Сервис для сохранения пользовательских настроек расчета по плану."""
@@ -842,6 +1860,18 @@ class SettingsService:
             ),
         }
 
+    @staticmethod
+    def get_user_settings_by_plan(user_id: int) -> Dict[int, dict]:
+        """Сохраненные trip_days и people_count всех раскладок пользователя
+        одним запросом: plan_id -> {trip_days, people_count}."""
+        return {
+            settings.plan_id: {
+                "trip_days": settings.trip_days,
+                "people_count": settings.people_count,
+            }
+            for settings in UserPlanSettings.query.filter_by(user_id=user_id)
+        }
+
     @staticmethod
     def upsert_user_plan_settings(
         user_id: int,
@@ -894,3 +1924,48 @@ class SettingsService:
             )
             db.session.add(settings)
         db.session.commit()
+
+
+class IdempotencyService:
+    """Ключи идемпотентности изменений (заголовок Idempotency-Key)."""
+
+    @staticmethod
+    def _expired(ttl_hours: float):
+        return IdempotencyKey.created_at < datetime.utcnow() - timedelta(
+            hours=ttl_hours
+        )
+
+    @staticmethod
+    def get(
+        user_id: int, key: str, ttl_hours: float
+    ) -> Optional[IdempotencyKey]:
+        """Действующий (не устаревший) ключ пользователя"""
+        return IdempotencyKey.query.filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            ~IdempotencyService._expired(ttl_hours),
+        ).first()
+
+    @staticmethod
+    def begin(
+        user_id: int, key: str, fingerprint: str, ttl_hours: float
+    ) -> IdempotencyKey:
+        """
+        Добавляет ключ в сессию без фиксации: он сохранится тем же
+        коммитом, что и само изменение. Заодно удаляет устаревшие ключи
+        пользователя.
+        """
+        from raskladka import db
+
+        db.session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyService._expired(ttl_hours),
+            ),
+            execution_options=_BULK_OPTIONS,
+        )
+        record = IdempotencyKey(
+            user_id=user_id, key=key, fingerprint=fingerprint
+        )
+        db.session.add(record)
+        return record
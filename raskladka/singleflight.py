@@ -0,0 +1,88 @@
+# raskladka/singleflight.py
+"""Single-flight coalescing of identical concurrent computations.
+
+``coalesce(key, func)`` runs ``func`` once per key at a time: requests
+that arrive while the first one is still computing wait for it and get
+the same result (or exception). Keys must contain everything the result
+depends on, for plan data the plan revision, so a request never gets a
+result computed from older data than it could see itself. Nothing is
+kept after the computation ends. Results are shared between requests
+and must not be mutated.
+
+Coalescing is per process; duplicate background jobs across workers are
+merged by the job queue instead.
+"""
+import threading
+
+from flask import current_app
+
+EXTENSION_KEY = "singleflight"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Key -> in-flight call registry with call/shared counters."""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is None:
+                call = self._inflight[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "shared": self.shared,
+                "inflight": len(self._inflight),
+            }
+
+
+def coalesce(key, func):
+    """Run ``func`` through the app's single-flight registry if enabled."""
+    flight = current_app.extensions.get(EXTENSION_KEY)
+    if flight is None:
+        return func()
+    return flight.do(key, func)
+
+
+def init_singleflight(app) -> None:
+    """Create the registry unless SINGLEFLIGHT_ENABLED is off."""
+    enabled = app.config.get("SINGLEFLIGHT_ENABLED", True)
+    app.extensions[EXTENSION_KEY] = SingleFlight() if enabled else None
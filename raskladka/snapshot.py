@@ -0,0 +1,483 @@
+# raskladka/snapshot.py
+"""Columnar plan snapshot: the calculation input without ORM objects.
+
+A plan is kept as parallel arrays in layout order (day_number, day id,
+meal id, product id). Per meal: ``meal_day`` (day index) and
+``meal_type``; per product: ``product_day``, ``product_meal`` (meal
+index), ``product_key``, ``product_name`` and ``product_weight`` (grams
+per person). Strings are ids into the interned ``strings`` table. Meals
+without products are left out; empty days only count in ``days_count``.
+
+Snapshots are built from one flat query, never change afterwards and are
+cached per (plan id, revision), so workers and threads share them freely.
+
+``dumps``/``loads`` implement a versioned binary format (no pickle):
+
+    header   magic "RSNP", version, flags, plan id, revision, days count,
+             name size, strings/meals/products counts (little-endian)
+    name     UTF-8
+    strings  uint32 offsets (count + 1) and one UTF-8 blob
+    meals    uint32 meal_day, meal_type
+    products uint32 product_day, product_meal, product_key, product_name;
+             int64 product_weight
+
+Sections start at 8-byte boundaries. ``loads`` accepts bytes, mmap or
+memoryview and returns a snapshot whose arrays are memoryviews over the
+buffer, so a memory-mapped file in SNAPSHOT_DIR is shared by all workers
+through the page cache without being copied.
+"""
+import glob
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from flask import current_app
+from sqlalchemy import select
+
+from raskladka.fragment_cache import LRUCache
+
+EXTENSION_KEY = "plan_snapshots"
+FILES_EXTENSION_KEY = "plan_snapshot_files"
+
+MAGIC = b"RSNP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHqqIIIII")
+_ALIGN = 8
+_NATIVE_LITTLE = sys.byteorder == "little"
+
+
+class SnapshotFormatError(ValueError):
+    """The buffer is not a snapshot of a supported format version."""
+
+
+class PlanSnapshot:
+    __slots__ = (
+        "plan_id",
+        "name",
+        "revision",
+        "days_count",
+        "strings",
+        "meal_day",
+        "meal_type",
+        "product_day",
+        "product_meal",
+        "product_key",
+        "product_name",
+        "product_weight",
+    )
+
+    def __init__(
+        self,
+        plan_id: int,
+        name: str,
+        revision: int,
+        days_count: int,
+        strings: list,
+        meal_day: array,
+        meal_type: array,
+        product_day: array,
+        product_meal: array,
+        product_key: array,
+        product_name: array,
+        product_weight: array,
+    ):
+        self.plan_id = plan_id
+        self.name = name
+        self.revision = revision
+        self.days_count = days_count
+        self.strings = strings
+        self.meal_day = meal_day
+        self.meal_type = meal_type
+        self.product_day = product_day
+        self.product_meal = product_meal
+        self.product_key = product_key
+        self.product_name = product_name
+        self.product_weight = product_weight
+
+    def __len__(self) -> int:
+        return len(self.product_weight)
+
+    def __repr__(self) -> str:
+        return (
+            f"<PlanSnapshot plan={self.plan_id} rev={self.revision} "
+            f"days={self.days_count} products={len(self)}>"
+        )
+
+    def __reduce__(self):
+        # Memoryview-backed snapshots cannot be pickled as is
+        return loads, (dumps(self),)
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % _ALIGN)
+
+
+def _array_bytes(typecode: str, values) -> bytes:
+    data = array(typecode, values)
+    if not _NATIVE_LITTLE:
+        data.byteswap()
+    return data.tobytes()
+
+
+def dumps(snapshot: PlanSnapshot) -> bytes:
+    """Serialize a snapshot into the binary format."""
+    name = snapshot.name.encode("utf-8")
+    offsets = array("I", [0])
+    blob = bytearray()
+    for value in snapshot.strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    parts = [
+        _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            0,
+            snapshot.plan_id,
+            snapshot.revision,
+            snapshot.days_count,
+            len(name),
+            len(snapshot.strings),
+            len(snapshot.meal_day),
+            len(snapshot),
+        ),
+        name,
+    ]
+    sections = [_array_bytes("I", offsets), bytes(blob)]
+    sections += [
+        _array_bytes("I", values)
+        for values in (
+            snapshot.meal_day,
+            snapshot.meal_type,
+            snapshot.product_day,
+            snapshot.product_meal,
+            snapshot.product_key,
+            snapshot.product_name,
+        )
+    ]
+    sections.append(_array_bytes("q", snapshot.product_weight))
+    size = _HEADER.size + len(name)
+    for section in sections:
+        parts.append(_padding(size))
+        size += len(parts[-1])
+        parts.append(section)
+        size += len(section)
+    return b"".join(parts)
+
+
+class _Reader:
+    def __init__(self, view: memoryview, offset: int):
+        self.view = view
+        self.offset = offset
+
+    def take(self, size: int) -> memoryview:
+        self.offset += -self.offset % _ALIGN
+        end = self.offset + size
+        if end > len(self.view):
+            raise SnapshotFormatError("Truncated snapshot")
+        chunk = self.view[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def values(self, typecode: str, count: int):
+        chunk = self.take(count * struct.calcsize(typecode))
+        if _NATIVE_LITTLE:
+            return chunk.cast(typecode)
+        data = array(typecode, chunk.tobytes())
+        data.byteswap()
+        return data
+
+
+def loads(buffer) -> PlanSnapshot:
+    """Read a snapshot from bytes/mmap/memoryview without copying arrays."""
+    view = memoryview(buffer).cast("B")
+    if len(view) < _HEADER.size:
+        raise SnapshotFormatError("Truncated snapshot")
+    (
+        magic,
+        version,
+        _flags,
+        plan_id,
+        revision,
+        days_count,
+        name_size,
+        strings_count,
+        meals_count,
+        products_count,
+    ) = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotFormatError("Not a plan snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotFormatError(f"Unsupported snapshot version {version}")
+
+    end = _HEADER.size + name_size
+    if end > len(view):
+        raise SnapshotFormatError("Truncated snapshot")
+    reader = _Reader(view, end)
+    offsets = reader.values("I", strings_count + 1)
+    blob = reader.take(offsets[-1])
+    try:
+        name = str(view[_HEADER.size:end], "utf-8")
+        strings = [
+            str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+            for i in range(strings_count)
+        ]
+    except UnicodeDecodeError as exc:
+        raise SnapshotFormatError("Bad string table") from exc
+    meal_day = reader.values("I", meals_count)
+    meal_type = reader.values("I", meals_count)
+    product_day, product_meal, product_key, product_name = (
+        reader.values("I", products_count) for _ in range(4)
+    )
+    product_weight = reader.values("q", products_count)
+    return PlanSnapshot(
+        plan_id,
+        name,
+        revision,
+        days_count,
+        strings,
+        meal_day,
+        meal_type,
+        product_day,
+        product_meal,
+        product_key,
+        product_name,
+        product_weight,
+    )
+
+
+class SnapshotFileCache:
+    """Snapshot files ``<plan id>-<revision>.snap`` read through mmap."""
+
+    SUFFIX = ".snap"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, plan_id: int, revision: int) -> str:
+        return os.path.join(
+            self.directory, f"{plan_id}-{revision}{self.SUFFIX}"
+        )
+
+    def get(self, plan_id: int, revision: int):
+        path = self._path(plan_id, revision)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            return loads(mapped)
+        except SnapshotFormatError:
+            current_app.logger.warning("Removing bad snapshot file %s", path)
+            self._remove(path)
+            return None
+
+    def set(self, snapshot: PlanSnapshot) -> None:
+        path = self._path(snapshot.plan_id, snapshot.revision)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(dumps(snapshot))
+            os.replace(tmp_path, path)
+        except OSError:
+            current_app.logger.warning(
+                "Cannot write snapshot file %s", path, exc_info=True
+            )
+            self._remove(tmp_path)
+            return
+        # Older revisions of the plan are never read again
+        self.discard(snapshot.plan_id, keep=path)
+
+    def discard(self, plan_id: int, keep: str = None) -> None:
+        """Remove the files of all revisions of a plan except ``keep``."""
+        pattern = os.path.join(self.directory, f"{plan_id}-*{self.SUFFIX}")
+        for path in glob.glob(pattern):
+            if path != keep:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _SnapshotBuilder:
+    """Accumulates ordered flat rows of one plan into arrays."""
+
+    def __init__(self, plan_id: int, name: str, revision: int):
+        self.plan_id = plan_id
+        self.name = name
+        self.revision = revision
+        self.days_count = 0
+        self.strings = []
+        self._string_ids = {}
+        self._day_id = None
+        self._meal_id = None
+        self.meal_day = array("I")
+        self.meal_type = array("I")
+        self.product_day = array("I")
+        self.product_meal = array("I")
+        self.product_key = array("I")
+        self.product_name = array("I")
+        self.product_weight = array("q")
+
+    def intern(self, value: str) -> int:
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def add(self, day_id, meal_id, meal_type, name, key, weight) -> None:
+        if day_id is None:
+            return
+        if day_id != self._day_id:
+            self._day_id = day_id
+            self.days_count += 1
+        if name is None:
+            return
+        day_index = self.days_count - 1
+        if meal_id != self._meal_id:
+            self._meal_id = meal_id
+            self.meal_day.append(day_index)
+            self.meal_type.append(self.intern(meal_type))
+        self.product_day.append(day_index)
+        self.product_meal.append(len(self.meal_day) - 1)
+        self.product_key.append(self.intern(key))
+        self.product_name.append(self.intern(name))
+        self.product_weight.append(weight)
+
+    def build(self) -> PlanSnapshot:
+        return PlanSnapshot(
+            self.plan_id,
+            self.name,
+            self.revision,
+            self.days_count,
+            self.strings,
+            self.meal_day,
+            self.meal_type,
+            self.product_day,
+            self.product_meal,
+            self.product_key,
+            self.product_name,
+            self.product_weight,
+        )
+
+
+def _query_snapshots(*criteria) -> list:
+    """Build snapshots of the plans matching ``criteria`` in one query."""
+    from raskladka import db
+    from raskladka.models import Day, Meal, MealPlan, Product
+
+    rows = db.session.execute(
+        select(
+            MealPlan.id,
+            MealPlan.name,
+            MealPlan.revision,
+            Day.id,
+            Meal.id,
+            Meal.meal_type,
+            Product.name,
+            Product.canonical_key,
+            Product.weight,
+        )
+        .select_from(MealPlan)
+        .outerjoin(Day, Day.meal_plan_id == MealPlan.id)
+        .outerjoin(Meal, Meal.day_id == Day.id)
+        .outerjoin(Product, Product.meal_id == Meal.id)
+        .where(*criteria)
+        .order_by(MealPlan.id, Day.day_number, Day.id, Meal.id, Product.id)
+    )
+    snapshots = []
+    builder = None
+    for plan_id, plan_name, revision, *row in rows:
+        if builder is None or builder.plan_id != plan_id:
+            if builder is not None:
+                snapshots.append(builder.build())
+            builder = _SnapshotBuilder(plan_id, plan_name, revision)
+        builder.add(*row)
+    if builder is not None:
+        snapshots.append(builder.build())
+    return snapshots
+
+
+def _cache():
+    return current_app.extensions.get(EXTENSION_KEY)
+
+
+def _remember(snapshots: list) -> None:
+    cache = _cache()
+    if cache is not None:
+        for snapshot in snapshots:
+            cache.set((snapshot.plan_id, snapshot.revision), snapshot)
+
+
+def load_plan_snapshot(meal_plan):
+    """Snapshot of ``meal_plan`` for its current revision.
+
+    Looked up in the process LRU, then in the snapshot files, and built
+    from the database only when neither has this revision.
+    """
+    from raskladka.models import MealPlan
+
+    key = (meal_plan.id, meal_plan.revision)
+    cache = _cache()
+    snapshot = cache.get(key) if cache is not None else None
+    if snapshot is not None:
+        return snapshot
+    files = current_app.extensions.get(FILES_EXTENSION_KEY)
+    snapshot = files.get(*key) if files is not None else None
+    if snapshot is None:
+        snapshots = _query_snapshots(MealPlan.id == meal_plan.id)
+        if not snapshots:
+            return None
+        snapshot = snapshots[0]
+        if files is not None:
+            files.set(snapshot)
+    _remember([snapshot])
+    return snapshot
+
+
+def load_user_snapshots(user_id: int) -> list:
+    """Snapshots of all plans of the user, ordered by plan id."""
+    from raskladka.models import MealPlan
+
+    snapshots = _query_snapshots(MealPlan.user_id == user_id)
+    _remember(snapshots)
+    return snapshots
+
+
+def discard_plan_snapshots(plan_ids) -> None:
+    """Remove the snapshot files of deleted plans.
+
+    Plan ids may be reused by the database, and nothing else would ever
+    delete these files.
+    """
+    files = current_app.extensions.get(FILES_EXTENSION_KEY)
+    if files is not None:
+        for plan_id in plan_ids:
+            files.discard(plan_id)
+
+
+def init_snapshot_cache(app) -> None:
+    """SNAPSHOT_CACHE_SIZE snapshots per process (0 disables) and the
+    shared snapshot files in SNAPSHOT_DIR (empty disables)."""
+    size = int(app.config.get("SNAPSHOT_CACHE_SIZE", 0))
+    app.extensions[EXTENSION_KEY] = LRUCache(size) if size > 0 else None
+    files = None
+    directory = app.config.get("SNAPSHOT_DIR")
+    if directory:
+        try:
+            files = SnapshotFileCache(directory)
+        except OSError:
+            app.logger.warning(
+                "Snapshot files disabled: cannot create %s", directory
+            )
+    app.extensions[FILES_EXTENSION_KEY] = files
@@ -0,0 +1,52 @@
+// Действия над раскладками (POST /) с ключом идемпотентности: при обрыве
+// сети запрос повторяется с тем же ключом, и сервер не применяет
+// изменение второй раз, а возвращает сохранённый ответ
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+async function postAction(body, retries = 2) {
+    const key = newIdempotencyKey();
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch('/', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': key
+                },
+                body: JSON.stringify(body)
+            });
+            // Первый запрос с этим ключом ещё выполняется (409 с
+            // Retry-After); 409 без него — конфликт версий, не повторяем
+            if (response.status === 409 && response.headers.has('Retry-After')
+                && attempt < retries) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                continue;
+            }
+            return response;
+        } catch (error) {
+            if (attempt >= retries) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+        }
+    }
+}
+
+// Конфликт версий (409 от действия): строку изменили в другой вкладке.
+// Вызывает apply(current) с актуальным состоянием или перезагружает
+// страницу, если строку уже удалили. Возвращает true, если был конфликт
+async function handleVersionConflict(response, apply) {
+    if (response.status !== 409) return false;
+    const result = await response.clone().json().catch(() => ({}));
+    if (!result.conflict) return false;
+    showMessage(result.message || 'Данные изменены в другой вкладке', 'error');
+    if (result.current) {
+        apply(result.current);
+    } else {
+        window.location.reload();
+    }
+    return true;
+}
@@ -0,0 +1,650 @@
+// raskladka/static/js/edit_day.js
+// Утилиты для показа сообщений
+function showMessage(message, type = 'success') {
+    // Создаем или получаем контейнер для сообщений
+    let messageContainer = document.getElementById('message-container');
+    if (!messageContainer) {
+        messageContainer = document.createElement('div');
+        messageContainer.id = 'message-container';
+        messageContainer.style.cssText = `
+            position: fixed;
+            top: 15px;
+            right: 15px;
+            z-index: 9999;
+            pointer-events: none;
+        `;
+        document.body.appendChild(messageContainer);
+    }
+
+    const messageDiv = document.createElement('div');
+    messageDiv.className = type === 'success' ? 'success-message' : 'error-message';
+    messageDiv.style.pointerEvents = 'auto';
+
+    // Создаем контейнер для текста и кнопки закрытия
+    const textSpan = document.createElement('span');
+    textSpan.textContent = message;
+    textSpan.style.flex = '1';
+
+    const closeButton = document.createElement('button');
+    closeButton.innerHTML = '&times;';
+    closeButton.style.cssText = `
+        background: none;
+        border: none;
+        color: white;
+        font-size: 18px;
+        font-weight: bold;
+        cursor: pointer;
+        padding: 0;
+        margin-left: 12px;
+        opacity: 0.8;
+        transition: opacity 0.2s;
+    `;
+    closeButton.onmouseover = () => closeButton.style.opacity = '1';
+    closeButton.onmouseout = () => closeButton.style.opacity = '0.8';
+    closeButton.onclick = () => messageDiv.remove();
+
+    messageDiv.style.display = 'flex';
+    messageDiv.style.alignItems = 'flex-start';
+    messageDiv.style.justifyContent = 'space-between';
+    messageDiv.style.position = 'relative';
+    messageDiv.style.top = '0';
+    messageDiv.style.right = '0';
+
+    messageDiv.appendChild(textSpan);
+    messageDiv.appendChild(closeButton);
+    messageContainer.appendChild(messageDiv);
+
+    // Автоматическое удаление через 5 секунд для ошибок, 3 секунды для успеха
+    const timeout = type === 'error' ? 5000 : 3000;
+    setTimeout(() => {
+        if (messageDiv.parentNode) {
+            messageDiv.remove();
+        }
+    }, timeout);
+}
+
+// Показать ошибку поля
+function showFieldError(errorId, message) {
+    const errorElement = document.getElementById(errorId);
+    if (errorElement) {
+        errorElement.textContent = message;
+        errorElement.classList.add('show');
+
+        // Автоматически скрыть через 8 секунд
+        setTimeout(() => {
+            errorElement.classList.remove('show');
+        }, 8000);
+    }
+}
+
+// Валидация названия продукта (буквы латиницы/кириллицы, цифры, пробелы и основные символы)
+function isValidProductName(name) {
+    // - _ . , ( ) / + % & : ; ' " №
+    const re = /^[\w\s\-\.,()\/+%&:;'"№_А-Яа-яЁё]+$/;
+    return re.test(name.trim());
+}
+
+// Скрыть ошибку поля
+function hideFieldError(errorId) {
+    const errorElement = document.getElementById(errorId);
+    if (errorElement) {
+        errorElement.classList.remove('show');
+    }
+}
+
+// Случайная веселая подсказка для некорректного веса
+function getRandomWeightHint() {
+    const messages = [
+        'Ого, продукт невесомый? Кажется, он парит в космосе! 🚀 Укажите вес, чтобы вернуть его на Землю!',
+        'Вес 0 грамм? Это что, продукт из антиматерии? 😄 Попробуйте ввести реальный вес!',
+        'Этот продукт слишком стесняется, чтобы показать свой вес! 😳 Помогите ему, введите число больше нуля!',
+        'Продукт говорит: \"Я не пустышка!\" 😜 Укажите его вес, пожалуйста!',
+        'Вес 0? Это что, вы заказали только запах? 😋 Укажите вес продукта, чтобы мы могли его отправить!',
+        'Нулевой вес? Это секретный ингредиент для невидимых блюд? 🥐 Введите вес, чтобы мы знали, что паковать!',
+        'Вес 0 грамм? Это что, продукт из ТАРДИС Доктора Кто? 🕰️ Укажите вес, чтобы мы не потеряли его во времени!',
+        'Вес 0? Даже перышко Гриффиндора весит больше! ⚡ Укажите реальный вес!',
+        'Ой, кажется, вес потерялся! 😅 Давайте найдем его — введите число больше нуля!',
+        'Нулевой вес? Мы знаем, что ваш продукт крутой, но дайте ему шанс показать свой вес! 😎'
+    ];
+    const idx = Math.floor(Math.random() * messages.length);
+    return messages[idx];
+}
+
+// Смешные подсказки для слишком большого веса (> 500 000 г)
+function getRandomTooHeavyHint() {
+    const messages = [
+        'Полтонны на один прием? Для мамонта? 🦣 До 500 000 г, пожалуйста.',
+        'Похоже на поставку для космодрома! 🚀 Давайте уложимся в 500 000 г.',
+        'Стоп-стоп, это не склад, а раскладка! 📦 Не больше 500 000 г.',
+        'Тяжеловато! 🏋️‍♂️ Максимум 500 000 г на продукт.',
+        'Кажется, весы сломались от такой цифры. 🔧 До 500 000 г, пожалуйста!'
+    ];
+    const idx = Math.floor(Math.random() * messages.length);
+    return messages[idx];
+}
+
+// Очистить все ошибки для приема пищи
+function clearMealErrors(mealId) {
+    hideFieldError(`name-error-${mealId}`);
+    hideFieldError(`weight-error-${mealId}`);
+}
+
+// Очистить все ошибки для редактирования продукта
+function clearEditErrors(productId) {
+    hideFieldError(`edit-name-error-${productId}`);
+    hideFieldError(`edit-weight-error-${productId}`);
+}
+
+// Редактирование названия приема пищи
+async function editMealName(element, mealId) {
+    const originalName = element.dataset.originalName;
+    const input = document.createElement('input');
+    input.type = 'text';
+    input.className = 'meal-title-input';
+    input.value = originalName;
+
+    element.style.display = 'none';
+    element.parentNode.insertBefore(input, element);
+    input.focus();
+
+    const saveChanges = async () => {
+        const newName = input.value.trim();
+        if (!newName) {
+            showMessage('Введите название приема пищи', 'error');
+            element.style.display = 'inline';
+            input.remove();
+            return;
+        }
+        if (newName.length > 30) {
+            showMessage('Название приема пищи не должно превышать 30 символов', 'error');
+            return;
+        }
+        // Валидация допустимых символов (та же логика, что и на сервере)
+        const mealRe = /^[\w\s\-\.,()\/+%&:;'"№_А-Яа-яЁё]+$/;
+        if (!mealRe.test(newName)) {
+            showMessage('Название приема пищи содержит недопустимые символы', 'error');
+            return;
+        }
+        if (newName && newName !== originalName) {
+            try {
+                const response = await postAction({
+                    action: 'update_meal_name',
+                    meal_id: mealId,
+                    meal_name: newName,
+                    version: element.dataset.version
+                });
+                const conflict = await handleVersionConflict(response, current => {
+                    element.textContent = current.meal_type.charAt(0).toUpperCase() + current.meal_type.slice(1).toLowerCase();
+                    element.dataset.originalName = current.meal_type;
+                    element.dataset.version = current.version;
+                });
+                const data = conflict ? {} : await response.json();
+                if (conflict) {
+                    // Сообщение уже показано, название — актуальное
+                } else if (data.status === 'success') {
+                    element.textContent = newName.charAt(0).toUpperCase() + newName.slice(1).toLowerCase();
+                    element.dataset.originalName = newName;
+                    element.dataset.version = data.version;
+                    showMessage('Название приема пищи обновлено');
+                } else {
+                    showMessage('Не удалось обновить название приема пищи', 'error');
+                }
+            } catch (error) {
+                console.error('Ошибка при обновлении названия:', error);
+                showMessage('Произошла ошибка при обновлении названия', 'error');
+            }
+        }
+
+        element.style.display = 'inline';
+        input.remove();
+    };
+
+    input.addEventListener('blur', saveChanges);
+    input.addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            saveChanges();
+        }
+    });
+}
+
+// Начало редактирования продукта
+function startEditProduct(productId) {
+    const productItem = document.querySelector(`[data-product-id="${productId}"]`);
+    if (!productItem) {
+        console.error('Продукт не найден:', productId);
+        return;
+    }
+
+    const productDisplay = productItem.querySelector('.product-display');
+    const productEditForm = productItem.querySelector('.product-edit-form');
+
+    if (!productDisplay || !productEditForm) {
+        console.error('Элементы редактирования не найдены');
+        return;
+    }
+
+    // Очищаем ошибки
+    clearEditErrors(productId);
+
+    // Скрываем отображение и показываем форму редактирования
+    productDisplay.style.display = 'none';
+    productEditForm.style.display = 'flex';
+
+    // Фокусируемся на поле названия
+    const nameInput = productEditForm.querySelector('input[data-type="name"]');
+    if (nameInput) {
+        nameInput.focus();
+        nameInput.select();
+    }
+}
+
+// Сохранение изменений продукта
+async function saveProductEdit(productId) {
+    const productItem = document.querySelector(`[data-product-id="${productId}"]`);
+    if (!productItem) {
+        console.error('Продукт не найден:', productId);
+        return;
+    }
+
+    const productDisplay = productItem.querySelector('.product-display');
+    const productEditForm = productItem.querySelector('.product-edit-form');
+    const nameInput = productEditForm.querySelector('input[data-type="name"]');
+    const weightInput = productEditForm.querySelector('input[data-type="weight"]');
+
+    if (!productDisplay || !productEditForm || !nameInput || !weightInput) {
+        console.error('Элементы редактирования не найдены');
+        return;
+    }
+
+    const name = nameInput.value.trim();
+    const weight = weightInput.value.trim();
+
+    // Очищаем предыдущие ошибки
+    clearEditErrors(productId);
+
+    if (!name) {
+        showFieldError(`edit-name-error-${productId}`, 'Введите название продукта');
+        return;
+    }
+
+    if (!isValidProductName(name)) {
+        showFieldError(`edit-name-error-${productId}`, 'Название продукта содержит недопустимые символы');
+        return;
+    }
+    if (name.length > 100) {
+        showFieldError(`edit-name-error-${productId}`, 'Название продукта не должно превышать 100 символов');
+        return;
+    }
+
+    if (!weight) {
+        showFieldError(`edit-name-error-${productId}`, 'Введите вес продукта');
+        return;
+    }
+
+    const parsedWeight = parseInt(weight, 10);
+    if (isNaN(parsedWeight) || parsedWeight < 1) {
+        showFieldError(`edit-name-error-${productId}`, getRandomWeightHint());
+        return;
+    }
+    if (parsedWeight > 500000) {
+        showFieldError(`edit-name-error-${productId}`, getRandomTooHeavyHint());
+        return;
+    }
+
+    try {
+        const requestData = {
+            action: 'update_product',
+            product_id: productId,
+            name: name,
+            weight: parsedWeight,
+            version: productItem.dataset.version
+        };
+
+        console.log('Обновление продукта:', requestData);
+
+        const response = await postAction(requestData);
+
+        console.log('Получен ответ:', response.status);
+
+        const conflict = await handleVersionConflict(response, current => {
+            productDisplay.textContent = `${current.name} - ${current.weight}г`;
+            productItem.dataset.productName = current.name;
+            productItem.dataset.productWeight = current.weight;
+            productItem.dataset.version = current.version;
+            cancelProductEdit(productId);
+        });
+        if (conflict) return;
+
+        const data = await response.json();
+        console.log('Данные ответа:', data);
+        if (data.status === 'success') {
+            // Обновляем отображение и данные
+            productDisplay.textContent = `${name} - ${weight}г`;
+            productItem.dataset.productName = name;
+            productItem.dataset.productWeight = weight;
+            productItem.dataset.version = data.version;
+
+            // Возвращаем к обычному виду
+            productDisplay.style.display = 'inline';
+            productEditForm.style.display = 'none';
+
+            showMessage('Продукт обновлен');
+        } else {
+            if (data.message && data.message.includes('уже существует')) {
+                showFieldError(`edit-name-error-${productId}`, data.message);
+            } else if (data.message && /назв/i.test(data.message)) {
+                showFieldError(`edit-name-error-${productId}`, data.message);
+            } else {
+                showMessage(data.message || 'Не удалось обновить продукт', 'error');
+            }
+        }
+    } catch (error) {
+        console.error('Ошибка при обновлении продукта:', error);
+        showMessage('Произошла ошибка при обновлении продукта', 'error');
+    }
+}
+
+// Отмена редактирования продукта
+function cancelProductEdit(productId) {
+    const productItem = document.querySelector(`[data-product-id="${productId}"]`);
+    if (!productItem) {
+        console.error('Продукт не найден:', productId);
+        return;
+    }
+
+    const productDisplay = productItem.querySelector('.product-display');
+    const productEditForm = productItem.querySelector('.product-edit-form');
+    const nameInput = productEditForm.querySelector('input[data-type="name"]');
+    const weightInput = productEditForm.querySelector('input[data-type="weight"]');
+
+    if (!productDisplay || !productEditForm || !nameInput || !weightInput) {
+        console.error('Элементы редактирования не найдены');
+        return;
+    }
+
+    // Возвращаем исходные значения
+    const originalName = productItem.dataset.productName;
+    const originalWeight = productItem.dataset.productWeight;
+
+    nameInput.value = originalName;
+    weightInput.value = originalWeight;
+
+    // Очищаем ошибки
+    clearEditErrors(productId);
+
+    // Возвращаем к обычному виду
+    productDisplay.style.display = 'inline';
+    productEditForm.style.display = 'none';
+}
+
+
+
+// Удаление дня
+async function deleteDay(dayId) {
+    if (confirm('Вы уверены, что хотите удалить рацион?')) {
+        try {
+            const response = await postAction({ action: 'delete_day', day_id: dayId });
+            const data = await response.json();
+            if (data.status === 'success') {
+                showMessage('День удален');
+                setTimeout(() => {
+                    window.location.href = document.body.dataset.indexUrl;
+                }, 1000);
+            } else {
+                showMessage('Не удалось удалить рацион', 'error');
+            }
+        } catch (error) {
+            console.error('Ошибка при запросе:', error);
+            showMessage('Произошла ошибка при удалении дня', 'error');
+        }
+    }
+}
+
+// Удаление приема пищи
+async function deleteMeal(mealId) {
+    if (confirm('Удалить прием пищи?')) {
+        try {
+            const mealTitle = document.querySelector(`[data-meal-id="${mealId}"] .meal-title`);
+            const response = await postAction({
+                action: 'remove_meal',
+                meal_id: mealId,
+                version: mealTitle ? mealTitle.dataset.version : undefined
+            });
+            // Прием пищи изменили в другой вкладке: показываем актуальный
+            if (await handleVersionConflict(response, () => location.reload())) return;
+            const data = await response.json();
+            if (data.status === 'success') {
+                showMessage('Прием пищи удален');
+                location.reload();
+            } else {
+                showMessage('Не удалось удалить прием пищи', 'error');
+            }
+        } catch (error) {
+            console.error('Ошибка при запросе:', error);
+            showMessage('Произошла ошибка при удалении приема пищи', 'error');
+        }
+    }
+}
+
+// Удаление продукта
+async function deleteProduct(productId) {
+    if (confirm('Удалить продукт?')) {
+        try {
+            const productItem = document.querySelector(`[data-product-id="${productId}"]`);
+            const response = await postAction({
+                action: 'delete_product',
+                product_id: productId,
+                version: productItem ? productItem.dataset.version : undefined
+            });
+            if (await handleVersionConflict(response, () => location.reload())) return;
+            const data = await response.json();
+            if (data.status === 'success') {
+                showMessage('Продукт удален');
+                location.reload();
+            } else {
+                showMessage('Не удалось удалить продукт', 'error');
+            }
+        } catch (error) {
+            console.error('Ошибка при удалении продукта:', error);
+            showMessage('Произошла ошибка при удалении продукта', 'error');
+        }
+    }
+}
+
+// Добавление приема пищи
+async function addMeal(dayNumber) {
+    const input = document.getElementById('new-meal-name');
+    const mt = (input && input.value ? input.value : '').trim();
+    if (!mt) {
+        showMessage('Введите название приема пищи', 'error');
+        if (input) input.focus();
+        return;
+    }
+    if (mt.length > 30) {
+        showMessage('Название приема пищи не должно превышать 30 символов', 'error');
+        if (input) input.focus();
+        return;
+    }
+    const mealRe = /^[\w\s\-\.,()\/+%&:;'"№_А-Яа-яЁё]+$/;
+    if (!mealRe.test(mt)) {
+        showMessage('Название приема пищи содержит недопустимые символы', 'error');
+        if (input) input.focus();
+        return;
+    }
+    try {
+        const response = await postAction({
+            action: 'add_meal',
+            plan_id: parseInt(document.body.dataset.planId),
+            day_number: dayNumber,
+            meal_type: mt
+        });
+        const data = await response.json();
+        if (data.status === 'success') {
+            showMessage('Прием пищи добавлен');
+            if (input) input.value = '';
+            location.reload();
+        } else {
+            showMessage('Не удалось добавить прием пищи', 'error');
+        }
+    } catch (error) {
+        console.error('Ошибка при добавлении приема пищи:', error);
+        showMessage('Произошла ошибка при добавлении приема пищи', 'error');
+    }
+}
+
+// Добавление продукта
+async function addProduct(mealId) {
+    const mealSection = document.querySelector(`[data-meal-id="${mealId}"]`);
+    const productNameInput = mealSection.querySelector('.product-name');
+    const productWeightInput = mealSection.querySelector('.product-weight');
+    const name = productNameInput.value.trim();
+    const weight = productWeightInput.value.trim();
+
+    // Очищаем предыдущие ошибки
+    clearMealErrors(mealId);
+
+    console.log('Добавление продукта:', { mealId, name, weight });
+
+    if (!name) {
+        showFieldError(`name-error-${mealId}`, 'Введите название продукта');
+        return;
+    }
+
+    if (!isValidProductName(name)) {
+        showFieldError(`name-error-${mealId}`, 'Название продукта содержит недопустимые символы');
+        return;
+    }
+    if (name.length > 100) {
+        showFieldError(`name-error-${mealId}`, 'Название продукта не должно превышать 100 символов');
+        return;
+    }
+
+    if (!weight) {
+        showFieldError(`name-error-${mealId}`, 'Введите вес продукта');
+        return;
+    }
+
+    const parsedNewWeight = parseInt(weight, 10);
+    if (isNaN(parsedNewWeight) || parsedNewWeight < 1) {
+        showFieldError(`name-error-${mealId}`, getRandomWeightHint());
+        return;
+    }
+    if (parsedNewWeight > 500000) {
+        showFieldError(`name-error-${mealId}`, getRandomTooHeavyHint());
+        return;
+    }
+
+    try {
+        const requestData = {
+            action: 'add_product',
+            meal_id: mealId,
+            name: name,
+            weight: parsedNewWeight
+        };
+
+        console.log('Отправляем данные:', requestData);
+
+        const response = await postAction(requestData);
+
+        console.log('Получен ответ:', response.status);
+
+        const data = await response.json();
+        console.log('Данные ответа:', data);
+
+        if (data.status === 'success') {
+            showMessage('Продукт добавлен');
+            // Очищаем поля ввода
+            productNameInput.value = '';
+            productWeightInput.value = '';
+            location.reload();
+        } else {
+            if (data.message && data.message.includes('уже существует')) {
+                showFieldError(`name-error-${mealId}`, data.message);
+            } else if (data.message && /назв/i.test(data.message)) {
+                showFieldError(`name-error-${mealId}`, data.message);
+            } else {
+                showMessage(data.message || 'Не удалось добавить продукт', 'error');
+            }
+        }
+    } catch (error) {
+        console.error('Ошибка при добавлении продукта:', error);
+        showMessage('Произошла ошибка при добавлении продукта', 'error');
+    }
+}
+
+// Обработка Enter в полях добавления продукта
+document.addEventListener('DOMContentLoaded', function() {
+    const productNameInputs = document.querySelectorAll('.product-name');
+    const productWeightInputs = document.querySelectorAll('.product-weight');
+
+    productNameInputs.forEach(input => {
+        input.addEventListener('keypress', function(e) {
+            if (e.key === 'Enter') {
+                const mealSection = input.closest('.meal-section');
+                const weightInput = mealSection.querySelector('.product-weight');
+                weightInput.focus();
+            }
+        });
+
+        // Очищаем ошибку при вводе
+        input.addEventListener('input', function() {
+            const mealSection = input.closest('.meal-section');
+            const mealId = mealSection.dataset.mealId;
+            hideFieldError(`name-error-${mealId}`);
+        });
+    });
+
+    productWeightInputs.forEach(input => {
+        input.addEventListener('keypress', function(e) {
+            if (e.key === 'Enter') {
+                const mealSection = input.closest('.meal-section');
+                const addButton = mealSection.querySelector('.add-product-btn');
+                addButton.click();
+            }
+        });
+
+        // Очищаем ошибку при вводе
+        input.addEventListener('input', function() {
+            const mealSection = input.closest('.meal-section');
+            const mealId = mealSection.dataset.mealId;
+            hideFieldError(`name-error-${mealId}`);
+        });
+        // Очищаем ошибку при вводе
+        input.addEventListener('input', function() {
+            const mealSection = input.closest('.meal-section');
+            const mealId = mealSection.dataset.mealId;
+            hideFieldError(`name-error-${mealId}`);
+        });
+    });
+
+    // Обработчики для полей редактирования
+    const editNameInputs = document.querySelectorAll('.edit-input[data-type="name"]');
+    const editWeightInputs = document.querySelectorAll('.edit-input[data-type="weight"]');
+
+    editNameInputs.forEach(input => {
+        input.addEventListener('input', function() {
+            const productItem = input.closest('.product-item');
+            const productId = productItem.dataset.productId;
+            hideFieldError(`edit-name-error-${productId}`);
+        });
+    });
+
+    editWeightInputs.forEach(input => {
+        input.addEventListener('input', function() {
+            const productItem = input.closest('.product-item');
+            const productId = productItem.dataset.productId;
+            hideFieldError(`edit-name-error-${productId}`);
+        });
+    });
+
+    // Обработка Enter для ввода нового приема пищи
+    const newMealInput = document.getElementById('new-meal-name');
+    if (newMealInput) {
+        newMealInput.addEventListener('keypress', function(e) {
+            if (e.key === 'Enter') {
+                const addMealBtn = document.querySelector('.add-meal-btn');
+                if (addMealBtn) addMealBtn.click();
+            }
+        });
+    }
+});
@@ -0,0 +1,1077 @@
+// raskladka/static/js/index.js
+const CTX = (() => {
+    const el = document.body;
+    return {
+        planId: parseInt(el.dataset.planId || '0'),
+        layoutDaysCount: parseInt(el.dataset.layoutDays || '0'),
+    };
+})();
+// Простая функция дебаунса
+function debounce(fn, delay) {
+    var t;
+    return function() {
+        var ctx = this;
+        var args = arguments;
+        clearTimeout(t);
+        t = setTimeout(function() { fn.apply(ctx, args); }, delay);
+    };
+}
+
+// Сохранение параметров расчета для раскладки
+function saveCalculationParams() {
+    const tripDays = document.getElementById('trip-days').value;
+    const peopleCount = document.getElementById('people-count').value;
+    const planId = CTX.planId;
+
+    localStorage.setItem(`calc_params_${planId}`, JSON.stringify({
+        tripDays: tripDays,
+        peopleCount: peopleCount
+    }));
+}
+
+// Сохранение параметров на сервере (для авторизованного пользователя)
+async function saveSettingsToServer() {
+    try {
+        const planId = CTX.planId;
+        const tripDays = parseInt(document.getElementById('trip-days').value);
+        const peopleCount = parseInt(document.getElementById('people-count').value);
+        if (!tripDays || !peopleCount) return;
+        await fetch('/api/settings', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ plan_id: planId, trip_days: tripDays, people_count: peopleCount })
+        });
+    } catch (e) {
+        // ignore network errors for background save
+    }
+}
+
+const saveSettingsToServerDebounced = debounce(saveSettingsToServer, 700);
+
+async function saveLockToServer(locked) {
+    try {
+        const planId = CTX.planId;
+        await fetch('/api/settings', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ plan_id: planId, params_locked: !!locked })
+        });
+    } catch (e) {
+        // ignore
+    }
+}
+
+// Блокировка параметров (влияющих на расчет)
+function setParamsLocked(isLocked) {
+    const tripDaysInput = document.getElementById('trip-days');
+    const peopleCountInput = document.getElementById('people-count');
+    if (tripDaysInput) tripDaysInput.disabled = isLocked;
+    if (peopleCountInput) peopleCountInput.disabled = isLocked;
+
+    // Элементы распределения рационов
+    const rationRows = document.querySelectorAll('.ration-row');
+    rationRows.forEach(function(row) {
+        const slider = row.querySelector('input[type="range"]');
+        const buttons = row.querySelectorAll('.ration-btn');
+        if (slider) slider.disabled = isLocked;
+        buttons.forEach(function(btn) { btn.disabled = isLocked; });
+    });
+
+    const resetBtn = document.getElementById('ration-reset-btn');
+    if (resetBtn) resetBtn.disabled = isLocked;
+}
+
+// lock state now comes from server via loadServerSettings
+
+// Восстановление параметров расчета для раскладки
+function loadCalculationParams() {
+    const planId = CTX.planId;
+    const savedParams = localStorage.getItem(`calc_params_${planId}`);
+
+    if (savedParams) {
+        const params = JSON.parse(savedParams);
+        document.getElementById('trip-days').value = params.tripDays;
+        document.getElementById('people-count').value = params.peopleCount;
+    } else {
+        // Устанавливаем значения по умолчанию
+        document.getElementById('trip-days').value = CTX.layoutDaysCount || 1;
+        document.getElementById('people-count').value = 1;
+    }
+}
+
+// Загрузка сохраненных параметров с сервера (если есть)
+async function loadServerSettings() {
+    try {
+        const planId = CTX.planId;
+        const resp = await fetch(`/api/settings?plan_id=${planId}`);
+        const data = await resp.json();
+        if (data && data.status === 'success' && data.data) {
+            if (data.data.trip_days) {
+                document.getElementById('trip-days').value = data.data.trip_days;
+            }
+            if (data.data.people_count) {
+                document.getElementById('people-count').value = data.data.people_count;
+            }
+            const lockToggle = document.getElementById('params-lock-toggle');
+            if (lockToggle && typeof data.data.params_locked === 'boolean') {
+                lockToggle.checked = !!data.data.params_locked;
+                setParamsLocked(lockToggle.checked);
+            }
+        }
+    } catch (e) {
+        // ignore
+    }
+}
+
+// Переключение вкладок с сохранением состояния
+function switchTab(tabName) {
+    // Скрываем все вкладки
+    const tabPanes = document.querySelectorAll('.tab-pane');
+    tabPanes.forEach(pane => pane.classList.remove('active'));
+
+    // Убираем активный класс со всех кнопок
+    const navTabs = document.querySelectorAll('.nav-tab');
+    navTabs.forEach(tab => tab.classList.remove('active'));
+
+    // Показываем нужную вкладку
+    const targetPane = document.getElementById(tabName + '-tab');
+    if (targetPane) {
+        targetPane.classList.add('active');
+    }
+
+    // Активируем нужную кнопку
+    const targetTab = document.querySelector(`[data-tab="${tabName}"]`);
+    if (targetTab) {
+        targetTab.classList.add('active');
+    }
+
+    // Сохраняем активную вкладку
+    try {
+        const planId = CTX.planId;
+        localStorage.setItem(`active_tab_${planId}`, tabName);
+    } catch (e) {
+        // ignore
+    }
+
+    // Если открыли вкладку калькулятора — выполним расчет автоматически
+    try {
+        if (tabName === 'calculator') {
+            calculateFromLayoutDebounced();
+        }
+    } catch (e) {
+        // ignore
+    }
+}
+
+// Расчет продуктов на основе раскладки; новый расчет отменяет
+// незавершенный предыдущий, чтобы ответы не приходили вперемешку
+let calculationController = null;
+
+async function calculateFromLayout() {
+    const tripDays = parseInt(document.getElementById('trip-days').value);
+    const peopleCount = parseInt(document.getElementById('people-count').value);
+
+    if (!tripDays || !peopleCount) {
+        showMessage('Пожалуйста, заполните все поля', 'error');
+        return;
+    }
+
+    try {
+        // GET: повторный расчет без изменений получает 304 по ETag
+        const query = new URLSearchParams({
+            plan_id: CTX.planId,
+            trip_days: tripDays,
+            people_count: peopleCount
+        });
+        if (calculationController) calculationController.abort();
+        const controller = new AbortController();
+        calculationController = controller;
+        const response = await fetch(`/calculate?${query}`, {
+            cache: 'no-cache',
+            signal: controller.signal
+        });
+
+        const respData = await response.json();
+
+        if (respData.status === 'success') {
+            const result = respData.data;
+            displayLayoutResults(
+                result.results,
+                result.summary.trip_days,
+                result.summary.people_count,
+                result.summary.layout_days_count,
+                result.summary.layout_repetitions,
+                result.summary.actual_days_used,
+                result.meal_types_by_day,
+                result.product_meal_usage
+            );
+            saveCalculationParams();
+            try {
+                const planId = CTX.planId;
+                localStorage.setItem(`calc_last_run_${planId}`, '1');
+            } catch (e) {
+                // ignore
+            }
+        } else {
+            showMessage(respData.message || 'Ошибка при расчете', 'error');
+        }
+    } catch (error) {
+        if (error.name === 'AbortError') return;
+        console.error('Ошибка при запросе расчета:', error);
+        showMessage('Произошла ошибка при расчете', 'error');
+    }
+}
+
+const calculateFromLayoutDebounced = debounce(calculateFromLayout, 600);
+
+// Отображение результатов расчета на основе раскладки
+function displayLayoutResults(results, tripDays, peopleCount, layoutDaysCount, layoutRepetitions, actualDaysUsed, mealTypesByDay, productMealUsage) {
+    const mainResultsSection = document.getElementById('main-results-section');
+    const mainResultsContent = document.getElementById('main-results-content');
+    const resultsSection = document.getElementById('results-section');
+    const resultsContent = document.getElementById('results-content');
+    const rationPrefs = document.getElementById('ration-preferences');
+    const rationRowsEl = document.getElementById('ration-rows');
+    const rationTotalEl = document.getElementById('ration-total');
+
+    console.log('Типы приемов пищи по дням:', mealTypesByDay);
+
+    // Основная таблица результатов
+    let mainHtml = `
+        <div class="results-table-container">
+            <table class="results-table">
+                <thead>
+                    <tr>
+                        <th>Продукт</th>
+                        <th>1 прием пищи на ${peopleCount} чел.</th>
+    `;
+
+    // Добавляем заголовки для каждого рациона раскладки ("Повторы в рационе N")
+    for (let i = 0; i < layoutDaysCount; i++) {
+        mainHtml += `<th>Повторы в рационе ${i + 1}</th>`;
+    }
+
+    mainHtml += `
+                        <th>Количество повторений<br><small>за весь поход</small></th>
+                        <th>Общий вес для покупки</th>
+                    </tr>
+                </thead>
+                <tbody>
+    `;
+
+    let productRowIndex = 0;
+    results.forEach(result => {
+        // Вес за один прием пищи × количество человек
+        const weightPerMealForPeople = (result.weight_per_meal || 0) * peopleCount;
+        const weightPerMealText = weightPerMealForPeople >= 1000 ?
+            `${(weightPerMealForPeople / 1000).toFixed(1)} кг` :
+            `${Math.round(weightPerMealForPeople)} г`;
+
+        // Получаем информацию о использовании в рационах
+        const mealUsage = productMealUsage[result.name] || {};
+
+        mainHtml += `
+            <tr data-product-index="${productRowIndex}" data-weight-per-meal-for-people="${weightPerMealForPeople}">
+                <td class="product-name-cell">${result.name}</td>
+                <td class="weight-per-person-cell">${weightPerMealText}</td>
+        `;
+
+                        // Добавляем столбцы для каждого рациона раскладки
+        let totalOccurrences = 0;
+        for (let i = 0; i < layoutDaysCount; i++) {
+            const usageCount = mealUsage[i] || 0;
+            // Повторы по умолчанию для рациона i
+            const repetitionsForThisRation = Math.max(0, Math.floor((tripDays - i - 1) / layoutDaysCount) + 1);
+            const totalUsageForThisRation = usageCount * repetitionsForThisRation;
+            totalOccurrences += totalUsageForThisRation;
+
+            const cellClass = totalUsageForThisRation > 0 ? 'meal-usage-cell' : 'meal-usage-empty-cell';
+            mainHtml += `<td class="${cellClass}" data-product-index="${productRowIndex}" data-ration-index="${i}" data-base-usage="${usageCount}">${totalUsageForThisRation > 0 ? totalUsageForThisRation : ''}</td>`;
+        }
+
+        // Рассчитываем общий вес: количество повторений × вес за один прием пищи на всех человек
+        const totalWeight = totalOccurrences * weightPerMealForPeople;
+        const weightText = totalWeight >= 1000 ?
+            `${(totalWeight / 1000).toFixed(1)} кг` :
+            `${Math.round(totalWeight)} г`;
+
+        mainHtml += `
+                <td class="occurrences-cell" data-product-index="${productRowIndex}">${totalOccurrences}</td>
+                <td class="weight-cell" data-product-index="${productRowIndex}">${weightText}</td>
+            </tr>
+        `;
+        productRowIndex += 1;
+    });
+
+    mainHtml += `
+                </tbody>
+            </table>
+        </div>
+    `;
+
+    // Добавляем статистику
+    // Суммируем общий вес из уже рассчитанных на сервере данных
+    let totalWeight = 0;
+    results.forEach(result => {
+        totalWeight += result.weight || 0;
+    });
+
+    const totalWeightText = totalWeight >= 1000 ?
+        `${(totalWeight / 1000).toFixed(1)} кг` :
+        `${Math.round(totalWeight)} г`;
+
+    mainHtml += `
+        <div class="stats-block" style="margin-top: 20px; padding: 15px; padding-right: 120px; background: #e8f5e8; border-radius: 8px; border-left: 4px solid #28a745;">
+            <h5 style=\"margin: 0 0 4px 0; color: #1e7e34;\">📊 Общая статистика</h5>
+            <p style=\"margin: 0 0 5px 0; color: #1e7e34;\"><strong>Всего продуктов:</strong> ${results.length}</p>
+            <p style=\"margin: 5px 0 0 0; color: #1e7e34;\"><strong>Общий вес для покупки:</strong> <span id="stats-total-weight">${totalWeightText}</span></p>
+            <button class="export-excel-btn stats-export-btn" onclick="exportToExcel()" id="export-excel-btn" data-plan-id="${CTX.planId}">
+                📊 Экспорт в Excel
+            </button>
+        </div>
+    `;
+
+    // Дополнительные агрегаты по весу для панели деталей
+    const totalWeightPerPerson = peopleCount > 0 ? (totalWeight / peopleCount) : 0;
+    const totalWeightPerPersonText = totalWeightPerPerson >= 1000 ?
+        `${(totalWeightPerPerson / 1000).toFixed(1)} кг` :
+        `${Math.round(totalWeightPerPerson)} г`;
+
+    const weightPerPersonPerDay = (peopleCount > 0 && tripDays > 0) ? (totalWeight / (peopleCount * tripDays)) : 0;
+    const weightPerPersonPerDayText = weightPerPersonPerDay >= 1000 ?
+        `${(weightPerPersonPerDay / 1000).toFixed(1)} кг/день` :
+        `${Math.round(weightPerPersonPerDay)} г/день`;
+
+    const totalWeightPerDay = tripDays > 0 ? (totalWeight / tripDays) : 0;
+    const totalWeightPerDayText = totalWeightPerDay >= 1000 ?
+        `${(totalWeightPerDay / 1000).toFixed(1)} кг/день` :
+        `${Math.round(totalWeightPerDay)} г/день`;
+
+    // Детали расчета для боковой панели
+    let detailsHtml = `
+        <div style="margin-bottom: 20px; padding: 15px; background: #e3f2fd; border-radius: 8px; border-left: 4px solid #2196f3;">
+            <h5 style="margin: 0 0 10px 0; color: #1976d2;">📊 Информация о расчете</h5>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Общий вес закупки:</strong> ${totalWeightText}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Вес на одного (всего):</strong> ${totalWeightPerPersonText}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Вес на человека в день:</strong> ${weightPerPersonPerDayText}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Вес в день (на всех):</strong> ${totalWeightPerDayText}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Длительность похода:</strong> ${tripDays} дней</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Количество человек:</strong> ${peopleCount}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Рационов в раскладке:</strong> ${layoutDaysCount}</p>
+            <p style="margin: 5px 0; color: #1976d2;"><strong>Количество повторов раскладки:</strong> ${layoutRepetitions}</p>
+        </div>
+    `;
+
+                mainResultsContent.innerHTML = mainHtml;
+    resultsContent.innerHTML = detailsHtml;
+
+    mainResultsSection.style.display = 'block';
+    resultsSection.style.display = 'block';
+
+    // Авто-раскрытие аккордеона с деталями расчета
+    const moreDetails = document.getElementById('more-details');
+    if (moreDetails) {
+        moreDetails.open = true;
+    }
+
+    // Проставить параметры на кнопке экспорта
+    const exportExcelBtn = document.getElementById('export-excel-btn');
+    if (exportExcelBtn) {
+        exportExcelBtn.dataset.tripDays = tripDays;
+        exportExcelBtn.dataset.peopleCount = peopleCount;
+    }
+
+    // Автопрокрутка отключена: больше не скроллим к началу таблицы результатов
+
+    // Построение блока распределения повторений
+    try {
+        if (rationPrefs && rationRowsEl && rationTotalEl) {
+            buildRationPreferences({ tripDays, layoutDaysCount, mealTypesByDay });
+            rationPrefs.style.display = 'block';
+        }
+    } catch (e) {
+        console.error('Ошибка при построении блока рационов:', e);
+    }
+
+    // Применяем состояние блокировки к только что созданным элементам
+    try {
+        const lockToggle = document.getElementById('params-lock-toggle');
+        if (lockToggle && lockToggle.checked) {
+            setParamsLocked(true);
+        }
+    } catch (e) { /* ignore */ }
+}
+
+// Глобальное состояние распределения рационов внутри скоупа страницы
+let RATION_STATE = {
+    counts: [],
+    initial: [],
+    locked: new Set(),
+    tripDays: 0,
+    layoutDaysCount: 0
+};
+
+function computeDefaultCounts(tripDays, layoutDaysCount) {
+    const arr = [];
+    for (let i = 0; i < layoutDaysCount; i++) {
+        const c = Math.max(0, Math.floor((tripDays - i - 1) / layoutDaysCount) + 1);
+        arr.push(c);
+    }
+    return arr;
+}
+
+// --- Persistence for ration sliders (localStorage) ---
+function _rationCountsKey() {
+    const planId = CTX.planId;
+    return `ration_counts_${planId}`;
+}
+
+function saveRationCounts() {
+    try {
+        const payload = {
+            counts: Array.isArray(RATION_STATE.counts) ? RATION_STATE.counts : [],
+            layoutDaysCount: RATION_STATE.layoutDaysCount,
+            tripDays: RATION_STATE.tripDays,
+        };
+        localStorage.setItem(_rationCountsKey(), JSON.stringify(payload));
+    } catch (e) { /* ignore */ }
+}
+
+const saveRationCountsDebounced = debounce(saveRationCounts, 200);
+
+function loadRationCounts(tripDays, layoutDaysCount) {
+    try {
+        const raw = localStorage.getItem(_rationCountsKey());
+        if (!raw) return null;
+        const data = JSON.parse(raw);
+        if (!data || !Array.isArray(data.counts)) return null;
+        if ((data.layoutDaysCount | 0) !== layoutDaysCount) return null;
+        const counts = data.counts
+            .slice(0, layoutDaysCount)
+            .map(v => {
+                const n = parseInt(v);
+                return isNaN(n) ? 0 : Math.max(0, Math.min(tripDays, n));
+            });
+        while (counts.length < layoutDaysCount) counts.push(0);
+        const sum = counts.reduce((a, b) => a + b, 0);
+        if (sum !== tripDays) return null;
+        return counts;
+    } catch (e) {
+        return null;
+    }
+}
+
+function renderRationTotal() {
+    const rationTotalEl = document.getElementById('ration-total');
+    if (!rationTotalEl) return;
+    const sum = RATION_STATE.counts.reduce((a, b) => a + b, 0);
+    rationTotalEl.textContent = `Сумма: ${sum} / ${RATION_STATE.tripDays}`;
+}
+
+function updateResultsTableByRationCounts() {
+    try {
+        const productRows = document.querySelectorAll('table.results-table tbody tr');
+        productRows.forEach(row => {
+            const productIndex = parseInt(row.getAttribute('data-product-index'));
+            const weightPerMealForPeople = parseFloat(row.getAttribute('data-weight-per-meal-for-people')) || 0;
+            let occurrencesSum = 0;
+            for (let i = 0; i < RATION_STATE.layoutDaysCount; i++) {
+                const cell = row.querySelector(`td[data-product-index="${productIndex}"][data-ration-index="${i}"]`);
+                if (!cell) continue;
+                const baseUsage = parseInt(cell.getAttribute('data-base-usage')) || 0;
+                const repetitions = RATION_STATE.counts[i] || 0;
+                const totalUsage = baseUsage * repetitions;
+                occurrencesSum += totalUsage;
+                cell.textContent = totalUsage > 0 ? totalUsage : '';
+                cell.className = totalUsage > 0 ? 'meal-usage-cell' : 'meal-usage-empty-cell';
+            }
+            const occCell = row.querySelector(`td.occurrences-cell[data-product-index="${productIndex}"]`);
+            if (occCell) occCell.textContent = occurrencesSum;
+            const totalWeight = occurrencesSum * weightPerMealForPeople;
+            const weightText = totalWeight >= 1000 ? `${(totalWeight / 1000).toFixed(1)} кг` : `${Math.round(totalWeight)} г`;
+            const weightCell = row.querySelector(`td.weight-cell[data-product-index="${productIndex}"]`);
+            if (weightCell) weightCell.textContent = weightText;
+        });
+
+        // Обновляем блок "Общая статистика" — суммарный вес
+        let grandTotal = 0;
+        const weightCells = document.querySelectorAll('table.results-table tbody tr td.weight-cell');
+        weightCells.forEach(cell => {
+            const row = cell.closest('tr');
+            if (!row) return;
+            const productIndex = parseInt(row.getAttribute('data-product-index'));
+            const weightPerMealForPeople = parseFloat(row.getAttribute('data-weight-per-meal-for-people')) || 0;
+            const occCell = row.querySelector(`td.occurrences-cell[data-product-index="${productIndex}"]`);
+            const occ = occCell ? parseInt(occCell.textContent || '0') || 0 : 0;
+            grandTotal += occ * weightPerMealForPeople;
+        });
+        const statsTotalWeight = document.getElementById('stats-total-weight');
+        if (statsTotalWeight) {
+            const text = grandTotal >= 1000 ? `${(grandTotal / 1000).toFixed(1)} кг` : `${Math.round(grandTotal)} г`;
+            statsTotalWeight.textContent = text;
+        }
+    } catch (e) {
+        console.error('Ошибка обновления таблицы по слайдерам рационов:', e);
+    }
+}
+
+function redistributeDelta(changedIndex, amount, mode) {
+    // mode: 'decrease' — уменьшить другие на amount
+    //       'increase' — увеличить другие на amount (до их капа)
+    let remaining = amount;
+
+    const pass = (includeLocked) => {
+        for (let i = 0; i < RATION_STATE.layoutDaysCount && remaining > 0; i++) {
+            if (i === changedIndex) continue;
+            if (!includeLocked && RATION_STATE.locked.has(i)) continue;
+            if (mode === 'decrease') {
+                const canDec = Math.min(RATION_STATE.counts[i], remaining);
+                if (canDec > 0) {
+                    RATION_STATE.counts[i] -= canDec;
+                    remaining -= canDec;
+                }
+            } else {
+                const room = Math.max(0, RATION_STATE.tripDays - RATION_STATE.counts[i]);
+                if (room <= 0) continue;
+                const inc = Math.min(room, remaining);
+                RATION_STATE.counts[i] += inc;
+                remaining -= inc;
+            }
+        }
+    };
+
+    // Сначала по незаблокированным
+    pass(false);
+    // Затем по всем (кроме текущего)
+    if (remaining > 0) pass(true);
+
+    return amount - remaining; // фактически перераспределено
+}
+
+function onRationChange(index, newValue) {
+    const oldValue = RATION_STATE.counts[index];
+    if (newValue === oldValue) return;
+    RATION_STATE.locked.add(index);
+    const delta = newValue - oldValue;
+    if (delta > 0) {
+        const redistributed = redistributeDelta(index, delta, 'decrease');
+        RATION_STATE.counts[index] = oldValue + redistributed;
+    } else if (delta < 0) {
+        const redistributed = redistributeDelta(index, -delta, 'increase');
+        RATION_STATE.counts[index] = oldValue - redistributed;
+    }
+
+    // Обновляем UI для всех строк с учётом перераспределения
+    const allRows = document.querySelectorAll('.ration-row');
+    allRows.forEach(r => {
+        const idx = parseInt(r.getAttribute('data-ration-index'));
+        const sld = r.querySelector('input[type="range"]');
+        const lbl = r.querySelector('.ration-value');
+        const val = RATION_STATE.counts[idx];
+        if (sld) {
+            sld.max = String(RATION_STATE.tripDays);
+            sld.value = String(val);
+        }
+        if (lbl) lbl.textContent = `${val} из ${RATION_STATE.tripDays}`;
+    });
+
+    renderRationTotal();
+    updateResultsTableByRationCounts();
+    saveRationCountsDebounced();
+}
+
+function buildRationPreferences({ tripDays, layoutDaysCount, mealTypesByDay }) {
+    const rationPrefs = document.getElementById('ration-preferences');
+    const rowsEl = document.getElementById('ration-rows');
+    const resetBtn = document.getElementById('ration-reset-btn');
+    if (!rationPrefs || !rowsEl || !resetBtn) return;
+
+    RATION_STATE.tripDays = tripDays;
+    RATION_STATE.layoutDaysCount = layoutDaysCount;
+    RATION_STATE.initial = computeDefaultCounts(tripDays, layoutDaysCount);
+    const savedCounts = loadRationCounts(tripDays, layoutDaysCount);
+    RATION_STATE.counts = savedCounts ? [...savedCounts] : [...RATION_STATE.initial];
+    RATION_STATE.locked = new Set();
+
+    // Рендерим строки
+    rowsEl.innerHTML = '';
+    for (let i = 0; i < layoutDaysCount; i++) {
+        const dayMealTypes = mealTypesByDay[i] || [];
+        const mealTypeText = dayMealTypes.length > 0 ? dayMealTypes.join(', ') : '';
+        const row = document.createElement('div');
+        row.className = 'ration-row';
+        row.setAttribute('data-ration-index', String(i));
+
+        const nameCol = document.createElement('div');
+        nameCol.className = 'ration-name';
+        nameCol.innerHTML = 'Рацион ' + (i + 1) + (mealTypeText ? ('<span class="ration-subname"><small>' + mealTypeText + '</small></span>') : '');
+
+        const decBtn = document.createElement('button');
+        decBtn.className = 'ration-btn';
+        decBtn.type = 'button';
+        decBtn.setAttribute('aria-label', 'Уменьшить');
+        decBtn.textContent = '−';
+
+        const slider = document.createElement('input');
+        slider.type = 'range';
+        slider.className = 'ration-slider';
+        slider.min = '0';
+        slider.max = String(RATION_STATE.tripDays);
+        slider.step = '1';
+        slider.value = String(RATION_STATE.counts[i]);
+
+        const incBtn = document.createElement('button');
+        incBtn.className = 'ration-btn';
+        incBtn.type = 'button';
+        incBtn.setAttribute('aria-label', 'Увеличить');
+        incBtn.textContent = '+';
+
+        const valueCol = document.createElement('div');
+        valueCol.className = 'ration-value';
+        valueCol.textContent = `${RATION_STATE.counts[i]} из ${RATION_STATE.tripDays}`;
+
+        // Слушатели
+        decBtn.addEventListener('click', () => {
+            const nextVal = Math.max(0, RATION_STATE.counts[i] - 1);
+            onRationChange(i, nextVal);
+        });
+        incBtn.addEventListener('click', () => {
+            const cap = RATION_STATE.tripDays;
+            const nextVal = Math.min(cap, RATION_STATE.counts[i] + 1);
+            onRationChange(i, nextVal);
+        });
+        slider.addEventListener('input', (e) => {
+            const v = parseInt(e.target.value);
+            // Плавно, но с соблюдением суммы
+            onRationChange(i, isNaN(v) ? RATION_STATE.counts[i] : v);
+        });
+
+        row.appendChild(nameCol);
+        row.appendChild(decBtn);
+        row.appendChild(slider);
+        row.appendChild(incBtn);
+        row.appendChild(valueCol);
+        rowsEl.appendChild(row);
+    }
+
+    resetBtn.onclick = () => {
+        RATION_STATE.counts = [...RATION_STATE.initial];
+        RATION_STATE.locked = new Set();
+        // Обновляем UI
+        const rows = document.querySelectorAll('.ration-row');
+        rows.forEach(row => {
+            const idx = parseInt(row.getAttribute('data-ration-index'));
+            const slider = row.querySelector('input[type="range"]');
+            const valueLabel = row.querySelector('.ration-value');
+            const val = RATION_STATE.counts[idx];
+            if (slider) {
+                slider.max = String(RATION_STATE.tripDays);
+                slider.value = String(val);
+            }
+            if (valueLabel) valueLabel.textContent = `${val} из ${RATION_STATE.tripDays}`;
+        });
+        renderRationTotal();
+        updateResultsTableByRationCounts();
+        saveRationCountsDebounced();
+    };
+
+    renderRationTotal();
+    updateResultsTableByRationCounts();
+    // Persist current state so it survives reloads even without manual changes
+    saveRationCountsDebounced();
+}
+
+async function exportToExcel() {
+    const btn = document.getElementById('export-excel-btn');
+    const tripDays = btn && btn.dataset ? btn.dataset.tripDays : document.getElementById('trip-days').value;
+    const peopleCount = btn && btn.dataset ? btn.dataset.peopleCount : document.getElementById('people-count').value;
+    const planId = (btn && btn.dataset && btn.dataset.planId) ? btn.dataset.planId : CTX.planId;
+
+    if (btn) btn.disabled = true;
+    try {
+        // Файл собирается фоновой задачей, страница только ждёт результат
+        const job = await runJob({
+            kind: 'export_excel',
+            plan_id: planId,
+            trip_days: tripDays,
+            people_count: peopleCount,
+        });
+        window.location.href = job.download_url;
+    } catch (e) {
+        console.error('Ошибка при экспорте в Excel:', e);
+        showMessage(e.message || 'Произошла ошибка при экспорте в Excel', 'error');
+    } finally {
+        if (btn) btn.disabled = false;
+    }
+}
+
+// Одна книга со сводным листом закупки и листами всех раскладок;
+// каждая раскладка считается по своим сохраненным настройкам
+async function exportAllToExcel() {
+    const btn = document.getElementById('export-all-btn');
+    if (btn) btn.disabled = true;
+    try {
+        const job = await runJob({ kind: 'export_excel_all' });
+        window.location.href = job.download_url;
+    } catch (e) {
+        console.error('Ошибка при экспорте всех раскладок:', e);
+        showMessage(e.message || 'Произошла ошибка при экспорте в Excel', 'error');
+    } finally {
+        if (btn) btn.disabled = false;
+    }
+}
+
+        // Утилиты для показа сообщений
+function showMessage(message, type = 'success') {
+    // Создаем или получаем контейнер для сообщений
+    let messageContainer = document.getElementById('message-container');
+    if (!messageContainer) {
+        messageContainer = document.createElement('div');
+        messageContainer.id = 'message-container';
+        messageContainer.style.cssText = `
+            position: fixed;
+            top: 15px;
+            right: 15px;
+            z-index: 9999;
+            pointer-events: none;
+        `;
+        document.body.appendChild(messageContainer);
+    }
+
+    const messageDiv = document.createElement('div');
+    messageDiv.className = type === 'success' ? 'success-message' : 'error-message';
+    messageDiv.style.pointerEvents = 'auto';
+
+    // Создаем контейнер для текста и кнопки закрытия
+    const textSpan = document.createElement('span');
+    textSpan.textContent = message;
+    textSpan.style.flex = '1';
+
+    const closeButton = document.createElement('button');
+    closeButton.innerHTML = '&times;';
+    closeButton.style.cssText = `
+        background: none;
+        border: none;
+        color: white;
+        font-size: 18px;
+        font-weight: bold;
+        cursor: pointer;
+        padding: 0;
+        margin-left: 12px;
+        opacity: 0.8;
+        transition: opacity 0.2s;
+    `;
+    closeButton.onmouseover = () => closeButton.style.opacity = '1';
+    closeButton.onmouseout = () => closeButton.style.opacity = '0.8';
+    closeButton.onclick = () => messageDiv.remove();
+
+    messageDiv.style.display = 'flex';
+    messageDiv.style.alignItems = 'flex-start';
+    messageDiv.style.justifyContent = 'space-between';
+    messageDiv.style.position = 'relative';
+    messageDiv.style.top = '0';
+    messageDiv.style.right = '0';
+
+    messageDiv.appendChild(textSpan);
+    messageDiv.appendChild(closeButton);
+    messageContainer.appendChild(messageDiv);
+
+    // Автоматическое удаление через 5 секунд для ошибок, 3 секунды для успеха
+    const timeout = type === 'error' ? 5000 : 3000;
+    setTimeout(() => {
+        if (messageDiv.parentNode) {
+            messageDiv.remove();
+        }
+    }, timeout);
+}
+
+// Выбор плана
+function selectPlan(planId) {
+    // Сохраняем текущие параметры перед переключением
+    saveCalculationParams();
+    window.location.href = `/?plan_id=${planId}`;
+}
+
+// Редактирование названия плана
+function editPlanName() {
+    const title = document.querySelector('.plan-title');
+    const input = document.getElementById('plan-name-input');
+    const originalName = title.dataset.originalName;
+
+    title.style.display = 'none';
+    input.style.display = 'inline-block';
+    input.focus();
+    input.select();
+
+    const saveChanges = async () => {
+        const newName = input.value.trim();
+        if (newName && newName !== originalName) {
+            try {
+                const response = await postAction({
+                    action: 'update_plan_name',
+                    plan_id: CTX.planId,
+                    new_name: newName,
+                    version: title.dataset.version
+                });
+                const conflict = await handleVersionConflict(response, current => {
+                    title.textContent = current.name;
+                    title.dataset.originalName = current.name;
+                    title.dataset.version = current.version;
+                    input.value = current.name;
+                });
+                const respData = conflict ? {} : await response.json();
+                if (conflict) {
+                    // Сообщение уже показано, название — актуальное
+                } else if (respData.status === 'success') {
+                    title.textContent = newName;
+                    title.dataset.originalName = newName;
+                    title.dataset.version = respData.version;
+                    showMessage('Название раскладки обновлено');
+                } else {
+                    showMessage(respData.message || 'Не удалось обновить название раскладки', 'error');
+                }
+            } catch (error) {
+                console.error('Ошибка при обновлении названия:', error);
+                showMessage('Произошла ошибка при обновлении названия', 'error');
+            }
+        }
+
+        title.style.display = 'inline';
+        input.style.display = 'none';
+    };
+
+    input.addEventListener('blur', saveChanges);
+    input.addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            saveChanges();
+        }
+    });
+}
+
+// Удаление плана
+async function deletePlan(planId) {
+    if (confirm('Вы уверены, что хотите удалить раскладку?')) {
+        try {
+            const response = await postAction({ action: 'delete_plan', plan_id: planId });
+            const respData = await response.json();
+            if (respData.status === 'success') {
+                window.location.href = respData.redirect;
+            } else {
+                showMessage(respData.message || 'Не удалось удалить раскладку', 'error');
+            }
+        } catch (error) {
+            console.error('Ошибка при удалении раскладки:', error);
+            showMessage('Произошла ошибка при удалении раскладки', 'error');
+        }
+    }
+}
+
+// Копирование плана
+async function duplicatePlan(planId) {
+    try {
+        const response = await postAction({ action: 'duplicate_plan', plan_id: planId });
+        const respData = await response.json();
+        if (respData.status === 'success') {
+            window.location.href = respData.redirect;
+        } else {
+            showMessage(respData.message || 'Не удалось скопировать раскладку', 'error');
+        }
+    } catch (error) {
+        console.error('Ошибка при копировании раскладки:', error);
+        showMessage('Произошла ошибка при копировании раскладки', 'error');
+    }
+}
+
+// Создание плана
+async function createPlan() {
+    const newPlanName = document.getElementById('new-plan-name').value.trim();
+    if (newPlanName) {
+        try {
+            const response = await postAction({
+                action: 'create_plan',
+                name: newPlanName
+            });
+            const respData = await response.json();
+            if (respData.status === 'success') {
+                showMessage('Раскладка создана');
+                location.reload();
+            } else {
+                showMessage(respData.message || 'Не удалось создать раскладку', 'error');
+            }
+        } catch (error) {
+            console.error('Ошибка при создании раскладки:', error);
+            showMessage('Произошла ошибка при создании раскладки', 'error');
+        }
+    } else {
+        showMessage('Введите название раскладки', 'error');
+    }
+}
+
+
+
+
+
+// Ленивая загрузка содержимого дней: страницы по DAYS_PAGE_SIZE дней
+// запрашиваются, когда первый день страницы приближается к экрану
+const DAYS_PAGE_SIZE = parseInt(
+    (document.querySelector('.days-grid') || document.body).dataset.pageSize || '10'
+);
+const requestedDayPages = new Set();
+
+async function loadDaysPage(offset) {
+    if (requestedDayPages.has(offset)) return;
+    requestedDayPages.add(offset);
+    try {
+        const response = await fetch(
+            `/api/plans/${CTX.planId}/days?offset=${offset}&limit=${DAYS_PAGE_SIZE}`,
+            { cache: 'no-cache' }
+        );
+        const respData = await response.json();
+        if (respData.status !== 'success') {
+            throw new Error(respData.message || 'Ошибка загрузки дней');
+        }
+        respData.data.days.forEach(day => {
+            const content = document.querySelector(`.day-content[data-day-id="${day.id}"]`);
+            if (content) {
+                content.innerHTML = day.html;
+            }
+        });
+    } catch (error) {
+        // Страницу можно будет запросить повторно
+        requestedDayPages.delete(offset);
+        console.error('Ошибка при загрузке дней:', error);
+    }
+}
+
+function initLazyDays() {
+    const contents = Array.from(document.querySelectorAll('.day-content[data-day-index]'));
+    const pageOffset = el => Math.floor(parseInt(el.dataset.dayIndex) / DAYS_PAGE_SIZE) * DAYS_PAGE_SIZE;
+
+    if (!('IntersectionObserver' in window)) {
+        new Set(contents.map(pageOffset)).forEach(loadDaysPage);
+        return;
+    }
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            observer.unobserve(entry.target);
+            loadDaysPage(pageOffset(entry.target));
+        });
+    }, { rootMargin: '400px 0px' });
+    contents.forEach(el => observer.observe(el));
+}
+
+// Добавление дня
+async function addDay() {
+    const days = document.querySelectorAll('.day-container');
+    const newDayNumber = days.length + 1;
+
+    try {
+        const response = await postAction({
+            action: 'add_day',
+            plan_id: CTX.planId,
+            day_number: newDayNumber
+        });
+        const respData = await response.json();
+        if (respData.status === 'success') {
+            showMessage('День добавлен');
+            location.reload();
+        } else {
+            showMessage(respData.message || 'Не удалось добавить день', 'error');
+        }
+    } catch (error) {
+        console.error('Ошибка при добавлении дня:', error);
+        showMessage('Произошла ошибка при добавлении дня', 'error');
+    }
+}
+
+
+
+// Инициализация приложения
+document.addEventListener('DOMContentLoaded', function() {
+    // Показ глобального уведомления после успешного импорта
+    try {
+        const params = new URLSearchParams(window.location.search);
+        if (params.get('import_success') === '1') {
+            showMessage('Раскладки успешно импортированы');
+            // Убираем параметр из адресной строки, чтобы не повторялось после F5
+            params.delete('import_success');
+            const newUrl = `${window.location.pathname}${params.toString() ? '?' + params.toString() : ''}`;
+            window.history.replaceState({}, '', newUrl);
+        }
+    } catch (e) {
+        // ignore
+    }
+    initLazyDays();
+    // Загружаем сохраненные параметры расчета
+    loadCalculationParams();
+    // Пробуем загрузить параметры с сервера и обновить поля
+    loadServerSettings().then(function() {
+        // Настройки загружены; расчет инициируется логикой восстановления вкладки ниже
+    });
+
+    // Добавляем обработчики для сохранения параметров при изменении
+    const tripDaysInput = document.getElementById('trip-days');
+    const peopleCountInput = document.getElementById('people-count');
+
+    if (tripDaysInput) {
+        tripDaysInput.addEventListener('input', () => { saveCalculationParams(); saveSettingsToServerDebounced(); calculateFromLayoutDebounced(); });
+    }
+
+    if (peopleCountInput) {
+        peopleCountInput.addEventListener('input', () => { saveCalculationParams(); saveSettingsToServerDebounced(); calculateFromLayoutDebounced(); });
+    }
+
+    // Инициализация переключателя блокировки параметров
+    const lockToggle = document.getElementById('params-lock-toggle');
+    if (lockToggle) {
+        lockToggle.addEventListener('change', function() {
+            setParamsLocked(this.checked);
+            saveLockToServer(this.checked);
+        });
+    }
+
+    // Восстановление активной вкладки
+    try {
+        const planId = CTX.planId;
+        const savedTab1 = localStorage.getItem(`active_tab_${planId}`);
+        if (savedTab1 === 'calculator' || savedTab1 === 'layout') {
+            switchTab(savedTab1);
+        }
+    } catch (e) {
+        // ignore
+    }
+
+    // Обработчики кликов для переключения раскладок
+    const planItems = document.querySelectorAll('.plan-item');
+    planItems.forEach(function(item) {
+        item.addEventListener('click', function() {
+            const id = this.getAttribute('data-plan-id') || (this.dataset && this.dataset.planId);
+            if (id) {
+                selectPlan(id);
+            }
+        });
+    });
+
+    // Обработчик копирования раскладки
+    const duplicateBtn = document.getElementById('duplicate-plan-btn');
+    if (duplicateBtn) {
+        duplicateBtn.addEventListener('click', function() {
+            const id = this.getAttribute('data-plan-id') || (this.dataset && this.dataset.planId);
+            if (id) {
+                duplicatePlan(id);
+            }
+        });
+    }
+
+    // Обработчик удаления раскладки
+    const deleteBtn = document.getElementById('delete-plan-btn');
+    if (deleteBtn) {
+        deleteBtn.addEventListener('click', function() {
+            const id = this.getAttribute('data-plan-id') || (this.dataset && this.dataset.planId);
+            if (id) {
+                deletePlan(id);
+            }
+        });
+    }
+});
@@ -0,0 +1,31 @@
+// Фоновые задачи: постановка в очередь, опрос статуса с растущей паузой
+async function runJob(body) {
+    const options = { method: 'POST' };
+    if (body instanceof FormData) {
+        options.body = body;
+    } else {
+        options.headers = { 'Content-Type': 'application/json' };
+        options.body = JSON.stringify(body);
+    }
+    let resp = await fetch('/api/jobs', options);
+    let data = await resp.json();
+    if (data.status !== 'success') {
+        throw new Error(data.message || 'Не удалось запустить задачу');
+    }
+    let job = data.data;
+    let delay = 300;
+    while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, delay));
+        delay = Math.min(delay * 1.5, 3000);
+        resp = await fetch(job.url, { cache: 'no-store' });
+        data = await resp.json();
+        if (data.status !== 'success') {
+            throw new Error(data.message || 'Задача не найдена');
+        }
+        job = data.data;
+    }
+    if (job.status !== 'done') {
+        throw new Error(job.message || 'Задача завершилась с ошибкой');
+    }
+    return job;
+}
@@ -0,0 +1,46 @@
+// Экспорт и импорт резервной копии через фоновые задачи;
+// без JS ссылка и форма работают синхронно
+function setBackupStatus(text, isError = false) {
+    const status = document.getElementById('backup-status');
+    if (!status) return;
+    status.textContent = text;
+    status.style.display = text ? 'block' : 'none';
+    status.style.color = isError ? '#c92a2a' : '#495057';
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const exportLink = document.getElementById('backup-export-link');
+    if (exportLink) {
+        exportLink.addEventListener('click', async function(e) {
+            e.preventDefault();
+            setBackupStatus('Готовим резервную копию…');
+            try {
+                const job = await runJob({ kind: 'backup_export' });
+                setBackupStatus('');
+                window.location.href = job.download_url;
+            } catch (err) {
+                setBackupStatus(err.message, true);
+            }
+        });
+    }
+
+    const importForm = document.getElementById('backup-import-form');
+    if (importForm) {
+        importForm.addEventListener('submit', async function(e) {
+            e.preventDefault();
+            const formData = new FormData(importForm);
+            formData.append('kind', 'backup_import');
+            const submitBtn = importForm.querySelector('button[type="submit"]');
+            if (submitBtn) submitBtn.disabled = true;
+            setBackupStatus('Импортируем раскладки…');
+            try {
+                const job = await runJob(formData);
+                window.location.href = job.redirect_url;
+            } catch (err) {
+                setBackupStatus(err.message, true);
+            } finally {
+                if (submitBtn) submitBtn.disabled = false;
+            }
+        });
+    }
+});
@@ -1,7 +1,50 @@
 # raskladka/utils.py
-from typing import Union
+from typing import Callable, Union
+import functools
 import re
 
+# Размер кэша для каждой мемоизированной строковой функции
+STRING_CACHE_SIZE = 4096
+
+_memoized: dict[str, Callable] = {}
+
+
+def memoize_str(func):
+    """
+    Мемоизирует чистую функцию одного строкового аргумента.
+    Кэш ограничен (LRU, STRING_CACHE_SIZE записей); кэшируются только
+    значения точного типа str, остальные (None, числа, Markup и другие
+    подклассы str) передаются в функцию напрямую.
+    """
+    cached = functools.lru_cache(maxsize=STRING_CACHE_SIZE)(func)
+
+    @functools.wraps(func)
+    def wrapper(value):
+        if type(value) is str:
+            return cached(value)
+        return func(value)
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    _memoized[func.__name__] = wrapper
+    return wrapper
+
+
+def string_cache_stats() -> dict[str, dict[str, int]]:
+    """
+    Статистика кэшей строковых функций: hits, misses, size, maxsize
+    """
+    return {
+        name: func.cache_info()._asdict()
+        for name, func in _memoized.items()
+    }
+
+
+def clear_string_caches() -> None:
+    """Очищает кэши всех мемоизированных строковых функций"""
+    for func in _memoized.values():
+        func.cache_clear()
+
 
 def validate_positive_integer(
     value: Union[str, int], field_name: str = "Значение"
@@ -25,6 +68,28 @@ def validate_positive_integer(
         return False, f"{field_name} должно быть числом"
 
 
+# Макс. длина названия продукта и его канонического ключа: casefold()
+# превращает символ максимум в три ("ß" -> "ss")
+PRODUCT_NAME_MAX_LENGTH = 100
+CANONICAL_KEY_MAX_LENGTH = 3 * PRODUCT_NAME_MAX_LENGTH
+
+
+@memoize_str
+def normalize_product_name(name: str) -> tuple[str, str]:
+    """
+    Нормализует название продукта за один проход.
+    Возвращает (display_name, canonical_key), см.
+    normalize_product_name_display и canonical_product_key.
+    Пример: "  пШено  крупа" -> ("Пшено крупа", "пшено крупа")
+    """
+    # Убираем лишние пробелы по краям и внутри сворачиваем кратные пробелы
+    compact = " ".join(str(name).split())
+    if not compact:
+        return "", ""
+    lowered = compact.lower()
+    return lowered[0].upper() + lowered[1:], compact.casefold()
+
+
 def normalize_product_name_display(name: str) -> str:
     """
     Приводит название продукта к виду,
@@ -34,23 +99,19 @@ def normalize_product_name_display(name: str) -> str:
     """
     if not isinstance(name, str):
         return name
-    # Убираем лишние пробелы по краям и внутри сворачиваем кратные пробелы
-    compact = " ".join(name.strip().split())
-    if not compact:
-        return ""
-    lowered = compact.lower()
-    return lowered[0].upper() + lowered[1:]
+    return normalize_product_name(name)[0]
 
 
 def canonical_product_key(name: str) -> str:
     """
     Канонический ключ для сравнения/объединения продуктов: case-insensitive
     и без лишних пробелов. Использует .casefold() для надёжного сравнения
-    с учетом локалей. Пример: " пШено  " -> "пшено"
+    с учетом локалей. Пример: " пШено  " -> "пшено".
+    Ключ не длиннее CANONICAL_KEY_MAX_LENGTH (лишнее отрезается).
     """
     if not isinstance(name, str):
-        return str(name)
-    return " ".join(name.strip().split()).casefold()
+        return str(name)[:CANONICAL_KEY_MAX_LENGTH]
+    return normalize_product_name(name)[1][:CANONICAL_KEY_MAX_LENGTH]
 
 
 def canonical_username(username: str) -> str:
@@ -98,6 +159,7 @@ def validate_username(username: str) -> tuple[bool, str]:
 _PRODUCT_NAME_REGEX = re.compile(r"^[\w\s\-\.,()/+%&:;'\"№_]+$", re.UNICODE)
 
 
+@memoize_str
 def validate_product_name(name: str) -> tuple[bool, str]:
     """
     Валидирует название продукта по регулярному выражению:
@@ -110,7 +172,7 @@ def validate_product_name(name: str) -> tuple[bool, str]:
     trimmed = name.strip()
     if not trimmed:
         return False, "Введите название продукта"
-    if len(trimmed) > 100:
+    if len(trimmed) > PRODUCT_NAME_MAX_LENGTH:
         return False, "Название продукта не должно превышать 100 символов"
     if not _PRODUCT_NAME_REGEX.match(trimmed):
         return False, "Название продукта содержит недопустимые символы"
@@ -121,6 +183,7 @@ def validate_product_name(name: str) -> tuple[bool, str]:
 _MEAL_TYPE_REGEX = re.compile(r"^[\w\s\-\.,()/+%&:;'\"№_]+$", re.UNICODE)
 
 
+@memoize_str
 def validate_meal_type(name: str) -> tuple[bool, str]:
     """
     Валидирует название приема пищи:
@@ -16,8 +16,12 @@ from flask_login import (
     logout_user,
     current_user,
 )
-from raskladka import db, bcrypt
-from raskladka.models import User, MealPlan, Day
+from raskladka import db, bcrypt, jobs
+from raskladka.database import read_only, retry_on_locked
+from raskladka.ratelimit import concurrency_slot, rate_limited
+from raskladka.singleflight import coalesce
+from raskladka.fragment_cache import is_cached
+from raskladka.models import User, MealPlan, Day, Job
 from raskladka.services import (
     CalculationService,
     MealPlanService,
@@ -26,6 +30,8 @@ from raskladka.services import (
     ProductService,
     BackupService,
     SettingsService,
+    IdempotencyService,
+    VersionConflict,
 )
 from raskladka.utils import (
     validate_positive_integer,
@@ -34,18 +40,69 @@ from raskladka.utils import (
     validate_meal_type,
 )
 from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+import hashlib
 import json
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import TooManyRequests
 
 views = Blueprint("views", __name__)
 
+# Дней на странице /api/plans/<id>/days (по умолчанию и максимум)
+DAYS_PAGE_SIZE = 10
+MAX_DAYS_PAGE_SIZE = 50
+# Максимум раскладок в одном общем расчете /calculate/combined
+MAX_COMBINED_PLANS = 50
+# Заголовок с ключом идемпотентности действий POST / и его макс. длина
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+
 
 def _json_error(message, status_code=400):
     return jsonify({"status": "error", "message": message}), status_code
 
 
+def _parse_version(data):
+    """Версия строки, с которой работал клиент (необязательная)"""
+    version = data.get("version")
+    return int(version) if version not in (None, "") else None
+
+
+def _version_conflict(exc):
+    """409 с актуальным состоянием измененной параллельно строки"""
+    return jsonify({
+        "status": "error",
+        "message": "Данные изменены в другой вкладке или другим "
+        "пользователем. Показаны актуальные значения",
+        "conflict": True,
+        "current": exc.current,
+    }), 409
+
+
+def _make_etag(*parts) -> str:
+    """ETag из значений, от которых зависит тело ответа"""
+    return hashlib.sha1(
+        json.dumps(parts, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _conditional_response(etag: str, build_response):
+    """
+    Условный GET: если клиент прислал актуальный If-None-Match, отвечает
+    304 без вызова build_response. Иначе строит ответ и добавляет ETag.
+    Ответы персональные: private, с обязательной перепроверкой.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(build_response())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 # Handlers for POST actions on index
 def _handle_delete_plan(data):
     try:
@@ -60,17 +117,49 @@ def _handle_delete_plan(data):
     return _json_error("Раскладка не найдена или доступ запрещён")
 
 
+def _handle_duplicate_plan(data):
+    try:
+        plan_id = int(data.get("plan_id"))
+        day_from = data.get("day_from")
+        day_to = data.get("day_to")
+        day_from = int(day_from) if day_from not in (None, "") else None
+        day_to = int(day_to) if day_to not in (None, "") else None
+    except Exception:  # noqa: BLE001
+        return _json_error("Некорректные параметры копирования")
+    if (day_from is not None and day_from < 1) or (
+        day_to is not None and day_to < (day_from or 1)
+    ):
+        return _json_error("Некорректный диапазон дней")
+    new_plan = MealPlanService.duplicate_plan(
+        plan_id,
+        current_user.id,
+        name=(data.get("name") or "").strip() or None,
+        day_from=day_from,
+        day_to=day_to,
+    )
+    if new_plan:
+        return jsonify(
+            {
+                "status": "success",
+                "plan_id": new_plan.id,
+                "redirect": url_for("views.index", plan_id=new_plan.id),
+            }
+        )
+    return _json_error("Раскладка не найдена или доступ запрещён")
+
+
 def _handle_update_plan_name(data):
     try:
         plan_id = int(data.get("plan_id"))
+        version = _parse_version(data)
     except Exception:  # noqa: BLE001
         return _json_error("Некорректный идентификатор раскладки")
     new_name = data.get("new_name")
-    success = MealPlanService.update_plan_name(
-        plan_id, current_user.id, new_name
+    new_version = MealPlanService.update_plan_name(
+        plan_id, current_user.id, new_name, version
     )
-    if success:
-        return jsonify({"status": "success"})
+    if new_version is not None:
+        return jsonify({"status": "success", "version": new_version})
     return _json_error("Раскладка не найдена или доступ запрещён")
 
 
@@ -85,29 +174,78 @@ def _handle_delete_day(data):
     return _json_error("День не найден или доступ запрещён")
 
 
+def _handle_duplicate_day(data):
+    try:
+        plan_id = int(data.get("plan_id"))
+        day_number = int(data.get("day_number"))
+        position_from = int(data.get("position_from"))
+        position_to = int(data.get("position_to", position_from))
+    except Exception:  # noqa: BLE001
+        return _json_error("Некорректные параметры копирования дня")
+    success, message = DayService.duplicate_day(
+        plan_id, current_user.id, day_number, position_from, position_to
+    )
+    if success:
+        return jsonify({"status": "success"})
+    return _json_error(message)
+
+
+def _handle_reorder_days(data):
+    try:
+        plan_id = int(data.get("plan_id"))
+        day_ids = [int(day_id) for day_id in data.get("day_ids")]
+    except Exception:  # noqa: BLE001
+        return _json_error("Некорректный порядок дней")
+    success, message = DayService.reorder_days(
+        plan_id, current_user.id, day_ids
+    )
+    if success:
+        return jsonify({"status": "success"})
+    return _json_error(message)
+
+
+def _handle_fill_empty_days(data):
+    try:
+        plan_id = int(data.get("plan_id"))
+        template_day_number = int(data.get("template_day_number"))
+    except Exception:  # noqa: BLE001
+        return _json_error("Некорректные параметры дня-шаблона")
+    success, message = DayService.fill_empty_days(
+        plan_id, current_user.id, template_day_number
+    )
+    if success:
+        return jsonify({"status": "success"})
+    return _json_error(message)
+
+
 def _handle_update_product(data):
     try:
         product_id = int(data.get("product_id"))
         weight = int(data.get("weight"))
+        version = _parse_version(data)
     except Exception:  # noqa: BLE001
         return _json_error("Некорректные данные продукта")
-    success, message = ProductService.update_product(
+    new_version, message = ProductService.update_product(
         product_id,
         current_user.id,
         data.get("name"),
         weight,
+        version,
     )
-    if success:
-        return jsonify({"status": "success"})
+    if new_version is not None:
+        return jsonify({"status": "success", "version": new_version})
     return _json_error(message)
 
 
 def _handle_delete_product(data):
     try:
         product_id = int(data.get("product_id"))
+        version = _parse_version(data)
     except Exception:  # noqa: BLE001
         return _json_error("Некорректный идентификатор продукта")
-    success = ProductService.delete_product(product_id, current_user.id)
+    success = ProductService.delete_product(
+        product_id, current_user.id, version
+    )
     if success:
         return jsonify({"status": "success"})
     return _json_error("Продукт не найден или доступ запрещён")
@@ -166,9 +304,10 @@ def _handle_add_product(data):
 def _handle_remove_meal(data):
     try:
         meal_id = int(data.get("meal_id"))
+        version = _parse_version(data)
     except Exception:  # noqa: BLE001
         return _json_error("Некорректный идентификатор приема пищи")
-    success = MealService.delete_meal(meal_id, current_user.id)
+    success = MealService.delete_meal(meal_id, current_user.id, version)
     if success:
         return jsonify({"status": "success"})
     return _json_error("Прием пищи не найден или доступ запрещён")
@@ -177,17 +316,18 @@ def _handle_remove_meal(data):
 def _handle_update_meal_name(data):
     try:
         meal_id = int(data.get("meal_id"))
+        version = _parse_version(data)
     except Exception:  # noqa: BLE001
         return _json_error("Некорректный идентификатор приема пищи")
     meal_name = data.get("meal_name", "")
     ok, err = validate_meal_type(meal_name)
     if not ok:
         return _json_error(err)
-    success = MealService.update_meal_type(
-        meal_id, current_user.id, data.get("meal_name")
+    new_version = MealService.update_meal_type(
+        meal_id, current_user.id, data.get("meal_name"), version
     )
-    if success:
-        return jsonify({"status": "success"})
+    if new_version is not None:
+        return jsonify({"status": "success", "version": new_version})
     return _json_error("Прием пищи не найден или доступ запрещён")
 
 
@@ -198,10 +338,85 @@ def _handle_create_plan(data):
     return jsonify({"status": "success"})
 
 
+def _replay_action(record, fingerprint):
+    """Ответ на повтор запроса с уже использованным ключом"""
+    if record.fingerprint != fingerprint:
+        return _json_error(
+            "Ключ идемпотентности уже использован для другого запроса", 422
+        )
+    if record.status_code is None:
+        response = _json_error("Запрос с этим ключом еще выполняется", 409)
+        response[0].headers["Retry-After"] = "1"
+        return response
+    response = current_app.response_class(
+        record.response,
+        status=record.status_code,
+        mimetype="application/json",
+    )
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _run_action(handler, data):  # noqa: C901
+    """
+    Выполняет действие. С заголовком Idempotency-Key ключ сохраняется
+    в той же транзакции, что и изменение, вместе с ответом: повтор
+    запроса (например, после обрыва сети) получает сохраненный ответ, а
+    одновременный дубль откатывается на уникальном ограничении ключа.
+    Конфликт версий тоже сохраняется как ответ (409): изменение не
+    применено, и повтор с тем же ключом получает тот же конфликт.
+    """
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if not key:
+        return retry_on_locked(handler)(data)
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return _json_error("Некорректный ключ идемпотентности")
+
+    ttl_hours = current_app.config.get("IDEMPOTENCY_KEY_TTL_HOURS", 24)
+    fingerprint = _make_etag(data)
+    record = IdempotencyService.get(current_user.id, key, ttl_hours)
+    if record is not None:
+        return _replay_action(record, fingerprint)
+
+    @retry_on_locked
+    def run():
+        record = IdempotencyService.begin(
+            current_user.id, key, fingerprint, ttl_hours
+        )
+        try:
+            response = current_app.make_response(handler(data))
+        except VersionConflict as exc:
+            db.session.rollback()
+            response = current_app.make_response(_version_conflict(exc))
+        if response.status_code >= 500:
+            db.session.rollback()
+            return response
+        if record not in db.session:
+            # Обработчик откатил транзакцию, а вместе с ней и ключ
+            db.session.add(record)
+        record.status_code = response.status_code
+        record.response = response.get_data(as_text=True)
+        db.session.commit()
+        return response
+
+    try:
+        return run()
+    except IntegrityError:
+        db.session.rollback()
+        record = IdempotencyService.get(current_user.id, key, ttl_hours)
+        if record is None:
+            raise
+        return _replay_action(record, fingerprint)
+
+
 ACTION_HANDLERS = {
     "delete_plan": _handle_delete_plan,
+    "duplicate_plan": _handle_duplicate_plan,
     "update_plan_name": _handle_update_plan_name,
     "delete_day": _handle_delete_day,
+    "duplicate_day": _handle_duplicate_day,
+    "reorder_days": _handle_reorder_days,
+    "fill_empty_days": _handle_fill_empty_days,
     "update_product": _handle_update_product,
     "delete_product": _handle_delete_product,
     "add_day": _handle_add_day,
@@ -213,133 +428,9 @@ ACTION_HANDLERS = {
 }
 
 
-def _prepare_headers(
-    layout_days_count: int,
-    people_count: int,
-) -> list[str]:
-    headers = [
-        "Продукт",
-        f"1 прием пищи на {people_count} чел.",
-    ]
-    for i in range(layout_days_count):
-        headers.append(f"Повторы в рационе {i + 1}")
-    headers.extend(["Количество повторений", "Общий вес для покупки"])
-    return headers
-
-
-def _apply_table_styles(ws, thin_border):
-    for row in ws.iter_rows(
-        min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column
-    ):
-        for cell in row:
-            cell.border = thin_border
-            align = "left" if cell.column == 1 else "center"
-            cell.alignment = Alignment(horizontal=align, vertical="center")
-
-
-def _auto_fit_columns(ws):
-    column_widths = {}
-    for row in ws.iter_rows(
-        min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column
-    ):
-        for cell in row:
-            value = str(cell.value) if cell.value is not None else ""
-            letter = cell.column_letter
-            column_widths[letter] = max(
-                column_widths.get(letter, 0),
-                len(value) + 2,
-            )
-    for col_letter, width in column_widths.items():
-        ws.column_dimensions[col_letter].width = min(40, width)
-
-
-def _append_total_row(ws, thin_border, layout_days_count: int):
-    if ws.max_row < 2:
-        return
-    start = ws.cell(row=2, column=ws.max_column).coordinate
-    end = ws.cell(row=ws.max_row, column=ws.max_column).coordinate
-    sum_cell = f"=SUM({start}:{end})"
-    empty_cells = [""] * layout_days_count
-    ws.append(["ИТОГО", ""] + empty_cells + ["", sum_cell])
-    last_row = ws.max_row
-    for cell in ws[last_row]:
-        cell.border = thin_border
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-
-def _build_workbook(
-    results: list[dict],
-    summary: dict,
-    meal_types_by_day: list[list[str]],
-    product_meal_usage: dict,
-    trip_days: int,
-    people_count: int,
-):
-    layout_days_count = summary["layout_days_count"]
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Расчет"
-
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(
-        start_color="667EEA", end_color="667EEA", fill_type="solid"
-    )
-    thin_border = Border(
-        left=Side(style="thin", color="DDDDDD"),
-        right=Side(style="thin", color="DDDDDD"),
-        top=Side(style="thin", color="DDDDDD"),
-        bottom=Side(style="thin", color="DDDDDD"),
-    )
-
-    headers = _prepare_headers(
-        layout_days_count, people_count
-    )
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(
-            horizontal="center", vertical="center", wrap_text=True
-        )
-        cell.border = thin_border
-
-    for item in results:
-        name = item.get("name", "")
-        weight_per_meal = item.get("weight_per_meal", 0) or 0
-        weight_for_people = weight_per_meal * people_count
-
-        row = [name, round(weight_for_people, 2)]
-
-        total_occurrences = 0
-        usage_map = product_meal_usage.get(name, {})
-
-        for i in range(layout_days_count):
-            usage_count = usage_map.get(i, 0)
-            if i >= trip_days:
-                repetitions = 0
-            else:
-                repetitions = ((trip_days - 1 - i) // layout_days_count) + 1
-            total_usage = usage_count * repetitions
-            total_occurrences += total_usage
-            row.append(total_usage if total_usage > 0 else "")
-
-        total_weight = round(total_occurrences * weight_for_people, 2)
-        row.extend([total_occurrences, total_weight])
-        ws.append(row)
-
-    _apply_table_styles(ws, thin_border)
-    _auto_fit_columns(ws)
-    _append_total_row(ws, thin_border, layout_days_count)
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output
-
-
 @views.route("/register", methods=["GET", "POST"])
+@rate_limited("auth", methods=("POST",))
+@retry_on_locked
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("views.index"))
@@ -370,9 +461,7 @@ def register():
             return redirect(url_for("views.register"))
 
         # Проверяем занятость логина без учета регистра и лишних пробелов
-        if User.query.filter(
-            db.func.lower(db.func.trim(User.username)) == username_norm
-        ).first():
+        if User.query.filter_by(username_canonical=username_norm).first():
             flash("Имя пользователя уже занято", "error")
             return redirect(url_for("views.register"))
 
@@ -390,6 +479,7 @@ def register():
 
 
 @views.route("/login", methods=["GET", "POST"])
+@rate_limited("auth", methods=("POST",))
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("views.index"))
@@ -399,9 +489,7 @@ def login():
         username_norm = canonical_username(username_raw or "")
 
         # Ищем пользователя без учета регистра и пробелов по краям
-        user = User.query.filter(
-            db.func.lower(db.func.trim(User.username)) == username_norm
-        ).first()
+        user = User.query.filter_by(username_canonical=username_norm).first()
         if user and bcrypt.check_password_hash(user.password, password):
             login_user(user)
             return redirect(url_for("views.index"))
@@ -411,17 +499,26 @@ def login():
 
 
 @views.route("/", methods=["GET", "POST"])
+@read_only(methods=("GET",))
 @login_required
-def index():
+@rate_limited("write", methods=("POST",))
+def index():  # noqa: C901
     if request.method == "POST":
         data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return _json_error("Ожидается JSON-объект")
         action = data.get("action")
 
         try:
             handler = ACTION_HANDLERS.get(action)
             if not handler:
                 return _json_error("Неизвестное действие")
-            return handler(data)
+            return _run_action(handler, data)
+        except VersionConflict as exc:
+            # Изменение не применено: клиент показывает актуальное
+            # состояние вместо того, чтобы затереть чужую правку
+            db.session.rollback()
+            return _version_conflict(exc)
         except Exception:  # noqa: BLE001
             db.session.rollback()
             current_app.logger.exception("Ошибка при обработке запроса")
@@ -430,34 +527,96 @@ def index():
                 "message": "Внутренняя ошибка сервера",
             }), 500
 
-    meal_plans = MealPlanService.get_user_plans(current_user.id)
+    meal_plans = MealPlanService.get_user_plan_summaries(current_user.id)
     selected_plan_id = request.args.get("plan_id")
     if selected_plan_id is not None:
         try:
             selected_plan_id = int(selected_plan_id)
         except Exception:  # noqa: BLE001
             selected_plan_id = None
+    if not selected_plan_id and meal_plans:
+        selected_plan_id = meal_plans[0]["id"]
     selected_plan = (
         MealPlanService.get_plan_by_id(selected_plan_id, current_user.id)
         if selected_plan_id
-        else meal_plans[0]
-        if meal_plans
         else None
     )
 
     if not selected_plan:
         selected_plan = MealPlanService.create_default_plan(current_user.id)
-        meal_plans = [selected_plan]
+        meal_plans = MealPlanService.get_user_plan_summaries(current_user.id)
 
+    # Только заголовки дней: содержимое подгружается через plan_days
     return render_template(
         "index.html",
         meal_plans=meal_plans,
         selected_plan=selected_plan,
+        days=DayService.get_day_summaries(selected_plan.id),
+        days_page_size=DAYS_PAGE_SIZE,
+    )
+
+
+@views.route("/api/plans/<int:plan_id>/days")
+@read_only()
+@login_required
+def plan_days(plan_id):
+    """
+    Страница дней раскладки с отрендеренным содержимым (HTML) для
+    ленивой загрузки на главной странице. Параметры: offset, limit.
+    """
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = int(request.args.get("limit", DAYS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return _json_error("Некорректные параметры страницы", 400)
+    limit = min(max(limit, 1), MAX_DAYS_PAGE_SIZE)
+
+    meal_plan = MealPlanService.get_plan_by_id(plan_id, current_user.id)
+    if not meal_plan:
+        return _json_error("Раскладка не найдена или доступ запрещён", 404)
+
+    def build():
+        days = DayService.get_days_page(plan_id, offset, limit)
+        # Из БД — только содержимое дней, которых нет в кэше фрагментов
+        DayService.load_day_contents([
+            day
+            for day in days
+            if not is_cached(
+                current_app.jinja_env,
+                "index-day", current_user.id, day.id, day.revision,
+            )
+        ])
+        return jsonify({
+            "status": "success",
+            "data": {
+                "offset": offset,
+                "days": [
+                    {
+                        "id": day.id,
+                        "day_number": day.day_number,
+                        "html": render_template(
+                            "partials/day_content.html", day=day
+                        ),
+                    }
+                    for day in days
+                ],
+            },
+        })
+
+    return _conditional_response(
+        _make_etag(
+            "days", current_user.id, plan_id, meal_plan.revision,
+            offset, limit,
+        ),
+        build,
     )
 
 
 @views.route("/api/settings", methods=["GET", "POST"])
+@read_only(methods=("GET",))
+@retry_on_locked
 @login_required
+@rate_limited("write", methods=("POST",))
 def api_settings():  # noqa: C901
     if request.method == "GET":
         plan_id = request.args.get("plan_id")
@@ -476,10 +635,15 @@ def api_settings():  # noqa: C901
         data = SettingsService.get_user_plan_settings(
             current_user.id, plan_id_int
         )
-        return jsonify({"status": "success", "data": data})
+        return _conditional_response(
+            _make_etag("settings", current_user.id, plan_id_int, data),
+            lambda: jsonify({"status": "success", "data": data}),
+        )
 
     # POST
     data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return _json_error("Ожидается JSON-объект")
     plan_id = data.get("plan_id")
     trip_days = data.get("trip_days")
     people_count = data.get("people_count")
@@ -528,12 +692,22 @@ def api_settings():  # noqa: C901
     return jsonify({"status": "success"})
 
 
-@views.route("/calculate", methods=["POST"])
+@views.route("/calculate", methods=["GET", "POST"])
+@read_only()
 @login_required
-def calculate_products():
-    """API endpoint для расчета продуктов на основе раскладки"""
+@rate_limited("calc")
+def calculate_products():  # noqa: C901
+    """
+    API endpoint для расчета продуктов на основе раскладки.
+
+    GET принимает параметры в query string (trip_days и people_count по
+    умолчанию берутся из сохраненных настроек) и отвечает с ETag от
+    ревизии раскладки, настроек и параметров; при совпадении
+    If-None-Match расчет не выполняется.
+    """
     try:
-        data = request.get_json()
+        is_get = request.method == "GET"
+        data = request.args if is_get else request.get_json()
         try:
             plan_id = int(data.get("plan_id"))
         except Exception:  # noqa: BLE001
@@ -543,6 +717,13 @@ def calculate_products():
             }), 400
         trip_days = data.get("trip_days")
         people_count = data.get("people_count")
+        settings = {}
+        if is_get:
+            settings = SettingsService.get_user_plan_settings(
+                current_user.id, plan_id
+            )
+            trip_days = trip_days or settings.get("trip_days")
+            people_count = people_count or settings.get("people_count")
 
         if not all([plan_id, trip_days, people_count]):
             return jsonify(
@@ -571,6 +752,7 @@ def calculate_products():
             return jsonify(
                 {"status": "error", "message": people_count_error}
             ), 400
+        trip_days, people_count = int(trip_days), int(people_count)
 
         # Получаем план питания
         meal_plan = MealPlanService.get_plan_by_id(plan_id, current_user.id)
@@ -584,20 +766,44 @@ def calculate_products():
                 }
             ), 404
 
-        # Выполняем расчет
-        result = CalculationService.calculate_products_from_layout(
-            meal_plan, trip_days, people_count
-        )
-
-        if not result.get("success"):
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": result.get("error", "Ошибка расчета"),
-                }
-            ), 400
+        def calculate():
+            # Одинаковые одновременные запросы считаются один раз
+            result = coalesce(
+                (
+                    "calculate",
+                    current_user.id,
+                    plan_id,
+                    meal_plan.revision,
+                    trip_days,
+                    people_count,
+                ),
+                lambda: CalculationService.calculate_products_from_layout(
+                    meal_plan, trip_days, people_count
+                ),
+            )
 
-        return jsonify({"status": "success", "data": result})
+            if not result.get("success"):
+                return jsonify(
+                    {
+                        "status": "error",
+                        "message": result.get("error", "Ошибка расчета"),
+                    }
+                ), 400
+
+            return jsonify({"status": "success", "data": result})
+
+        if not is_get:
+            return calculate()
+        etag = _make_etag(
+            "calculate",
+            current_user.id,
+            plan_id,
+            meal_plan.revision,
+            settings.get("updated_at"),
+            trip_days,
+            people_count,
+        )
+        return _conditional_response(etag, calculate)
 
     except Exception:  # noqa: BLE001
         current_app.logger.exception("Ошибка при расчете продуктов")
@@ -606,6 +812,73 @@ def calculate_products():
         ), 500
 
 
+def _combined_entries(items):
+    """Проверяет список plans и возвращает [(plan_id, trip_days,
+    people_count)] или текст ошибки"""
+    if not isinstance(items, list) or not items:
+        return None, "Необходимо указать список plans"
+    if len(items) > MAX_COMBINED_PLANS:
+        return None, f"Не более {MAX_COMBINED_PLANS} раскладок в одном расчете"
+    entries = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None, "Некорректный элемент списка plans"
+        try:
+            plan_id = int(item.get("plan_id"))
+        except Exception:  # noqa: BLE001
+            return None, "Некорректный идентификатор раскладки"
+        for field, label in (
+            ("trip_days", "Количество дней похода"),
+            ("people_count", "Количество человек"),
+        ):
+            is_valid, error = validate_positive_integer(item.get(field), label)
+            if not is_valid:
+                return None, error
+        entries.append(
+            (plan_id, int(item["trip_days"]), int(item["people_count"]))
+        )
+    return entries, None
+
+
+@views.route("/calculate/combined", methods=["POST"])
+@read_only()
+@login_required
+@rate_limited("calc")
+def calculate_combined():
+    """
+    Общий список закупки для нескольких раскладок:
+    {"plans": [{"plan_id", "trip_days", "people_count"}, ...]}.
+    Продукты объединяются по каноническому имени, у каждого — разбивка
+    по элементам запроса.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _json_error("Ожидается JSON-объект", 400)
+    entries, error = _combined_entries(data.get("plans"))
+    if error:
+        return _json_error(error, 400)
+
+    try:
+        result = CalculationService.calculate_combined(
+            current_user.id, entries
+        )
+    except Exception:  # noqa: BLE001
+        current_app.logger.exception("Ошибка общего расчета")
+        return _json_error("Внутренняя ошибка сервера", 500)
+    if not result.get("success"):
+        return _json_error(result.get("error", "Ошибка расчета"), 404)
+    return jsonify(
+        {
+            "status": "success",
+            "data": {
+                "results": result["results"],
+                "plans": result["plans"],
+                "summary": result["summary"],
+            },
+        }
+    )
+
+
 @views.route("/day/<int:day_id>/edit")
 @login_required
 def edit_day(day_id):
@@ -626,6 +899,7 @@ def logout():
 
 @views.route("/profile", methods=["GET", "POST"])
 @login_required
+@rate_limited("auth", methods=("POST",))
 def profile():
     if request.method == "POST":
         form_action = request.form.get("action", "change_password")
@@ -681,9 +955,14 @@ def profile():
 
 
 @views.route("/export_excel", methods=["GET"])
+@read_only()
 @login_required
-def export_excel():
+@rate_limited("heavy", concurrency=False)
+def export_excel():  # noqa: C901
     """Экспорт таблицы расчета в Excel"""
+    # openpyxl загружается только при экспорте
+    from raskladka.excel import build_workbook, excel_filename, XLSX_MIMETYPE
+
     try:
         plan_id = request.args.get("plan_id")
         try:
@@ -719,71 +998,152 @@ def export_excel():
         if not meal_plan:
             return _json_error("Раскладка не найдена или доступ запрещён", 404)
 
-        # Рассчитываем данные
-        calc_result = CalculationService.calculate_products_from_layout(
-            meal_plan, trip_days, people_count
-        )
-        if not calc_result.get("success"):
-            return _json_error(
-                calc_result.get("error", "Ошибка расчета"), 400
-            )
-
-        results = calc_result["results"]
-        summary = calc_result["summary"]
-        meal_types_by_day = calc_result["meal_types_by_day"]
-        product_meal_usage = calc_result["product_meal_usage"]
-
-        output = _build_workbook(
-            results,
-            summary,
-            meal_types_by_day,
-            product_meal_usage,
-            trip_days,
-            people_count,
+        def build():
+            # Слот экспорта занимает только тот, кто собирает книгу
+            with concurrency_slot("heavy"):
+                calc_result = (
+                    CalculationService.calculate_products_from_layout(
+                        meal_plan, trip_days, people_count
+                    )
+                )
+                if not calc_result.get("success"):
+                    return None, calc_result.get("error", "Ошибка расчета")
+                output = build_workbook(
+                    calc_result["results"],
+                    calc_result["summary"],
+                    calc_result["meal_types_by_day"],
+                    calc_result["product_meal_usage"],
+                    trip_days,
+                    people_count,
+                )
+            return output.getvalue(), None
+
+        # Повторный клик во время сборки получает ту же книгу и не
+        # упирается в ограничение одновременных экспортов
+        data, error = coalesce(
+            (
+                "export_excel",
+                current_user.id,
+                plan_id,
+                meal_plan.revision,
+                trip_days,
+                people_count,
+            ),
+            build,
         )
-
-        safe_name = meal_plan.name.replace("/", "-").replace("\\", "-")
-        filename = f"{safe_name} - расчет.xlsx"
+        if error:
+            return _json_error(error, 400)
 
         return send_file(
-            output,
+            BytesIO(data),
             as_attachment=True,
-            download_name=filename,
-            mimetype=(
-                "application/"
-                "vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            ),
+            download_name=excel_filename(meal_plan.name),
+            mimetype=XLSX_MIMETYPE,
         )
 
+    except TooManyRequests:
+        raise
     except Exception:  # noqa: BLE001
         current_app.logger.exception("Ошибка при экспорте Excel")
         return _json_error("Внутренняя ошибка сервера", 500)
 
 
-@views.route("/backup/export", methods=["GET"])
+def _export_all_params(data):
+    """
+    Необязательные общие trip_days и people_count для экспорта всех
+    раскладок: либо оба, либо ни одного (тогда у каждой раскладки свои
+    сохраненные настройки).
+    """
+    trip_days = data.get("trip_days")
+    people_count = data.get("people_count")
+    if trip_days in (None, "") and people_count in (None, ""):
+        return {}, None
+    for value, label in (
+        (trip_days, "Количество дней похода"),
+        (people_count, "Количество человек"),
+    ):
+        is_valid, error = validate_positive_integer(value, label)
+        if not is_valid:
+            return None, error
+    params = {"trip_days": int(trip_days), "people_count": int(people_count)}
+    return params, None
+
+
+@views.route("/export_excel/all", methods=["GET"])
+@read_only()
 @login_required
-def backup_export():
-    """Экспорт всех раскладок пользователя в JSON-файл."""
-    try:
-        data = BackupService.export_user_data(current_user.id)
+@rate_limited("heavy", concurrency=False)
+def export_excel_all():
+    """
+    Экспорт всех раскладок в одну книгу: сводный лист закупки и лист
+    расчета на каждую раскладку
+    """
+    from raskladka.excel import (
+        ALL_PLANS_FILENAME,
+        build_user_plans_workbook,
+        XLSX_MIMETYPE,
+    )
 
-        # Подготавливаем отдачу файла
-        output = BytesIO()
-        output.write(
-            json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
-        )
-        output.seek(0)
+    params, error = _export_all_params(request.args)
+    if error:
+        return _json_error(error, 400)
+
+    def build():
+        with concurrency_slot("heavy"):
+            output = build_user_plans_workbook(
+                current_user.id,
+                processes=current_app.config.get("EXPORT_PROCESSES", 1),
+                **params,
+            )
+        return output.getvalue() if output is not None else None
 
-        safe_username = (
-            str(current_user.username).replace("/", "-").replace("\\", "-")
+    try:
+        # Ключ: ревизии всех раскладок и их сохраненные настройки
+        settings = SettingsService.get_user_settings_by_plan(current_user.id)
+        data = coalesce(
+            (
+                "export_excel_all",
+                current_user.id,
+                tuple(sorted(params.items())),
+                tuple(MealPlanService.get_plan_revisions(current_user.id)),
+                tuple(
+                    sorted(
+                        (plan_id, s["trip_days"], s["people_count"])
+                        for plan_id, s in settings.items()
+                    )
+                ),
+            ),
+            build,
         )
-        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        filename = f"raskladka_backup_{safe_username}_{ts}.json"
+    except TooManyRequests:
+        raise
+    except Exception:  # noqa: BLE001
+        current_app.logger.exception("Ошибка при экспорте всех раскладок")
+        return _json_error("Внутренняя ошибка сервера", 500)
+    if data is None:
+        return _json_error("Нет раскладок с продуктами", 400)
+    return send_file(
+        BytesIO(data),
+        as_attachment=True,
+        download_name=ALL_PLANS_FILENAME,
+        mimetype=XLSX_MIMETYPE,
+    )
+
 
+@views.route("/backup/export", methods=["GET"])
+@read_only()
+@login_required
+@rate_limited("heavy")
+def backup_export():
+    """Экспорт всех раскладок пользователя в JSON-файл."""
+    try:
+        output = BytesIO(BackupService.export_user_json(current_user.id))
         return send_file(
             output,
             as_attachment=True,
-            download_name=filename,
+            download_name=BackupService.backup_filename(
+                current_user.username
+            ),
             mimetype="application/json; charset=utf-8",
         )
     except Exception:  # noqa: BLE001
@@ -793,6 +1153,7 @@ def backup_export():
 
 @views.route("/backup/import", methods=["POST"])
 @login_required
+@rate_limited("heavy")
 def backup_import():
     """Импорт раскладок пользователя из загруженного JSON-файла."""
     try:
@@ -828,3 +1189,148 @@ def backup_import():
         current_app.logger.exception("Ошибка при импорте JSON")
         flash("Не удалось импортировать резервную копию")
         return redirect(url_for("views.profile"))
+
+
+def _job_to_dict(job):
+    """Состояние фоновой задачи для клиента"""
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "message": job.message,
+        "url": url_for("views.api_job_status", job_id=job.id),
+    }
+    if job.status == "done":
+        if job.result_name:
+            data["download_url"] = url_for(
+                "views.api_job_download", job_id=job.id
+            )
+        elif job.kind == "backup_import":
+            data["redirect_url"] = url_for(
+                "views.index", import_success="1"
+            )
+    return data
+
+
+def _export_excel_job_params(data):
+    """Проверка параметров экспорта до постановки задачи в очередь"""
+    try:
+        plan_id = int(data.get("plan_id"))
+    except Exception:  # noqa: BLE001
+        return None, "Некорректный идентификатор раскладки"
+    params = {"plan_id": plan_id}
+    for field, label in (
+        ("trip_days", "Количество дней похода"),
+        ("people_count", "Количество человек"),
+    ):
+        value = data.get(field)
+        is_valid, error = validate_positive_integer(value, label)
+        if not is_valid:
+            return None, error
+        params[field] = int(value)
+    meal_plan = MealPlanService.get_plan_by_id(plan_id, current_user.id)
+    if not meal_plan:
+        return None, "Раскладка не найдена или доступ запрещён"
+    # Ревизия в параметрах позволяет отдать повторному запросу уже
+    # выполняющуюся задачу с теми же данными
+    params["revision"] = meal_plan.revision
+    return params, None
+
+
+@views.route("/api/jobs", methods=["POST"])
+@login_required
+@rate_limited("jobs")
+@retry_on_locked
+def api_jobs_submit():  # noqa: C901
+    """
+    Ставит экспорт/импорт в очередь фоновых задач.
+    JSON: {"kind": "export_excel", "plan_id", "trip_days", "people_count"},
+    {"kind": "export_excel_all"} или {"kind": "backup_export"};
+    multipart-форма с kind=backup_import и файлом backup_file.
+    Отвечает 202 с адресом для опроса статуса.
+    """
+    payload = None
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return _json_error("Ожидается JSON-объект")
+    else:
+        data = request.form
+    kind = data.get("kind")
+
+    if kind == "export_excel":
+        params, error = _export_excel_job_params(data)
+        if error:
+            return _json_error(error, 400)
+    elif kind == "export_excel_all":
+        params, error = _export_all_params(data)
+        if error:
+            return _json_error(error, 400)
+    elif kind == "backup_export":
+        params = {}
+    elif kind == "backup_import":
+        file = request.files.get("backup_file")
+        if not file or file.filename == "":
+            return _json_error("Выберите файл для загрузки", 400)
+        payload = file.read()
+        # Синтаксис проверяем сразу, сам импорт выполнит обработчик
+        try:
+            json.loads(payload.decode("utf-8"))
+        except Exception:  # noqa: BLE001
+            return _json_error("Некорректный JSON в файле", 400)
+        params = {"replace": data.get("replace", "on") == "on"}
+    else:
+        return _json_error("Неизвестный тип задачи", 400)
+
+    # Повторный запрос того же экспорта получает уже поставленную задачу
+    job = None
+    if payload is None:
+        job = jobs.find_duplicate(current_user.id, kind, params)
+    if job is None:
+        max_active = current_app.config.get("JOBS_MAX_ACTIVE_PER_USER", 0)
+        if max_active and jobs.active_count(current_user.id) >= max_active:
+            response = _json_error(
+                "Слишком много задач в работе, дождитесь их завершения", 429
+            )
+            response[0].headers["Retry-After"] = "5"
+            return response
+        job = jobs.submit(current_user.id, kind, params, payload=payload)
+    return (
+        jsonify({"status": "success", "data": _job_to_dict(job)}),
+        202,
+        {"Location": url_for("views.api_job_status", job_id=job.id)},
+    )
+
+
+def _get_user_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != current_user.id:
+        return None
+    return job
+
+
+@views.route("/api/jobs/<int:job_id>")
+@login_required
+def api_job_status(job_id):
+    """Статус фоновой задачи (для опроса клиентом)"""
+    job = _get_user_job(job_id)
+    if job is None:
+        return _json_error("Задача не найдена", 404)
+    response = jsonify({"status": "success", "data": _job_to_dict(job)})
+    response.cache_control.no_store = True
+    return response
+
+
+@views.route("/api/jobs/<int:job_id>/download")
+@login_required
+def api_job_download(job_id):
+    """Скачивание результата завершённой задачи"""
+    job = _get_user_job(job_id)
+    if job is None or job.status != "done" or job.result is None:
+        return _json_error("Результат задачи недоступен", 404)
+    return send_file(
+        BytesIO(job.result),
+        as_attachment=True,
+        download_name=job.result_name,
+        mimetype=job.result_mimetype,
+    )
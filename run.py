@@ -1,6 +1,8 @@
 # run.py
 from raskladka import app, init_db
+from raskladka.lifecycle import warm_up
 
 if __name__ == "__main__":
     init_db()
+    warm_up(app)
     app.run(debug=True)
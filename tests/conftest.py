@@ -0,0 +1,88 @@
+"""Test setup: one application on a temporary SQLite file.
+
+The application object is configured from the environment at import time,
+so the environment is prepared before ``raskladka`` is imported.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="raskladka-tests-")
+os.environ["DATABASE_URI"] = f"sqlite:///{_TMP}/meals.db"
+os.environ["SECRET_KEY"] = "tests"
+os.environ["SESSION_COOKIE_SECURE"] = "0"
+os.environ["RATELIMIT_ENABLED"] = "0"
+os.environ["JOBS_WORKER"] = "none"
+os.environ["SNAPSHOT_DIR"] = ""
+os.environ["EXPORT_PROCESSES"] = "1"
+
+from raskladka import app as flask_app, db, init_db  # noqa: E402
+from raskladka.utils import clear_string_caches  # noqa: E402
+
+_usernames = (f"user{n}" for n in itertools.count(1))
+
+
+@pytest.fixture(scope="session")
+def app():
+    flask_app.config["TESTING"] = True
+    init_db()
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def _string_caches():
+    """Every test starts with empty string caches."""
+    clear_string_caches()
+
+
+@pytest.fixture
+def client(app):
+    """Client of a new logged-in user with the default plan created."""
+    client = app.test_client()
+    username = next(_usernames)
+    password = "secret1"
+    client.post(
+        "/register",
+        data={
+            "username": username,
+            "password": password,
+            "confirm_password": password,
+        },
+    )
+    response = client.post(
+        "/login", data={"username": username, "password": password}
+    )
+    assert response.status_code == 302
+    assert client.get("/").status_code == 200
+    client.username = username
+    return client
+
+
+@pytest.fixture
+def session(app):
+    """Database session inside an application context."""
+    with app.app_context():
+        yield db.session
+
+
+@pytest.fixture
+def plan_id(app, client):
+    """Id of the default plan of the client's user."""
+    from raskladka.models import MealPlan, User
+
+    with app.app_context():
+        user = User.query.filter_by(username=client.username).one()
+        return MealPlan.query.filter_by(user_id=user.id).one().id
+
+
+@pytest.fixture
+def action(client):
+    """POST / with an action; returns (status code, JSON body)."""
+
+    def post(**data):
+        response = client.post("/", json=data)
+        return response.status_code, response.get_json()
+
+    return post
@@ -0,0 +1,60 @@
+"""Fingerprinted static assets built by `flask build-assets`."""
+import pytest
+from flask import Flask, render_template_string
+
+from raskladka import assets
+
+CSS = "body { color: #333; }\n" * 50
+
+
+def _app(root):
+    return Flask("assets_test", root_path=str(root))
+
+
+@pytest.fixture
+def built(tmp_path):
+    (tmp_path / "static").mkdir()
+    (tmp_path / "static" / "app.css").write_text(CSS)
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "page.html").write_text(
+        "{{ asset_url('app.css') }}"
+    )
+    manifest = assets.build(_app(tmp_path))
+    app = _app(tmp_path)
+    assets.init_assets(app)
+    return app, manifest
+
+
+def test_asset_url_resolves_to_fingerprinted_file(built):
+    app, manifest = built
+    hashed = manifest["files"]["app.css"]
+    assert hashed.startswith("dist/app.") and hashed != "dist/app.css"
+    with app.test_request_context():
+        url = render_template_string("{{ asset_url('app.css') }}")
+        # Compiled templates are used once the bundle is fresh
+        assert app.jinja_env.get_template("page.html").render() == url
+    assert url == f"/static/{hashed}"
+
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == CSS
+    assert response.headers["Cache-Control"] == (
+        assets.IMMUTABLE_CACHE_CONTROL
+    )
+
+
+def test_source_files_are_not_immutable(built):
+    app, _ = built
+    response = app.test_client().get("/static/app.css")
+    assert response.status_code == 200
+    assert "immutable" not in response.headers.get("Cache-Control", "")
+
+
+def test_stale_bundle_is_ignored(built, tmp_path):
+    (tmp_path / "static" / "app.css").write_text("body {}\n")
+    app = _app(tmp_path)
+    assets.init_assets(app)
+    with app.test_request_context():
+        assert render_template_string(
+            "{{ asset_url('app.css') }}"
+        ) == "/static/app.css"
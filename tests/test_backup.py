@@ -0,0 +1,98 @@
+"""Backup export and import."""
+import json
+import warnings
+from io import BytesIO
+
+import sqlalchemy as sa
+
+from raskladka import db
+from raskladka.models import MealPlan, Product
+from raskladka.services import BackupService
+from raskladka.utils import canonical_product_key
+
+
+def _import(client, backup):
+    return client.post(
+        "/backup/import",
+        data={
+            "backup_file": (BytesIO(json.dumps(backup).encode()), "b.json"),
+            "replace": "on",
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def test_import_retries_locked_database(app, client, monkeypatch):
+    backup = json.loads(client.get("/backup/export").data)
+    original = BackupService._import_plan
+    calls = []
+
+    def locked_once(user_id, plan_data):
+        calls.append(user_id)
+        if len(calls) == 1:
+            raise sa.exc.OperationalError(
+                "INSERT", {}, Exception("database is locked")
+            )
+        return original(user_id, plan_data)
+
+    monkeypatch.setattr(
+        BackupService, "_import_plan", staticmethod(locked_once)
+    )
+    response = _import(client, backup)
+    assert "import_success" in response.location
+    assert len(calls) == 2
+    with app.app_context():
+        assert MealPlan.query.filter_by(user_id=calls[0]).count() == 1
+
+
+def _backup_with(name, weight):
+    return {
+        "meal_plans": [
+            {
+                "name": "Импорт",
+                "days": [
+                    {
+                        "day_number": 1,
+                        "meals": [
+                            {
+                                "meal_type": "Обед",
+                                "products": [
+                                    {"name": name, "weight": weight}
+                                ],
+                            }
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def test_canonical_key_fits_column():
+    name = "ß" * 100 + "ΐ" * 100
+    key = canonical_product_key(name)
+    assert len(key) == Product.canonical_key.type.length
+    assert key == canonical_product_key(name)
+    assert canonical_product_key("ß" * 100) == "ss" * 100
+
+
+def test_replace_import_drops_loaded_plans(app, plan_id):
+    with app.app_context(), warnings.catch_warnings():
+        warnings.simplefilter("error", sa.exc.SAWarning)
+        plan = db.session.get(MealPlan, plan_id)
+        old_days = list(plan.days)
+        old_meals = [meal for day in old_days for meal in day.meals]
+        assert old_meals
+
+        ok, message = BackupService.import_user_data(
+            plan.user_id, _backup_with("Рис", 80), replace=True
+        )
+        assert ok, message
+
+        for obj in [plan, *old_days, *old_meals]:
+            assert obj not in db.session
+        (new_plan,) = MealPlan.query.filter_by(user_id=plan.user_id)
+        assert new_plan.name == "Импорт"
+        assert [
+            p.name for p in new_plan.days[0].meals[0].products
+        ] == ["Рис"]
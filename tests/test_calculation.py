@@ -0,0 +1,111 @@
+"""Calculation engines: the SQL aggregation matches the Python one."""
+import pytest
+from sqlalchemy import select
+
+from raskladka import db
+from raskladka.models import Day, Meal, MealPlan
+from raskladka.services import CalculationService
+
+
+def _meal_ids(plan_id, day_number):
+    return db.session.scalars(
+        select(Meal.id)
+        .join(Day)
+        .where(Day.meal_plan_id == plan_id, Day.day_number == day_number)
+        .order_by(Meal.id)
+    ).all()
+
+
+@pytest.fixture
+def layout(app, plan_id, action):
+    """
+    Day 1: the same product under differently written names, twice in one
+    meal; day 2: an empty meal and a product of day 1; day 3: no meals.
+    """
+    for day_number in (2, 3):
+        action(action="add_day", plan_id=plan_id, day_number=day_number)
+    action(
+        action="add_meal", plan_id=plan_id, day_number=2, meal_type="Обед"
+    )
+    action(
+        action="add_meal", plan_id=plan_id, day_number=2, meal_type="Ужин"
+    )
+    with app.app_context():
+        breakfast, lunch, dinner = _meal_ids(plan_id, 1)
+        day2_lunch, _ = _meal_ids(plan_id, 2)
+        assert not _meal_ids(plan_id, 3)
+    products = [
+        (breakfast, "Гречка", 70),
+        (breakfast, "  гРЕЧКА ", 70),
+        (lunch, "ГРЕЧКА", 70),
+        (lunch, "Сыр", 40),
+        (dinner, "сыр  ", 40),
+        (dinner, "Чай", 2),
+        (day2_lunch, "чай", 2),
+        (day2_lunch, "Сахар", 15),
+    ]
+    for meal_id, name, weight in products:
+        status, body = action(
+            action="add_product", meal_id=meal_id, name=name, weight=weight
+        )
+        assert body["status"] == "success", body
+    return plan_id
+
+
+def _calculate(app, plan_id, engine, trip_days, people_count, monkeypatch):
+    monkeypatch.setitem(app.config, "CALCULATION_ENGINE", engine)
+    with app.app_context():
+        plan = db.session.get(MealPlan, plan_id)
+        return CalculationService.calculate_products_from_layout(
+            plan, trip_days, people_count
+        )
+
+
+@pytest.mark.parametrize(
+    "trip_days, people_count", [(1, 1), (3, 2), (7, 3), (10, 4)]
+)
+def test_sql_engine_matches_python(
+    app, layout, monkeypatch, trip_days, people_count
+):
+    python_result = _calculate(
+        app, layout, "python", trip_days, people_count, monkeypatch
+    )
+    sql_result = _calculate(
+        app, layout, "sql", trip_days, people_count, monkeypatch
+    )
+    assert python_result["success"]
+    assert sql_result == python_result
+    names = [row["name"] for row in python_result["results"]]
+    assert sorted(names) == ["Гречка", "Сахар", "Сыр", "Чай"]
+
+
+def test_engines_agree_on_plan_without_products(
+    app, plan_id, monkeypatch
+):
+    results = [
+        _calculate(app, plan_id, engine, 3, 2, monkeypatch)
+        for engine in ("python", "sql")
+    ]
+    assert results[0] == results[1]
+    assert not results[0]["success"]
+
+
+@pytest.mark.parametrize(
+    "url", ["/calculate/combined", "/", "/api/settings", "/api/jobs"]
+)
+@pytest.mark.parametrize("body", [[1], "plans", 5])
+def test_non_object_json_body_is_rejected(client, url, body):
+    response = client.post(url, json=body)
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_combined_accepts_object_body(client, layout):
+    response = client.post(
+        "/calculate/combined",
+        json={
+            "plans": [{"plan_id": layout, "trip_days": 3, "people_count": 2}]
+        },
+    )
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "success"
@@ -0,0 +1,135 @@
+"""Product.canonical_key: computed on write, backfilled, used by import."""
+import importlib.util
+import os
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import select
+
+from raskladka import db
+from raskladka.models import Day, Meal, MealPlan, Product
+from raskladka.services import BackupService
+from raskladka.utils import canonical_product_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NAMES = ["  пШено  крупа ", "Straße", "ГРЕЧКА", "чай\tчёрный", "ß" * 100]
+
+
+def _load_migration(name):
+    path = os.path.join(ROOT, "migrations", "versions", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def meal_id(app, plan_id):
+    with app.app_context():
+        return db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).first()
+
+
+def _product(app, meal_id, name):
+    with app.app_context():
+        return db.session.scalars(
+            select(Product).where(
+                Product.meal_id == meal_id, Product.name == name
+            )
+        ).one()
+
+
+def test_key_is_computed_on_write(app, action, meal_id):
+    action(action="add_product", meal_id=meal_id, name="  пШено ", weight=5)
+    product = _product(app, meal_id, "Пшено")
+    assert product.canonical_key == "пшено"
+
+    status, body = action(
+        action="update_product",
+        product_id=product.id,
+        name="Straße  Mix",
+        weight=5,
+    )
+    assert body["status"] == "success", body
+    assert _product(app, meal_id, "Straße mix").canonical_key == (
+        "strasse mix"
+    )
+
+
+def test_backfill_matches_application_keys():
+    migration = _load_migration("0003_product_canonical_key")
+    engine = sa.create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                "CREATE TABLE product (id INTEGER PRIMARY KEY,"
+                " meal_id INTEGER, name VARCHAR(100), weight INTEGER)"
+            )
+        )
+        conn.execute(
+            sa.text("INSERT INTO product (name, weight) VALUES (:n, 1)"),
+            [{"n": name} for name in NAMES],
+        )
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.upgrade()
+        keys = conn.execute(
+            sa.text("SELECT name, canonical_key FROM product ORDER BY id")
+        ).all()
+        columns = {
+            column["name"]: column
+            for column in sa.inspect(conn).get_columns("product")
+        }
+
+    assert keys == [(name, canonical_product_key(name)) for name in NAMES]
+    length = Product.canonical_key.type.length
+    assert columns["canonical_key"]["type"].length == length
+    assert not columns["canonical_key"]["nullable"]
+
+
+def _backup(products):
+    return {
+        "meal_plans": [
+            {
+                "name": "Импорт",
+                "days": [
+                    {
+                        "day_number": 1,
+                        "meals": [
+                            {
+                                "meal_type": "Обед",
+                                "products": [
+                                    {"name": name, "weight": weight}
+                                    for name, weight in products
+                                ],
+                            }
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def test_import_conflicts_use_first_existing_weight(app, action, meal_id):
+    for name, weight in [("Сыр", 40), ("сыр ", 30), ("Чай", 2)]:
+        action(action="add_product", meal_id=meal_id, name=name, weight=weight)
+    with app.app_context():
+        user_id = db.session.get(Meal, meal_id).day.meal_plan.user_id
+        assert BackupService._build_existing_weight_by_key(
+            user_id, ["сыр", "соль"]
+        ) == {"сыр": 40}
+
+        ok, message = BackupService.import_user_data(
+            user_id, _backup([("СЫР", 30), ("Соль", 5)]), replace=False
+        )
+        assert not ok
+        assert "'Сыр' имеет вес 40г" in message
+
+        ok, message = BackupService.import_user_data(
+            user_id, _backup([("СЫР", 40), ("Соль", 5)]), replace=False
+        )
+        assert ok, message
+        assert MealPlan.query.filter_by(user_id=user_id).count() == 2
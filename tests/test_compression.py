@@ -0,0 +1,60 @@
+"""Gzip responses and precompressed static files."""
+import gzip
+
+from flask import Flask
+
+from raskladka.compression import init_compression
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def test_html_is_gzipped_when_accepted(client):
+    plain = client.get("/")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    response = client.get("/", headers=GZIP)
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = gzip.decompress(response.data)
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert body.rstrip().endswith(b"</html>")
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get("/health", headers=GZIP)
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+
+
+def test_compressed_etag_is_weak(client, plan_id):
+    url = f"/api/plans/{plan_id}/days?offset=0&limit=5"
+    etag = client.get(url).headers["ETag"]
+    response = client.get(url, headers=GZIP)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f"W/{etag}"
+    # The weak form revalidates as well
+    again = client.get(
+        url, headers={**GZIP, "If-None-Match": response.headers["ETag"]}
+    )
+    assert again.status_code == 304
+
+
+def test_precompressed_static_variant(tmp_path):
+    css = b"body { color: #333; }\n" * 50
+    (tmp_path / "static").mkdir()
+    (tmp_path / "static" / "app.css").write_bytes(css)
+    (tmp_path / "static" / "app.css.gz").write_bytes(gzip.compress(css))
+    app = Flask("compression_test", root_path=str(tmp_path))
+    init_compression(app)
+    client = app.test_client()
+
+    response = client.get("/static/app.css", headers=GZIP)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "text/css"
+    assert gzip.decompress(response.data) == css
+
+    response = client.get("/static/app.css")
+    assert "Content-Encoding" not in response.headers
+    assert response.data == css
@@ -0,0 +1,78 @@
+"""Conditional GET: ETag and 304 for settings and calculation."""
+import pytest
+from sqlalchemy import select
+
+from raskladka import db
+from raskladka.models import Day, Meal
+from raskladka.services import CalculationService
+
+
+@pytest.fixture
+def meal_id(app, plan_id, action):
+    with app.app_context():
+        meal_id = db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).first()
+    action(action="add_product", meal_id=meal_id, name="Рис", weight=80)
+    return meal_id
+
+
+def test_calculation_revalidates_until_plan_edit(
+    client, plan_id, meal_id, action, monkeypatch
+):
+    url = f"/calculate?plan_id={plan_id}&trip_days=3&people_count=2"
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.cache_control.private and first.cache_control.no_cache
+
+    calls = []
+    original = CalculationService.calculate_products_from_layout
+
+    def counted(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(
+        CalculationService, "calculate_products_from_layout", counted
+    )
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert cached.headers["ETag"] == etag
+    assert calls == []
+
+    action(action="add_product", meal_id=meal_id, name="Сыр", weight=40)
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(calls) == 1
+    names = [row["name"] for row in changed.get_json()["data"]["results"]]
+    assert "Сыр" in names
+
+
+def test_settings_revalidate_until_saved(client, plan_id):
+    url = f"/api/settings?plan_id={plan_id}"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(
+        url, headers={"If-None-Match": etag}
+    ).status_code == 304
+
+    saved = client.post(
+        "/api/settings",
+        json={"plan_id": plan_id, "trip_days": 9, "people_count": 4},
+    )
+    assert saved.get_json()["status"] == "success"
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["data"]["trip_days"] == 9
+
+
+def test_other_plan_etag_does_not_match(client, plan_id, meal_id, action):
+    url = "/calculate?plan_id={}&trip_days=3&people_count=2"
+    etag = client.get(url.format(plan_id)).headers["ETag"]
+    status, body = action(action="duplicate_plan", plan_id=plan_id)
+    response = client.get(
+        url.format(body["plan_id"]), headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
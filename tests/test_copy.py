@@ -0,0 +1,197 @@
+"""Copying plans and days."""
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+from raskladka import db
+from raskladka.models import Day, Meal, MealPlan, Product
+
+
+def _layout(plan_id):
+    """[(day_number, [(meal_type, [(name, weight)])])] of the plan."""
+    plan = db.session.get(MealPlan, plan_id)
+    return [
+        (
+            day.day_number,
+            [
+                (
+                    meal.meal_type,
+                    [(p.name, p.weight) for p in meal.products],
+                )
+                for meal in day.meals
+            ],
+        )
+        for day in plan.days
+    ]
+
+
+def _max_ids():
+    return [
+        db.session.execute(select(func.max(model.id))).scalar()
+        for model in (Day, Meal, Product)
+    ]
+
+
+@pytest.fixture
+def filled_plan(app, plan_id, action):
+    """Plan of two days with products and id gaps from deletions."""
+    action(action="add_day", plan_id=plan_id, day_number=2)
+    with app.app_context():
+        meal_ids = db.session.scalars(
+            select(Meal.id)
+            .join(Day)
+            .where(Day.meal_plan_id == plan_id, Day.day_number == 1)
+        ).all()
+    for i, meal_id in enumerate(meal_ids):
+        for j in range(3):
+            action(
+                action="add_product",
+                meal_id=meal_id,
+                name=f"Продукт {i}{j}",
+                weight=10 + j,
+            )
+    with app.app_context():
+        doomed = db.session.scalars(
+            select(Product.id).where(Product.meal_id == meal_ids[0])
+        ).all()[:2]
+    for product_id in doomed:
+        action(action="delete_product", product_id=product_id)
+    return plan_id
+
+
+def test_duplicate_plan_copies_layout_with_dense_ids(
+    app, action, filled_plan
+):
+    with app.app_context():
+        before = _max_ids()
+        layout = _layout(filled_plan)
+    status, body = action(action="duplicate_plan", plan_id=filled_plan)
+    assert body["status"] == "success"
+    with app.app_context():
+        assert _layout(body["plan_id"]) == layout
+        meals = sum(len(meals) for _, meals in layout)
+        products = sum(
+            len(products) for _, meals in layout for _, products in meals
+        )
+        assert _max_ids() == [
+            before[0] + len(layout),
+            before[1] + meals,
+            before[2] + products,
+        ]
+
+
+def test_duplicate_plan_day_range(app, action, filled_plan):
+    status, body = action(
+        action="duplicate_plan", plan_id=filled_plan, day_from=2, day_to=2
+    )
+    with app.app_context():
+        source = _layout(filled_plan)
+        assert _layout(body["plan_id"]) == [(1, source[1][1])]
+
+
+def test_duplicate_day_inserts_copies(app, action, filled_plan):
+    with app.app_context():
+        before = _max_ids()
+        source_day = _layout(filled_plan)[0]
+    status, body = action(
+        action="duplicate_day",
+        plan_id=filled_plan,
+        day_number=1,
+        position_from=2,
+        position_to=4,
+    )
+    assert body["status"] == "success"
+    with app.app_context():
+        layout = _layout(filled_plan)
+        assert [number for number, _ in layout] == [1, 2, 3, 4, 5]
+        for number in (2, 3, 4):
+            assert layout[number - 1][1] == source_day[1]
+        products = sum(len(products) for _, products in source_day[1])
+        assert _max_ids() == [
+            before[0] + 3,
+            before[1] + 3 * len(source_day[1]),
+            before[2] + 3 * products,
+        ]
+
+
+def test_fill_empty_days(app, action, filled_plan):
+    action(action="add_day", plan_id=filled_plan, day_number=3)
+    status, body = action(
+        action="fill_empty_days", plan_id=filled_plan, template_day_number=1
+    )
+    assert body["status"] == "success"
+    with app.app_context():
+        layout = _layout(filled_plan)
+        # Day 2 already had meals, day 3 was empty
+        assert layout[2][1] == layout[0][1]
+
+
+def _plan_with_products(app, action, count):
+    """New plan: day 1 with two meals and count products, day 2 empty."""
+    action(action="create_plan", name="Копии")
+    with app.app_context():
+        plan_id = db.session.scalars(
+            select(MealPlan.id).order_by(MealPlan.id.desc())
+        ).first()
+    for day_number in (1, 2):
+        action(action="add_day", plan_id=plan_id, day_number=day_number)
+    for meal_type in ("Завтрак", "Ужин"):
+        action(
+            action="add_meal",
+            plan_id=plan_id,
+            day_number=1,
+            meal_type=meal_type,
+        )
+    with app.app_context():
+        meal_ids = db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).all()
+    for n in range(count):
+        action(
+            action="add_product",
+            meal_id=meal_ids[n % len(meal_ids)],
+            name=f"Продукт {n}",
+            weight=n + 1,
+        )
+    return plan_id
+
+
+def _statement_count(post, **data):
+    statements = []
+
+    def record(conn, cursor, statement, *args):  # noqa: ARG001
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        status, body = post(**data)
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert body["status"] == "success", body
+    # Products are copied by INSERT ... SELECT, never read into Python
+    reads = [
+        s for s in statements
+        if s.lstrip().upper().startswith("SELECT") and "FROM product" in s
+    ]
+    assert reads == []
+    return len(statements)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"action": "duplicate_plan"},
+        {
+            "action": "duplicate_day",
+            "day_number": 1,
+            "position_from": 2,
+            "position_to": 3,
+        },
+        {"action": "fill_empty_days", "template_day_number": 1},
+    ],
+    ids=lambda data: data["action"],
+)
+def test_copy_statement_count_does_not_grow(app, client, action, data):
+    plans = [_plan_with_products(app, action, n) for n in (2, 40)]
+    counts = [_statement_count(action, plan_id=p, **data) for p in plans]
+    assert counts[0] == counts[1]
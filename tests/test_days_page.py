@@ -0,0 +1,55 @@
+"""Lazy-loaded day pages and the fragment cache."""
+import contextlib
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@contextlib.contextmanager
+def _statements():
+    statements = []
+
+    def record(conn, cursor, statement, *args):  # noqa: ARG001
+        statements.append(" ".join(statement.lower().split()))
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+
+def _content_queries(statements):
+    return [
+        s for s in statements if "from meal " in s or "from product " in s
+    ]
+
+
+@pytest.fixture
+def plan(plan_id, action):
+    for day_number in range(2, 6):
+        action(
+            action="duplicate_day",
+            plan_id=plan_id,
+            day_number=1,
+            position_from=day_number,
+            position_to=day_number,
+        )
+    return plan_id
+
+
+def test_cached_days_do_not_load_contents(app, client, plan):
+    url = f"/api/plans/{plan}/days?offset=0&limit=5"
+    app.jinja_env.fragment_cache.clear()
+
+    with _statements() as statements:
+        first = client.get(url).get_json()
+    assert len(first["data"]["days"]) == 5
+    # Meals and products of all five days: one query each
+    assert len(_content_queries(statements)) == 2
+
+    with _statements() as statements:
+        second = client.get(url).get_json()
+    assert second == first
+    assert _content_queries(statements) == []
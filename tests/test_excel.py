@@ -0,0 +1,41 @@
+"""Excel export of all plans through the shared process pool."""
+from openpyxl import load_workbook
+
+from raskladka import db, excel
+from raskladka.models import MealPlan
+
+
+def _sheets(output):
+    workbook = load_workbook(output)
+    return {
+        ws.title: [list(row) for row in ws.iter_rows(values_only=True)]
+        for ws in workbook.worksheets
+    }
+
+
+def test_parallel_export_matches_serial(app, client, plan_id, action):
+    status, body = action(action="duplicate_plan", plan_id=plan_id)
+    with app.app_context():
+        user_id = db.session.get(MealPlan, plan_id).user_id
+        meal_ids = [
+            meal.id
+            for plan in MealPlan.query.filter_by(user_id=user_id)
+            for meal in plan.days[0].meals
+        ]
+    for weight, meal_id in enumerate(meal_ids, start=10):
+        action(
+            action="add_product", meal_id=meal_id, name=f"П{weight}",
+            weight=weight,
+        )
+
+    with app.app_context():
+        serial = excel.build_user_plans_workbook(user_id, processes=1)
+        parallel = excel.build_user_plans_workbook(user_id, processes=2)
+        pool = excel._pool
+        again = excel.build_user_plans_workbook(user_id, processes=2)
+
+    assert _sheets(parallel) == _sheets(serial)
+    assert _sheets(again) == _sheets(serial)
+    # One long-lived pool, not started by fork
+    assert excel._pool is pool
+    assert pool._mp_context.get_start_method() != "fork"
@@ -0,0 +1,71 @@
+"""Mutations sent with an Idempotency-Key header."""
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from raskladka import db
+from raskladka.models import Day, IdempotencyKey, Meal
+from raskladka.views import ACTION_HANDLERS, _json_error
+
+
+def _post(client, key, **data):
+    return client.post("/", json=data, headers={"Idempotency-Key": key})
+
+
+def _stored(app, key):
+    with app.app_context():
+        record = db.session.scalars(
+            select(IdempotencyKey).where(IdempotencyKey.key == key)
+        ).one_or_none()
+        return None if record is None else record.status_code
+
+
+@pytest.fixture
+def meal_id(app, plan_id):
+    with app.app_context():
+        return db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).first()
+
+
+def test_retry_replays_stored_response(app, client, meal_id):
+    key = uuid.uuid4().hex
+    data = dict(action="add_product", meal_id=meal_id, name="Рис", weight=80)
+    first = _post(client, key, **data)
+    assert first.status_code == 200
+    again = _post(client, key, **data)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json() == first.get_json()
+    with app.app_context():
+        meal = db.session.get(Meal, meal_id)
+        assert [p.name for p in meal.products].count("Рис") == 1
+
+
+def test_version_conflict_is_stored(app, client, meal_id):
+    key = uuid.uuid4().hex
+    data = dict(action="remove_meal", meal_id=meal_id, version=999)
+    first = _post(client, key, **data)
+    assert first.status_code == 409
+    assert first.get_json()["conflict"]
+    assert _stored(app, key) == 409
+
+    again = _post(client, key, **data)
+    assert again.status_code == 409
+    assert again.headers["Idempotent-Replayed"] == "true"
+    with app.app_context():
+        assert db.session.get(Meal, meal_id) is not None
+
+
+def test_key_survives_handler_rollback(app, client, monkeypatch):
+    def rolled_back(data):
+        db.session.rollback()
+        return _json_error("Отказано")
+
+    monkeypatch.setitem(ACTION_HANDLERS, "rolled_back", rolled_back)
+    key = uuid.uuid4().hex
+    first = _post(client, key, action="rolled_back")
+    assert first.status_code == 400
+    assert _stored(app, key) == 400
+    again = _post(client, key, action="rolled_back")
+    assert again.headers["Idempotent-Replayed"] == "true"
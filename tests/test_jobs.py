@@ -0,0 +1,129 @@
+"""Background jobs on SQLite, processed by an in-process worker."""
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from raskladka import db, jobs
+from raskladka.models import Job
+
+
+def _submit(client, **body):
+    response = client.post("/api/jobs", json=body)
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()["data"]
+
+
+def _status(client, job):
+    return client.get(job["url"]).get_json()["data"]
+
+
+def test_export_job_runs_and_downloads(app, client, plan_id):
+    job = _submit(client, kind="backup_export")
+    assert _status(client, job)["status"] == "queued"
+
+    with app.app_context():
+        assert jobs.work_off() == 1
+
+    status = _status(client, job)
+    assert status["status"] == "done"
+    download = client.get(status["download_url"])
+    assert download.status_code == 200
+    assert b'"meal_plans"' in download.data
+
+
+def test_status_poll_does_not_read_blobs(app, client, plan_id):
+    job = _submit(client, kind="backup_export")
+    with app.app_context():
+        jobs.work_off()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):  # noqa: ARG001
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        assert _status(client, job)["status"] == "done"
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    job_selects = [s for s in statements if "FROM job" in s]
+    assert job_selects
+    for statement in job_selects:
+        assert not re.search(r"job\.(result|payload)\b(?!_)", statement)
+
+
+def _running_job(app, started_ago, heartbeat_ago):
+    now = datetime.utcnow()
+    with app.app_context():
+        job = Job(
+            user_id=1,
+            kind="backup_export",
+            status="running",
+            params={},
+            attempts=1,
+            started_at=now - timedelta(seconds=started_ago),
+            heartbeat_at=now - timedelta(seconds=heartbeat_ago),
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def _job_status(app, job_id):
+    with app.app_context():
+        return db.session.get(Job, job_id).status
+
+
+def test_requeue_stale_uses_heartbeat(app, client):
+    alive = _running_job(app, started_ago=3600, heartbeat_ago=5)
+    crashed = _running_job(app, started_ago=3600, heartbeat_ago=3600)
+    with app.app_context():
+        jobs.requeue_stale(stale_seconds=600, max_attempts=2)
+    assert _job_status(app, alive) == "running"
+    assert _job_status(app, crashed) == "queued"
+    with app.app_context():
+        db.session.query(Job).filter(Job.id.in_([alive, crashed])).delete()
+        db.session.commit()
+
+
+def test_long_job_keeps_heartbeat(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "JOBS_HEARTBEAT_SECONDS", 0.05)
+    release = threading.Event()
+    beats = []
+
+    def slow(job):
+        release.wait(5)
+        return jobs.JobResult(message="ok")
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "slow", slow)
+    original = jobs.heartbeat
+
+    def counted(job_id):
+        beats.append(job_id)
+        original(job_id)
+
+    monkeypatch.setattr(jobs, "heartbeat", counted)
+    with app.app_context():
+        job = Job(user_id=1, kind="slow", params={})
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+    def work():
+        with app.app_context():
+            jobs.work_off(max_jobs=1)
+
+    worker = threading.Thread(target=work)
+    worker.start()
+    time.sleep(0.3)
+    with app.app_context():
+        jobs.requeue_stale(stale_seconds=0.2, max_attempts=2)
+    assert _job_status(app, job_id) == "running"
+    release.set()
+    worker.join(5)
+    assert beats and set(beats) == {job_id}
+    assert _job_status(app, job_id) == "done"
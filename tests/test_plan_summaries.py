@@ -0,0 +1,75 @@
+"""Plan list summaries from one aggregate query."""
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+
+from raskladka import db
+from raskladka.models import Day, Meal, MealPlan
+from raskladka.services import MealPlanService
+
+
+def _expected(user_id):
+    """The same figures counted over ORM objects, plan by plan."""
+    summaries = []
+    for plan in MealPlan.query.filter_by(user_id=user_id).order_by(
+        MealPlan.id
+    ):
+        products = [
+            product
+            for day in plan.days
+            for meal in day.meals
+            for product in meal.products
+        ]
+        summaries.append(
+            {
+                "id": plan.id,
+                "name": plan.name,
+                "created_at": plan.created_at,
+                "days_count": len(plan.days),
+                "products_count": len(products),
+                "total_weight": sum(p.weight for p in products),
+            }
+        )
+    return summaries
+
+
+def test_summaries_match_plan_data(app, plan_id, action):
+    action(action="add_day", plan_id=plan_id, day_number=2)
+    with app.app_context():
+        meal_ids = db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).all()
+        user_id = db.session.get(MealPlan, plan_id).user_id
+    for n, meal_id in enumerate(meal_ids[:2] * 2):
+        action(
+            action="add_product",
+            meal_id=meal_id,
+            name=f"Продукт {n}",
+            weight=10 * (n + 1),
+        )
+    action(action="duplicate_plan", plan_id=plan_id, day_from=1, day_to=1)
+    action(action="create_plan", name="Пустая")
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):  # noqa: ARG001
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            summaries = MealPlanService.get_user_plan_summaries(user_id)
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+        expected = _expected(user_id)
+
+    assert len(statements) == 1
+    assert summaries == expected
+    assert [s["days_count"] for s in summaries] == [2, 1, 0]
+    assert summaries[0]["total_weight"] == 100
+    assert summaries[2]["products_count"] == 0
+
+
+def test_plan_list_page_shows_every_plan(client, plan_id, action):
+    action(action="create_plan", name="Вторая раскладка")
+    page = client.get("/").get_data(as_text=True)
+    assert "Вторая раскладка" in page
@@ -0,0 +1,65 @@
+"""Rate limits and concurrency caps of expensive endpoints."""
+import pytest
+from werkzeug.exceptions import TooManyRequests
+
+from raskladka.ratelimit import (
+    EXTENSION_KEY,
+    MemoryRateStore,
+    RATE_LIMITS,
+    RateLimit,
+    RateLimiter,
+    concurrency_slot,
+    rate_limited,
+)
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    limits = dict(RATE_LIMITS, heavy=RateLimit(rate=1, burst=3, concurrency=1))
+    limiter = RateLimiter(MemoryRateStore(), limits)
+    monkeypatch.setitem(app.extensions, EXTENSION_KEY, limiter)
+    return limiter
+
+
+def test_concurrency_slot_is_exclusive(app, limited):
+    with app.test_request_context():
+        with concurrency_slot("heavy"):
+            with pytest.raises(TooManyRequests) as exc:
+                with concurrency_slot("heavy"):
+                    pass
+            assert exc.value.retry_after >= 1
+        # Released at the end of the block
+        with concurrency_slot("heavy"):
+            pass
+
+
+def test_view_holds_slot_unless_concurrency_off(app, limited):
+    @rate_limited("heavy")
+    def holding():
+        with concurrency_slot("heavy"):
+            return "inner"
+
+    @rate_limited("heavy", concurrency=False)
+    def deferred():
+        with concurrency_slot("heavy"):
+            return "inner"
+
+    with app.test_request_context():
+        with pytest.raises(TooManyRequests):
+            holding()
+        assert deferred() == "inner"
+
+
+def test_rate_is_checked_without_slot(app, limited):
+    @rate_limited("heavy", concurrency=False)
+    def view():
+        return "ok"
+
+    with app.test_request_context():
+        with concurrency_slot("heavy"):
+            # The slot is taken, but the view does not need one
+            assert [view() for _ in range(2)] == ["ok", "ok"]
+        # Burst of 3 tokens: one left from the calls above
+        assert view() == "ok"
+        with pytest.raises(TooManyRequests):
+            view()
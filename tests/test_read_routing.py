@@ -0,0 +1,84 @@
+"""Read/write routing with a second SQLite database as the replica."""
+import time
+
+import pytest
+import sqlalchemy as sa
+
+from raskladka import db
+from raskladka.database import READ_BIND_KEY
+from raskladka.models import MealPlan, User
+
+REPLICA_NAME = "План с реплики"
+
+
+@pytest.fixture
+def replica(app, client, plan_id, tmp_path, monkeypatch):
+    """Replica with the user and the plan under another name."""
+    engine = sa.create_engine(f"sqlite:///{tmp_path}/replica.db")
+    db.metadata.create_all(engine)
+    with app.app_context():
+        user_id = User.query.filter_by(username=client.username).one().id
+        rows = [
+            (table, dict(db.session.execute(
+                sa.select(table).where(table.c.id == row_id)
+            ).mappings().one()))
+            for table, row_id in (
+                (User.__table__, user_id),
+                (MealPlan.__table__, plan_id),
+            )
+        ]
+        rows[1][1]["name"] = REPLICA_NAME
+        with engine.begin() as conn:
+            for table, row in rows:
+                conn.execute(sa.insert(table).values(**row))
+        monkeypatch.setitem(db.engines, READ_BIND_KEY, engine)
+    monkeypatch.setitem(app.config, "DB_REPLICA_STICKY_SECONDS", 5)
+    yield engine
+    engine.dispose()
+
+
+def _replica_name(engine, plan_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(MealPlan.name).where(MealPlan.id == plan_id)
+        ).scalar()
+
+
+def test_read_only_request_uses_replica(client, replica):
+    assert REPLICA_NAME in client.get("/").get_data(as_text=True)
+
+
+def test_writes_go_to_primary_and_stick(app, client, replica, plan_id):
+    response = client.post(
+        "/",
+        json={
+            "action": "update_plan_name",
+            "plan_id": plan_id,
+            "new_name": "Новое имя",
+        },
+    )
+    assert response.get_json()["status"] == "success"
+    assert _replica_name(replica, plan_id) == REPLICA_NAME
+    with app.app_context():
+        assert db.session.get(MealPlan, plan_id).name == "Новое имя"
+
+    # Read-your-writes: the user's next reads come from the primary
+    page = client.get("/").get_data(as_text=True)
+    assert "Новое имя" in page
+    assert REPLICA_NAME not in page
+
+
+def test_reads_return_to_replica_after_sticky_window(
+    app, client, replica, plan_id, monkeypatch
+):
+    client.post(
+        "/",
+        json={
+            "action": "update_plan_name",
+            "plan_id": plan_id,
+            "new_name": "Новое имя",
+        },
+    )
+    monkeypatch.setitem(app.config, "DB_REPLICA_STICKY_SECONDS", 0.01)
+    time.sleep(0.02)
+    assert REPLICA_NAME in client.get("/").get_data(as_text=True)
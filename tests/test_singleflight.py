@@ -0,0 +1,83 @@
+"""Single-flight coalescing of identical exports."""
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+from raskladka import db, excel
+from raskladka.models import Day, Meal
+from raskladka.ratelimit import (
+    EXTENSION_KEY,
+    MemoryRateStore,
+    RATE_LIMITS,
+    RateLimiter,
+)
+from raskladka.singleflight import EXTENSION_KEY as FLIGHT_KEY
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    limiter = RateLimiter(MemoryRateStore(), dict(RATE_LIMITS))
+    monkeypatch.setitem(app.extensions, EXTENSION_KEY, limiter)
+    return limiter
+
+
+@pytest.fixture
+def blocked_export(monkeypatch):
+    """Excel export that waits until ``release`` is set."""
+    started = threading.Event()
+    release = threading.Event()
+    original = excel.build_workbook
+
+    def build_workbook(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(excel, "build_workbook", build_workbook)
+    return started, release
+
+
+def _wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_identical_export_shares_the_slot(
+    app, client, plan_id, action, limited, blocked_export
+):
+    with app.app_context():
+        meal_id = db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan_id)
+        ).first()
+    action(action="add_product", meal_id=meal_id, name="Рис", weight=80)
+    url = f"/export_excel?plan_id={plan_id}&trip_days=3&people_count=2"
+    flight = app.extensions[FLIGHT_KEY]
+    shared = flight.stats()["shared"]
+    started, release = blocked_export
+    responses = []
+
+    def export():
+        responses.append(client.get(url))
+
+    threads = [threading.Thread(target=export) for _ in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    _wait_for(lambda: flight.stats()["shared"] == shared + 1)
+
+    # The slot is held by the leader: another export is turned away
+    other = client.get(url.replace("people_count=2", "people_count=3"))
+    assert other.status_code == 429
+    assert other.headers["Retry-After"]
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].data == responses[1].data
+    # The slot is free again
+    assert client.get(url).status_code == 200
@@ -0,0 +1,138 @@
+"""Plan snapshots: binary format and the snapshot file cache."""
+import os
+
+import pytest
+from sqlalchemy import select
+
+from raskladka import db
+from raskladka.fragment_cache import LRUCache
+from raskladka.models import Day, Meal, MealPlan
+from raskladka.services import CalculationService
+from raskladka.snapshot import (
+    EXTENSION_KEY,
+    FILES_EXTENSION_KEY,
+    PlanSnapshot,
+    SnapshotFileCache,
+    SnapshotFormatError,
+    dumps,
+    load_plan_snapshot,
+    loads,
+)
+
+
+def _fields(snapshot):
+    values = {}
+    for name in PlanSnapshot.__slots__:
+        value = getattr(snapshot, name)
+        values[name] = value if isinstance(value, (int, str)) else list(value)
+    return values
+
+
+@pytest.fixture
+def plan(app, plan_id, action):
+    action(action="add_day", plan_id=plan_id, day_number=2)
+    with app.app_context():
+        meal_ids = db.session.scalars(
+            select(Meal.id)
+            .join(Day)
+            .where(Day.meal_plan_id == plan_id)
+            .order_by(Meal.id)
+        ).all()
+    for meal_id, name, weight in [
+        (meal_ids[0], "Гречка", 70),
+        (meal_ids[0], "Чай", 2),
+        (meal_ids[2], "гречка", 70),
+    ]:
+        action(action="add_product", meal_id=meal_id, name=name, weight=weight)
+    return plan_id
+
+
+@pytest.fixture
+def files(app, tmp_path, monkeypatch):
+    cache = SnapshotFileCache(str(tmp_path))
+    monkeypatch.setitem(app.extensions, FILES_EXTENSION_KEY, cache)
+    monkeypatch.setitem(app.extensions, EXTENSION_KEY, LRUCache(16))
+    return tmp_path
+
+
+def _snapshot(app, plan_id):
+    with app.app_context():
+        return load_plan_snapshot(db.session.get(MealPlan, plan_id))
+
+
+def test_dumps_loads_round_trip(app, plan):
+    snapshot = _snapshot(app, plan)
+    assert len(snapshot) == 3 and snapshot.days_count == 2
+    data = dumps(snapshot)
+    for buffer in (data, bytearray(data), memoryview(data)):
+        assert _fields(loads(buffer)) == _fields(snapshot)
+    assert dumps(loads(data)) == data
+    assert CalculationService.calculate_snapshot(
+        data, 3, 2
+    ) == CalculationService.calculate_snapshot(snapshot, 3, 2)
+
+
+@pytest.mark.parametrize(
+    "corrupt", [lambda d: b"XXXX" + d[4:], lambda d: d[:10], lambda d: b""]
+)
+def test_loads_rejects_bad_buffers(app, plan, corrupt):
+    with pytest.raises(SnapshotFormatError):
+        loads(corrupt(dumps(_snapshot(app, plan))))
+
+
+def _snap_files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_plan_edit_replaces_snapshot_file(app, plan, action, files):
+    first = _snapshot(app, plan)
+    assert _snap_files(files) == [f"{plan}-{first.revision}.snap"]
+
+    with app.app_context():
+        meal_id = db.session.scalars(
+            select(Meal.id).join(Day).where(Day.meal_plan_id == plan)
+        ).first()
+    action(action="add_product", meal_id=meal_id, name="Сыр", weight=40)
+    second = _snapshot(app, plan)
+
+    assert second.revision != first.revision
+    assert len(second) == len(first) + 1
+    # The file of the old revision is gone
+    assert _snap_files(files) == [f"{plan}-{second.revision}.snap"]
+    # A fresh process reads the new revision from the file
+    app.extensions[EXTENSION_KEY].clear()
+    assert _fields(_snapshot(app, plan)) == _fields(second)
+
+
+def test_deleting_plan_removes_its_files(app, plan, action, files):
+    status, body = action(action="duplicate_plan", plan_id=plan)
+    copy_id = body["plan_id"]
+    _snapshot(app, plan)
+    _snapshot(app, copy_id)
+    assert len(_snap_files(files)) == 2
+
+    action(action="delete_plan", plan_id=plan)
+    assert [name.split("-")[0] for name in _snap_files(files)] == [
+        str(copy_id)
+    ]
+
+
+def test_snapshot_columns_follow_layout(app, plan):
+    snapshot = _snapshot(app, plan)
+    strings = snapshot.strings
+
+    # Day 2 has no meals: it only counts in days_count
+    assert snapshot.days_count == 2
+    # Meals without products are left out
+    assert [strings[i] for i in snapshot.meal_type] == ["Завтрак", "Ужин"]
+    assert list(snapshot.meal_day) == [0, 0]
+    assert [strings[i] for i in snapshot.product_name] == [
+        "Гречка", "Чай", "Гречка"
+    ]
+    assert [strings[i] for i in snapshot.product_key] == [
+        "гречка", "чай", "гречка"
+    ]
+    assert list(snapshot.product_meal) == [0, 0, 1]
+    assert list(snapshot.product_weight) == [70, 2, 70]
+    # Equal strings are interned once
+    assert len(strings) == len(set(strings))
@@ -0,0 +1,42 @@
+"""Cold start of the gunicorn entry point and the warm-up."""
+import gc
+import os
+import subprocess
+import sys
+
+from raskladka import lifecycle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_wsgi_does_not_import_export_modules():
+    # Only the forbidden modules are checked here, not the time budget
+    proc = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "import_time.py"),
+            "--repeat", "1",
+            "--budget-ms", "1e9",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert "import raskladka.wsgi" in proc.stdout
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+
+
+def test_ready_after_warm_up(app, monkeypatch):
+    state = lifecycle.LifecycleState()
+    monkeypatch.setitem(app.extensions, lifecycle.EXTENSION_KEY, state)
+    client = app.test_client()
+    assert client.get("/ready").status_code == 503
+
+    try:
+        lifecycle.warm_up(app)
+    finally:
+        gc.unfreeze()
+    assert state.templates == len(app.jinja_loader.list_templates())
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ready"
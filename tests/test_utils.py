@@ -0,0 +1,67 @@
+"""String normalizers and their memoization."""
+import random
+
+import pytest
+from markupsafe import Markup
+
+from raskladka.utils import (
+    canonical_product_key,
+    normalize_product_name,
+    normalize_product_name_display,
+    string_cache_stats,
+)
+
+
+def _old_display(name):
+    """The multi-pass normalizer replaced by normalize_product_name."""
+    if not isinstance(name, str):
+        return name
+    compact = " ".join(name.strip().split())
+    if not compact:
+        return ""
+    lowered = compact.lower()
+    return lowered[0].upper() + lowered[1:]
+
+
+def _old_key(name):
+    if not isinstance(name, str):
+        return str(name)
+    return " ".join(name.strip().split()).casefold()
+
+
+def _names(count=2000):
+    alphabet = "aBcßẞΣσςİıЁёЙй 1-.,\t\n  ǅǈ"
+    rng = random.Random(34)
+    names = ["", " ", "  пШено  крупа ", "Straße", "ΌΣΟΣ", "İstanbul"]
+    names += [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+        for _ in range(count)
+    ]
+    return names
+
+
+def test_single_pass_matches_old_normalizer():
+    for name in _names():
+        old = (_old_display(name), _old_key(name))
+        assert normalize_product_name(name) == old, name
+        assert normalize_product_name_display(name) == old[0], name
+        assert canonical_product_key(name) == old[1], name
+
+
+@pytest.mark.parametrize("value", [None, 5, Markup("  <b>Чай</b> ")])
+def test_non_plain_strings_match_old_normalizer(value):
+    assert normalize_product_name_display(value) == _old_display(value)
+    assert canonical_product_key(value) == _old_key(value)
+
+
+def test_repeated_names_hit_the_cache():
+    for _ in range(3):
+        normalize_product_name_display("  Гречка ")
+        canonical_product_key("гречка")
+    stats = string_cache_stats()["normalize_product_name"]
+    assert stats["misses"] == 2
+    assert stats["hits"] == 4
+
+    # Markup and other str subclasses bypass the cache
+    normalize_product_name_display(Markup("Гречка"))
+    assert string_cache_stats()["normalize_product_name"] == stats
@@ -0,0 +1,124 @@
+"""Optimistic version checks of plan, meal and product edits."""
+import pytest
+
+from raskladka import db
+from raskladka.models import Meal, Product
+
+
+@pytest.fixture
+def product(app, plan_id, action):
+    with app.app_context():
+        meal_id = (
+            Meal.query.join(Meal.day)
+            .filter_by(meal_plan_id=plan_id)
+            .first()
+            .id
+        )
+    status, body = action(
+        action="add_product", meal_id=meal_id, name="Гречка", weight=100
+    )
+    assert body["status"] == "success"
+    with app.app_context():
+        product = Product.query.filter_by(meal_id=meal_id).one()
+        return product.id, product.version
+
+
+def _weight(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).weight
+
+
+def test_update_returns_new_version(app, action, product):
+    product_id, version = product
+    status, body = action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=120,
+        version=version,
+    )
+    assert status == 200
+    assert body == {"status": "success", "version": version + 1}
+    assert _weight(app, product_id) == 120
+
+
+@pytest.mark.parametrize("weight", [0, 999999])
+def test_rejected_update_is_an_error(app, action, product, weight):
+    product_id, version = product
+    status, body = action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=weight,
+        version=version,
+    )
+    assert status == 400
+    assert body["status"] == "error"
+    assert "version" not in body
+    assert _weight(app, product_id) == 100
+
+
+def test_stale_version_conflicts(app, action, product):
+    product_id, version = product
+    action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=120,
+        version=version,
+    )
+    status, body = action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=150,
+        version=version,
+    )
+    assert status == 409
+    assert body["conflict"] is True
+    assert body["current"] == {
+        "id": product_id,
+        "name": "Гречка",
+        "weight": 120,
+        "version": version + 1,
+    }
+    assert _weight(app, product_id) == 120
+
+    status, body = action(
+        action="delete_product", product_id=product_id, version=version
+    )
+    assert status == 409
+    assert _weight(app, product_id) == 120
+
+
+def test_update_without_version_wins(app, action, product):
+    product_id, version = product
+    action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=120,
+        version=version,
+    )
+    status, body = action(
+        action="update_product",
+        product_id=product_id,
+        name="Гречка",
+        weight=150,
+    )
+    assert status == 200
+    assert _weight(app, product_id) == 150
+
+
+def test_plan_name_conflict(action, plan_id):
+    status, body = action(
+        action="update_plan_name", plan_id=plan_id, new_name="А", version=1
+    )
+    assert body == {"status": "success", "version": 2}
+    # A new day changes the plan revision, not its version
+    action(action="add_day", plan_id=plan_id, day_number=2)
+    status, body = action(
+        action="update_plan_name", plan_id=plan_id, new_name="Б", version=1
+    )
+    assert status == 409
+    assert body["current"]["name"] == "А"